@@ -0,0 +1,220 @@
+# actionlog.py
+# Records the player's actions so a game can be replayed headless.
+#
+# The log holds the random seed and level of the game, every action
+# applied to the model with the turn it was applied in, and the cash and
+# city supplies after each turn. Items are stored by their catalog
+# reference and the state that differs from a new item. The log is written
+# as gzipped JSON lines:
+#
+#     {"version": 1, "seed": ..., "level": "levels/level1.lvl", "cash": ...}
+#     ["a", turn, action]
+#     ["t", turn, cash, supplies]
+#
+# Replaying re-runs the actions at full speed and checks the cash and
+# supplies of every turn against the recording, so a faster engine can be
+# checked against one known to be right:
+#
+#     python actionlog.py game.log
+
+import argparse
+import gzip
+import json
+import sys
+import time
+
+from capital import Structure
+from database import CapitalDatabase
+from simulation import Simulation
+from level import load_level
+
+VERSION = 1
+
+# Actions whose arguments hold items, and the argument index of the items
+ITEM_ARGS = {'nodeitems': 1,'linkitems': 1}
+
+# A JSON form of an item: [kind,id,state] or [kind,id,state,inventory]
+def encode_item(database,item):
+    (kind,id) = database.ItemRef(item)
+    new = database.Template(kind,id)
+    state = {}
+    for (key,value) in vars(item).items():
+        if key != 'Inventory' and getattr(new,key,None) != value:
+            state[key] = value
+    data = [kind,id,state]
+    if isinstance(item,Structure) and item.GetInventory():
+        data.append([encode_item(database,sub) for sub in item.GetInventory()])
+    return data
+
+def decode_item(database,data):
+    # Copying the catalog's item is quicker than making one from its fields
+    template = database.Template(data[0],data[1])
+    item = object.__new__(type(template))
+    item.__dict__.update(template.__dict__)
+    for (key,value) in data[2].items():
+        # JSON turns tuples into lists
+        if isinstance(getattr(item,key,None),tuple):
+            value = tuple(value)
+        setattr(item,key,value)
+    if isinstance(item,Structure):
+        item.Inventory = []
+    if len(data) > 3:
+        item.Inventory = [decode_item(database,sub) for sub in data[3]]
+    return item
+
+# JSON forms of the model actions of Simulation.ApplyAction
+def encode_action(database,action):
+    if action[0] == 'inv':
+        return ['inv',[encode_item(database,item) for item in action[1]]]
+    if action[0] in ITEM_ARGS:
+        args = list(action[1])
+        i = ITEM_ARGS[action[0]]
+        args[i] = [encode_item(database,item) for item in args[i]]
+        return [action[0],args]
+    return action
+
+def decode_action(database,data):
+    (name,args) = data
+    if name == 'inv':
+        return ['inv',[decode_item(database,item) for item in args]]
+    if name in ITEM_ARGS:
+        i = ITEM_ARGS[name]
+        args[i] = [decode_item(database,item) for item in args[i]]
+    # Coordinates and links are tuples
+    if name == 'addnode':
+        args[0] = tuple(args[0])
+    elif name == 'dellink' or name == 'linkitems':
+        args[0] = tuple(args[0])
+    return [name,args]
+
+class ActionLog():
+    """
+    Tests:
+    >>> import os, tempfile
+    >>> from economic import Economic
+    >>> from city import City
+    >>> data = CapitalDatabase()
+    >>> def level():
+    ...     return Economic([City('A',0,0), City('B',200,0)])
+    >>> sim = Simulation(level(),cash=100000,seed=7)
+    >>> sim.recorder = ActionLog(data,sim.seed,None,sim.cash)
+    >>> a = sim.ApplyAction(['addnode',[(0,0),'A']])
+    >>> b = sim.ApplyAction(['addnode',[(200,0),'B']])
+    >>> sim.ApplyAction(['inv',[data.GetTower(0),data.GetTower(0),data.GetRadio(0)]])
+    >>> for turn in range(5):
+    ...     (maintenance,revenue) = sim.Step()
+
+    Changes made directly, as the dialogs make them, are only recorded:
+    >>> network = sim.gameNetwork
+    >>> network.V_items[a].append(sim.inventory.pop(0))
+    >>> sim.RecordAction(['nodeitems',[a,network.V_items[a]]])
+    >>> sim.ApplyAction(['nodeitems',[b,[sim.inventory.pop(0)]]])
+    >>> sim.ApplyAction(['addlink',[a,b]])
+    >>> network.AddItemToEdge((a,b),sim.inventory.pop())
+    True
+    >>> sim.RecordAction(['linkitems',[(a,b),network.E_items[(a,b)]]])
+    >>> sim.RecordAction(['nodeitems',[a,network.V_items[a]]])
+    >>> sim.RecordAction(['nodeitems',[b,network.V_items[b]]])
+    >>> sim.ApplyAction(['inv',sim.inventory])
+    >>> for turn in range(200):
+    ...     (maintenance,revenue) = sim.Step()
+    >>> (fd,filename) = tempfile.mkstemp()
+    >>> os.close(fd)
+    >>> sim.recorder.Save(filename)
+
+    >>> (replayed,differences) = replay(ActionLog.Load(filename,data),level)
+    >>> replayed.turn, differences
+    (206, [])
+    >>> replayed.cash == sim.cash
+    True
+    >>> replayed.economy.GetCities()[0].GetSupply() == sim.economy.GetCities()[0].GetSupply()
+    True
+    >>> os.remove(filename)
+    """
+
+    # seed, level and cash are those the game started with, model its
+    # economic model
+    def __init__(self,database,seed,level,cash,model='placeholder'):
+        self.database = database
+        self.header = {'version': VERSION,'seed': seed,'level': level,'cash': cash,'model': model}
+        self.events = []
+
+    # Record an action applied during turn
+    def Action(self,turn,action):
+        self.events.append(['a',turn,encode_action(self.database,action)])
+
+    # Record the state at the end of turn. supplies is a list of the
+    # (insupply,outsupply) of each city.
+    def Turn(self,turn,cash,supplies):
+        self.events.append(['t',turn,cash,[list(s) for s in supplies]])
+
+    def Save(self,filename):
+        with gzip.open(filename,'wt') as outFile:
+            outFile.write(json.dumps(self.header) + '\n')
+            for event in self.events:
+                outFile.write(json.dumps(event,separators=(',',':')) + '\n')
+
+    @staticmethod
+    def Load(filename,database=None):
+        if database == None:
+            database = CapitalDatabase()
+        with gzip.open(filename,'rt') as inFile:
+            header = json.loads(inFile.readline())
+            if header['version'] != VERSION:
+                raise ValueError('unsupported action log version ' + str(header['version']))
+            actionlog = ActionLog(database,header['seed'],header['level'],header['cash'],
+                                  header.get('model','placeholder'))
+            for line in inFile:
+                actionlog.events.append(json.loads(line))
+        return actionlog
+
+# Re-run a recorded game headless. setup returns the level's economy; by
+# default the level file named in the log is loaded.
+# Returns the simulation and a list of (turn,recorded,replayed) for every
+# turn whose (cash,supplies) differ from the recording.
+def replay(actionlog,setup=None):
+    header = actionlog.header
+    if setup == None:
+        level = load_level(header['level'],actionlog.database)
+        sim = Simulation(level.economy,header['cash'],level.network,seed=header['seed'])
+    else:
+        sim = Simulation(setup(),header['cash'],seed=header['seed'])
+    sim.economy.SetModel(header['model'])
+
+    differences = []
+    for event in actionlog.events:
+        if event[0] == 'a':
+            while sim.turn < event[1]:
+                sim.Step()
+            sim.ApplyAction(decode_action(actionlog.database,event[2]))
+        elif event[0] == 't':
+            while sim.turn <= event[1]:
+                sim.Step()
+            recorded = (event[2],[tuple(s) for s in event[3]])
+            replayed = (sim.cash,[city.GetSupply() for city in sim.economy.GetCities()])
+            if recorded != replayed:
+                differences.append((event[1],recorded,replayed))
+    return (sim,differences)
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded game and check it plays out the same.')
+    parser.add_argument('log',help='action log recorded with main.py --record')
+    args = parser.parse_args()
+
+    actionlog = ActionLog.Load(args.log)
+    start = time.perf_counter()
+    (sim,differences) = replay(actionlog)
+    elapsed = time.perf_counter() - start
+
+    print('%d turns replayed in %0.2f s' % (sim.turn - 1,elapsed))
+    if differences:
+        (turn,recorded,replayed) = differences[0]
+        print('%d turns differ, the first is turn %d' % (len(differences),turn))
+        print('  recorded cash %r supplies %r' % recorded)
+        print('  replayed cash %r supplies %r' % replayed)
+        sys.exit(1)
+    print('cash and supplies identical')
+
+# Run the doctests with: python -m doctest actionlog.py
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ that is in charge of all the windows and event handling.
 
 To setup the simulation framework do, once only:
 
-    agentsim.init(init_fn=None, step_fn=None, title="Simulation")
+    agentsim.init(init_fn=None, step_fn=None, render_fn=None, title="Simulation")
 
     init_fn() - is a function that is called on simulation start that
         sets up the initial conditions for the simulation.  
@@ -14,6 +14,9 @@ To setup the simulation framework do, once only:
     step_fn() - is a function that is called on each time step of the
         simulation.  
 
+    render_fn() - is a function that is called to draw the simulation
+        after the time steps of a frame.
+
     title is the text displayed on the top of the window
 
 The simulation does not begin until you invoke, once only,
@@ -23,7 +26,9 @@ The simulation does not begin until you invoke, once only,
 The simulation environment consists of a resizable graphics area on which
 visualizations of the agents are drawn and manipulated, and some controls
 to start, pause, run, or single-step the simulation, along with a rate 
-slider that controls the spped of the simulation.
+slider that sets the time steps run per second. Time steps are run in
+frames, as many as are due and fit in the frame, followed by one call of
+render_fn; see scheduler.py.
 
 NOTE: typing a q key will cause the simulation to quit without confirmation!
 
@@ -58,6 +63,8 @@ See the documentation for bitflag.  The framework debug flags are
     4 - Shape or subclass related
     8 - reserved
    16 - (and above) user defined
+The game's categories are listed in debugflags, and select what the tracer
+in tracing records.
 
 BUG ALERT: It is not clear what happens when you resize the canvas during
 a simulation.  The positions will eventually get clipped by a move_by, but
@@ -81,16 +88,31 @@ import game
 # the module.
 
 gui = None
-debug = BitFlag()
+# The debug flag is shared with the engine modules, see debugflags
+from debugflags import debug,AGENTSIM
+from debuglog import log
+from tiles import TileSet,TiledBackground,ImageBackground
+from listview import VirtualList
+from events import bus,INVENTORY_CHANGED
+from scheduler import FrameScheduler
 global counter
 counter = 0
 
+# Map scale at each setting of the zoom slider. Level backgrounds have an
+# image or tile set level for each.
+ZOOM_SCALES = (0.2,0.5,0.8,1.0)
+
+# Tag of canvas items drawn in map units, which are scaled with the map when
+# the zoom changes. Other items, e.g. the background and the network layer,
+# are put in place by whatever drew them.
+SCALED = 'scaled'
+
 class GUI():
     """
 
     Constructor:
 
-    GUI(init_fn=None, step_fn=None, title="Simulation"):
+    GUI(init_fn=None, step_fn=None, render_fn=None, title="Simulation"):
 
     The GUI constructor  will raise an exception if you try to create 
     more than one instance.
@@ -101,6 +123,9 @@ class GUI():
     step_fn() - is a function that is called on each time step of the
         simulation.  
 
+    render_fn() - is a function that is called to draw the simulation
+        after the time steps of a frame.
+
     title is the text displayed on the top of the window
 
     The simulation does not begin until you invoke agentsim.gui.start()
@@ -128,7 +153,7 @@ class GUI():
     # there can only be one instance of this class
     num_instances = 0
 
-    def __init__(self, inventory, database, bgf, init_fn=None, step_fn=None, title="Simulation",xmax=1000,ymax=1000):
+    def __init__(self, inventory, database, bgf, init_fn=None, step_fn=None, render_fn=None, title="Simulation",xmax=1000,ymax=1000,tiles=None):
         if GUI.num_instances != 0:
             raise Exception("GUI: can only have one instance of a simulation")
         GUI.num_instances = 1
@@ -147,6 +172,7 @@ class GUI():
         # simulation function hooks
         self._init_fn = init_fn
         self._step_fn = step_fn
+        self._render_fn = render_fn
 
         # simulation state
         self._running = 0
@@ -226,14 +252,21 @@ class GUI():
 
         self._b5.pack(anchor='w', fill='x')
 
+        # The game speed is in turns per second. The scheduler runs the
+        # turns due each frame and says how many a second it managed.
         def on_speed_change(v):
             self._speed = int(v)
+            self.scheduler.SetRate(self._speed)
 
-        self._speed = 1
+        self._speed = 3
+        self.scheduler = FrameScheduler(self._speed)
         self._speedscale = Scale(self._frame,
-                                 from_=1, to=100, label='Game Speed', orient=HORIZONTAL,
+                                 from_=1, to=100, label='Turns per Second', orient=HORIZONTAL,
                                  length=100,command=on_speed_change)
+        self._speedscale.set(self._speed)
         self._speedscale.pack(side='top', fill='x')
+        self._rate_label = Label(self._frame,text='',anchor='w')
+        self._rate_label.pack(side='top', fill='x')
         
         self.scale = 1.0
         self._scaler = Scale(self._frame,
@@ -246,9 +279,25 @@ class GUI():
                          
         self.inv_lbl.pack(anchor='w',fill='both')
 
-        # This listbox contains a display of the inventory
-        self.list = Listbox(self._frame,selectmode=EXTENDED,height=30)
-        self.list.pack(anchor='w', fill='x')
+        # This listbox contains a display of the inventory. It only holds
+        # the rows in view, and is updated when the inventory changes.
+        self._listframe = Frame(self._frame)
+        self._listframe.pack(anchor='w', fill='x')
+        self.list = Listbox(self._listframe,selectmode=EXTENDED,height=20)
+        self.list.pack(side='left', fill='x')
+        self._listscroll = Scrollbar(self._listframe,orient=VERTICAL)
+        self._listscroll.pack(side='right', fill='y')
+        self.inv_view = VirtualList(self.list,self._listscroll)
+        self._listscroll.configure(command=self.inv_view.Scroll)
+        self.list.bind('<MouseWheel>', lambda event: self.inv_view.Scroll('scroll',-event.delta // 120,'units'))
+        self.list.bind('<ButtonPress-4>', lambda event: self.inv_view.Scroll('scroll',-1,'units'))
+        self.list.bind('<ButtonPress-5>', lambda event: self.inv_view.Scroll('scroll',1,'units'))
+        self.inv_view.Set([item.GetName() for item in self.inventory])
+        bus.Subscribe(INVENTORY_CHANGED,self.inventory_changed)
+
+        # The game puts its messages for the player here
+        self._noticeframe = Frame(self._frame)
+        self._noticeframe.pack(anchor='w', fill='x')
 
         
 
@@ -282,11 +331,11 @@ class GUI():
 
         self._canvas.grid(column=0, row=0, sticky='nwes')
 
-        self._hscroll.configure( command=self._canvas.xview )
-        self._vscroll.configure( command=self._canvas.yview )
+        self._hscroll.configure( command=self._xview )
+        self._vscroll.configure( command=self._yview )
 
         def _do_resize(ev):
-            pass
+            self.ViewChanged()
 
         self._canvas.bind( "<Configure>", _do_resize)
         
@@ -303,16 +352,16 @@ class GUI():
         self._canvas.bind('<ButtonPress-4>', lambda event: self.rollWheel(event))
         self._canvas.bind('<ButtonPress-5>', lambda event: self.rollWheel(event))
         
-        # Load background image
-        self.bgimgs = {}
-        self.bgimgs['bg0'] = PhotoImage(file = bgf[0])
-        self.bgimgs['bg1'] = PhotoImage(file = bgf[1])
-        self.bgimgs['bg2'] = PhotoImage(file = bgf[2])
-        self.bgimgs['bg3'] = PhotoImage(file = bgf[3])
-        
-        self.bgimg = self._canvas.create_image(0,0,
-                        image=self.bgimgs['bg3'],
-                        anchor='nw')
+        # Background image. With a tile set only the tiles in view are
+        # loaded; otherwise the image of the current zoom level.
+        if tiles:
+            self.background = TiledBackground(self._canvas,TileSet(tiles))
+        else:
+            self.background = ImageBackground(self._canvas,bgf)
+        self.background.SetLevel(len(ZOOM_SCALES) - 1)
+
+        # Functions called when the visible part of the canvas changes
+        self.view_listeners = [self.background.Update]
 
     # public method to start the simulation
     def start(self):
@@ -337,6 +386,8 @@ class GUI():
         self._running = 0
         if self._step_fn != None:
             self._step_fn()
+            if self._render_fn != None:
+                self._render_fn()
 
     def _do_pause(self):
         self._running = 0
@@ -347,34 +398,46 @@ class GUI():
     def _do_run(self):
         if not self._running:
             self._running = 1
+            self.scheduler.Restart()
             self._run()
             
     def on_zoom_change(self,v):
         lastscale = self.scale
-        if int(v) == 0:
-            self.scale = 0.2
-        elif int(v) == 1:
-            self.scale = 0.5
-        elif int(v) == 2:
-            self.scale = 0.8
-        elif int(v) == 3:
-            self.scale = 1.0
+        self.scale = ZOOM_SCALES[int(v)]
            
-        self._canvas.scale(ALL,0,0,self.scale/lastscale,self.scale/lastscale)
-        
-        if self.bgimg:
-            self._canvas.delete(self.bgimg)
-        self.bgimg = self._canvas.create_image(0,0,
-                image=self.bgimgs['bg' + v],
-                anchor='nw')               
-        self._canvas.lower(self.bgimg)
-        self._canvas.lower(self.bgimg)
+        self._canvas.scale(SCALED,0,0,self.scale/lastscale,self.scale/lastscale)
         
         self._canvas.configure(width=int(self._canvas_x_max * self.scale))
         self._canvas.configure(height=int(self._canvas_y_max * self.scale))
+
+        # The background is not scaled; it has images for each zoom level
+        self.background.SetLevel(int(v))
+        self.ViewChanged()
             
         game.action_q.append(['rescale',[self.scale,v]])
 
+    # Call fn whenever the visible part of the canvas changes
+    def AddViewListener(self,fn):
+        self.view_listeners.append(fn)
+
+    def ViewChanged(self):
+        for fn in self.view_listeners:
+            fn()
+
+    # Scrollbar commands
+    def _xview(self,*args):
+        self._canvas.xview(*args)
+        self.ViewChanged()
+
+    def _yview(self,*args):
+        self._canvas.yview(*args)
+        self.ViewChanged()
+
+    # The game's inventory was replaced
+    def inventory_changed(self,inventory):
+        self.inventory = inventory
+        self.inv_view.Set([item.GetName() for item in inventory])
+
     def _goto_store(self):
         try:
             del self.store
@@ -387,14 +450,16 @@ class GUI():
     def _run(self):
         if self._running:
             if self._step_fn != None:
-                self._step_fn()
+                # Run the turns due, then draw them once
+                if self.scheduler.Frame(self._step_fn) and self._render_fn != None:
+                    self._render_fn()
 
-                self.list.delete(0,END)
-                for item in self.inventory:
-                    self.list.insert(END,item.GetName())
+                rate = '%0.1f turns/s' % self.scheduler.TurnsPerSecond()
+                if self._rate_label.cget('text') != rate:
+                    self._rate_label.configure(text=rate)
 
-                # queue a new event to be executed after some time
-                id = self._root.after(400 - int(3.5 * self._speed), self._run)
+                # queue the next frame
+                id = self._root.after(self.scheduler.Delay(), self._run)
 
     def _cancel_next_simulation(self):
         """ 
@@ -422,6 +487,9 @@ class GUI():
     def get_cashlabel(self):
         return self._cash_label
 
+    def get_noticeframe(self):
+        return self._noticeframe
+
     def clip_x(self, x):
         return max(self._canvas_x_min, min(self._canvas_x_max, x))
 
@@ -439,8 +507,7 @@ class GUI():
         """
         # don't let x get smaller than 400 or y smaller than 250
 
-        if debug.get(1):
-            print('canvas resize', new_x_size, new_y_size)
+        log.Log(AGENTSIM,'canvas resize %s %s',new_x_size,new_y_size)
 
         # x only needs to be adjusted to increase
         self._canvas_x_max = max(400, new_x_size)
@@ -471,6 +538,7 @@ class GUI():
             direction = -event.delta
 
         self._canvas.yview_scroll(direction, UNITS)
+        self.ViewChanged()
         
     def pan(self,event):
         global lastx, lasty, counter
@@ -488,6 +556,7 @@ class GUI():
         if not counter % 5:
             self._canvas.xview_scroll(int(dx), UNITS)
             self._canvas.yview_scroll(int(dy), UNITS)
+            self.ViewChanged()
         
 def xy(event):
     global lastx, lasty
@@ -0,0 +1,278 @@
+# benchmark.py
+# Times the game engine on synthetic levels of increasing size.
+#
+# Levels are generated with nodes, links and cities populated from the real
+# gameconfig catalog. Each benchmark is timed at every size until a single
+# run takes longer than the time limit; larger sizes are then skipped for
+# that benchmark. Results can be written as JSON to compare across versions.
+#
+# Usage: python benchmark.py [--sizes 10 100 1000 10000] [--output FILE] [--processes N]
+
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import dyjkstra
+from city import City
+from database import CapitalDatabase
+from economic import Economic,MODELS
+from networkgraph import NetworkGraph
+from simulation import Simulation
+from routing import ParallelRouter
+from tracing import tracer
+from debugflags import debug,TURN,CAPACITY,ITEMS
+
+# Average distance between neighbouring nodes, in map units
+NODE_SPACING = 200
+
+# Build a network of n_nodes nodes with about links_per_node links each.
+# Every node has a tower and a building with a router; every link has a
+# radio or wired item. Links join nodes close to each other, and the first
+# link of each node joins it to an earlier node, so the network is connected.
+def synthetic_network(database,n_nodes,links_per_node=1.5,rng=None):
+    """
+    Tests:
+    >>> network = synthetic_network(CapitalDatabase(),50,rng=random.Random(1))
+    >>> len(network.GetNodes())
+    50
+    >>> network.graph.num_edges() == 2 * round(50 * 1.5)
+    True
+    """
+    if rng == None:
+        rng = random.Random()
+
+    network = NetworkGraph()
+    size = math.sqrt(n_nodes) * NODE_SPACING
+
+    # Sorting by x keeps consecutive nodes close together
+    coords = sorted((rng.uniform(0,size),rng.uniform(0,size)) for i in range(n_nodes))
+    ids = []
+    for (i,coord) in enumerate(coords):
+        building = database.GetBuilding(rng.randrange(len(database.Buildings)))
+        building.AddItem(database.GetRouter(rng.randrange(len(database.Routers))))
+        tower = database.GetTower(rng.randrange(len(database.Towers)))
+        ids.append(network.NewNode(coord,'Node ' + str(i),[tower,building]))
+
+    # i and j are indices into ids
+    def add_link(i,j):
+        (a,b) = (ids[i],ids[j])
+        network.AddEdgeID(a,b,[])
+        network.AddEdgeID(b,a,[])
+        for e in ((a,b),(b,a)):
+            if rng.random() < 0.5:
+                item = database.GetRadio(rng.randrange(len(database.Radios)))
+            else:
+                item = database.GetWired(rng.randrange(len(database.Wired)))
+            network.AddItemToEdge(e,item)
+
+    links = set()
+    for i in range(1,n_nodes):
+        j = rng.randrange(max(0,i - 5),i)
+        links.add((j,i))
+        add_link(j,i)
+
+    n_links = min(round(n_nodes * links_per_node),n_nodes * (n_nodes - 1) // 2)
+    while len(links) < n_links:
+        i = rng.randrange(n_nodes)
+        j = rng.randrange(n_nodes)
+        if abs(i - j) > 10:
+            j = i + rng.randint(1,10)
+        (i,j) = (min(i,j),max(i,j))
+        if i == j or j >= n_nodes or (i,j) in links:
+            continue
+        links.add((i,j))
+        add_link(i,j)
+
+    return network
+
+# Place n_cities cities near random nodes of the network
+def synthetic_cities(network,n_cities,rng=None):
+    if rng == None:
+        rng = random.Random()
+
+    cities = []
+    nodes = sorted(network.GetNodes())
+    for i in range(n_cities):
+        (x,y) = network.V_coord[rng.choice(nodes)]
+        population = int(10 ** rng.uniform(3,6))
+        cities.append(City('City ' + str(i),x + rng.uniform(-20,20),y + rng.uniform(-20,20),population))
+    return cities
+
+# A headless game on a synthetic level
+def synthetic_level(database,n_nodes,n_cities=None,links_per_node=1.5,seed=0):
+    """
+    Tests:
+    >>> sim = synthetic_level(CapitalDatabase(),20,n_cities=3)
+    >>> len(sim.economy.GetCities())
+    3
+    >>> (maintenance,revenue) = sim.Step()
+    >>> sim.turn
+    2
+    """
+    if n_cities == None:
+        n_cities = min(max(n_nodes // 10,2),50)
+
+    rng = random.Random(seed)
+    network = synthetic_network(database,n_nodes,links_per_node,rng)
+    cities = synthetic_cities(network,n_cities,rng)
+    return Simulation(Economic(cities),network=network)
+
+# Run fn up to repeat times, stopping early once max_seconds have passed.
+# Returns the duration of each run.
+def measure(fn,repeat,max_seconds):
+    times = []
+    start = time.perf_counter()
+    while len(times) < repeat:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+        if time.perf_counter() - start > max_seconds:
+            break
+    return times
+
+# The benchmarks, each a function of a Simulation which returns the
+# function to time.
+def bench_least_cost_path(sim):
+    network = sim.gameNetwork
+    network.CapReset()
+    nodes = sorted(network.GetNodes())
+    rng = random.Random(0)
+    def fn():
+        dyjkstra.least_cost_path(network.graph,rng.choice(nodes),rng.choice(nodes),network.cost)
+    return fn
+
+def bench_CapReset(sim):
+    return sim.gameNetwork.CapReset
+
+def bench_CapAtCoord(sim):
+    network = sim.gameNetwork
+    city = sim.economy.GetCities()[0]
+    coords = sim.economy.GetCitiesCoord()
+    def fn():
+        network.CapReset()
+        network.CapAtCoord(city.GetCoord(),coords,city.range)
+    return fn
+
+def bench_ItemUpdate(sim):
+    items = []
+    for node_items in sim.gameNetwork.V_items.values():
+        for item in node_items:
+            items.append(item)
+            items.extend(item.GetInventory())
+    for edge_items in sim.gameNetwork.E_items.values():
+        items.extend(edge_items)
+    def fn():
+        for item in items:
+            item.Update()
+    return fn
+
+def bench_UpdateCapacity(sim):
+    return sim.UpdateCapacity
+
+def bench_turn(sim):
+    return sim.Step
+
+BENCHMARKS = (('least_cost_path',bench_least_cost_path),
+              ('CapReset',bench_CapReset),
+              ('CapAtCoord',bench_CapAtCoord),
+              ('Item.Update',bench_ItemUpdate),
+              ('UpdateCapacity',bench_UpdateCapacity),
+              ('turn',bench_turn))
+
+# Run every benchmark at every size. Returns a list of result dictionaries.
+# Each benchmark gets a fresh level, so it does not see the items aged or
+# failed and the capacities left by the benchmarks before it.
+# If router is given, a ParallelRouter, the simulations find their paths
+# with it. model is the economic model the simulations use.
+def run(sizes,repeat=5,max_seconds=10,names=None,out=sys.stdout,router=None,model='placeholder'):
+    database = CapitalDatabase()
+    results = []
+    too_slow = set()
+
+    for n in sizes:
+        for (name,setup) in BENCHMARKS:
+            if names and name not in names:
+                continue
+            if name in too_slow:
+                out.write('%-16s %6d nodes  skipped\n' % (name,n))
+                continue
+
+            sim = synthetic_level(database,n)
+            sim.router = router
+            sim.economy.SetModel(model)
+            n_links = sim.gameNetwork.graph.num_edges()
+            n_cities = len(sim.economy.GetCities())
+
+            times = measure(setup(sim),repeat,max_seconds)
+            if min(times) > max_seconds:
+                too_slow.add(name)
+
+            result = {'benchmark': name,
+                      'nodes': n,
+                      'links': n_links,
+                      'cities': n_cities,
+                      'runs': len(times),
+                      'mean': sum(times) / len(times),
+                      'min': min(times),
+                      'max': max(times)}
+            results.append(result)
+            out.write('%-16s %6d nodes  %10.3f ms mean  %10.3f ms min  (%d runs)\n'
+                      % (name,n,result['mean'] * 1000,result['min'] * 1000,result['runs']))
+            out.flush()
+
+    return results
+
+# The git commit being benchmarked, if there is one
+def version():
+    try:
+        return subprocess.check_output(['git','describe','--always','--dirty'],
+                                       stderr=subprocess.DEVNULL,text=True).strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the game engine on synthetic levels.')
+    parser.add_argument('--sizes',type=int,nargs='+',default=[10,100,1000,10000],
+                        help='numbers of nodes to benchmark')
+    parser.add_argument('--repeat',type=int,default=5,help='runs per benchmark and size')
+    parser.add_argument('--max-seconds',type=float,default=10,
+                        help='time limit per benchmark and size; slower benchmarks skip larger sizes')
+    parser.add_argument('--only',nargs='+',help='benchmarks to run: ' + ', '.join(name for (name,fn) in BENCHMARKS))
+    parser.add_argument('--output',help='write the results to this JSON file')
+    parser.add_argument('--trace',help='write a Chrome trace of the runs to this file')
+    parser.add_argument('--processes',type=int,help='find the paths of turns in a pool of this many processes')
+    parser.add_argument('--model',choices=MODELS,default='placeholder',help='economic model used to calculate revenue')
+    args = parser.parse_args()
+
+    if args.trace:
+        debug.set(TURN | CAPACITY | ITEMS)
+
+    router = None
+    if args.processes:
+        router = ParallelRouter(args.processes)
+    results = run(args.sizes,args.repeat,args.max_seconds,args.only,router=router,model=args.model)
+    if router:
+        router.Close()
+
+    if args.output:
+        report = {'version': version(),
+                  'python': platform.python_version(),
+                  'platform': platform.platform(),
+                  'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'processes': args.processes,
+                  'model': args.model,
+                  'results': results}
+        with open(args.output,'w') as outFile:
+            json.dump(report,outFile,indent=2)
+
+    if args.trace:
+        tracer.Save(args.trace)
+
+# Run the doctests with: python -m doctest benchmark.py
+if __name__ == "__main__":
+    main()
@@ -35,8 +35,7 @@ class BitFlag():
     >>> f.get(6)
     4
     >>> # clear bit 2
-    >>> f.set(0, 4)
-    >>> # previous value is 5
+    >>> f.set(0, 4)     # previous value is 5
     5
     >>> f.get()
     1
@@ -57,15 +56,12 @@ class BitFlag():
     def set(self, new_flag, mask=None):
         orig_flag = self._flag
         if mask != None:
-            print("mask is", mask)
             # clear bits in flag corresponding to 1's i mask
             self._flag = self._flag & ( ~ mask )
-            print("flag is", self._flag)
             # keep only the bit positions corresponding to 1s in mask
             new_flag = new_flag & mask
             # set any 1s in the new_flag value
             self._flag = self._flag | new_flag
-            print("flag is", self._flag)
         else:
             self._flag = new_flag
 
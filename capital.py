@@ -78,8 +78,9 @@ class Item(object):
         return (self.suggested_maint_budget)
 
     # Updates the item for every turn, and calculates potential failure
-    # Returns True if the item failed.
-    def Update(self):
+    # Returns True if the item failed. rng is the random number generator
+    # to draw the failure chance from.
+    def Update(self,rng=random):
 
         self.age = self.age + 1
         
@@ -90,8 +91,7 @@ class Item(object):
 
         # Calculate failure chance. Tested the algorithm with a TEST program.
         # This failure chance is only for a failure by natural causes. 
-        random.seed()
-        chance = random.random() / (self.reliability_constant * 20) + (self.age / (self.lifespan + 0.1 * self.reliability_constant * self.lifespan) / (self.maintenance_budget / self.suggested_maint_budget) * random.random())
+        chance = rng.random() / (self.reliability_constant * 20) + (self.age / (self.lifespan + 0.1 * self.reliability_constant * self.lifespan) / (self.maintenance_budget / self.suggested_maint_budget) * rng.random())
         if chance >= 1:
             self.SetFail()
             return True
@@ -5,6 +5,8 @@ import math
 
 from curves import *
 import curves
+from debuglog import log
+from debugflags import ECONOMY
 
 class City():
 
@@ -63,7 +65,7 @@ class City():
 		"""
 		# Use the points from above
 		# Downlink
-		pt1 = (population * 0.5 / 4 * 6,5, 786666667 * math.pow(10,-6))
+		pt1 = (population * 0.5 / 4 * 6, 5.786666667 * math.pow(10,-6))
 		pt2 = (population * 0.4 / 4 * 40, 2.2222222 * math.pow(10,-6))
 
 		m = (pt2[1]-pt1[1]) / (pt2[0] - pt1[0])
@@ -80,8 +82,8 @@ class City():
 
 		self.odemand_curve = Linear(m,b)
 
-		# self.idemand_curve.print()
-		#  elf.odemand_curve.print()
+		log.Log(ECONOMY,'%s downlink demand: y = %0.12fx + %0.12f',name,self.idemand_curve.m,self.idemand_curve.b)
+		log.Log(ECONOMY,'%s uplink demand: y = %0.12fx + %0.12f',name,self.odemand_curve.m,self.odemand_curve.b)
 
     # Accessor functions
 	def GetName(self):
@@ -109,11 +111,12 @@ class City():
     
 
     # Update function. This function is called for every city every step.
-	def Update(self,turn,multiplier,vshift):
+	# rng is the random number generator used for growth.
+	def Update(self,turn,multiplier,vshift,rng=random):
 		# A more realistic way to determine growth is needed.
 		# Update population only once a week.
 		if turn % 168 == 0:
-			self.population = self.population + (120 - 100 * random.random()) * self.growth_factor
+			self.population = self.population + (120 - 100 * rng.random()) * self.growth_factor
 		"""
 		dm = (0.5 - random.random()) / 1000000 * multiplier
 		db = (0.5 - random.random()) / 1000000 + vshift
@@ -125,77 +128,19 @@ class City():
 		self.odemand_curve.m = self.odemand_curve.m + dm
 		self.odemand_curve.b =	self.odemand_curve.b + db
 		"""
-		# Calculate the price and quantity, given supply
-		# and the rate per Mbps. Return Revenue
-	def Revenue(self):
-		"""
-		revenue = 0
-		iprice = 0
-		iquantity = 0
-		
-		# Incoming
-		# Find intersections between the price and the quantity
-		int_p = lines_intersect(self.idemand_curve,
-						   Linear(0,self.down_rate))
-		
-		# For incoming quantitiy supplied:
-		int_iqs = line_intersect_vline(self.idemand_curve,
-							  self.insupply / 1000000)
-
-		# If the intersection for quantity is further left,
-		# there is a shortage. There is lost revenue
-		if int_iqs[0] <= int_p[0]:
-			iprice = int_p[1]
-			iquantity = int_iqs[0]
-			
-		# Otherwise, you are charging more, and thus receiving economic rent.
-		else:
-			iprice = int_p[1]
-			iquantity = int_p[0]
-
-		revenue = iquantity * iprice
-		
-
-		# Now deal with outgoing
-		oprice = 0
-		oquantity = 0
+	# Calculate the price and quantity, given supply
+	# and the rate per Mbps. Return Revenue.
+	# supply is an optional (insupply,outsupply) pair to use instead of the
+	# city's own. The demand curve model is Economic.MarketRevenue.
+	def Revenue(self,supply=None):
+		if supply == None:
+			supply = (self.insupply,self.outsupply)
+		(insupply,outsupply) = supply
 
-		int_p = lines_intersect(self.odemand_curve,
-						   Linear(0,self.up_rate))
-		
-		# For outgoing quantitiy supplied:
-		int_oqs = line_intersect_vline(self.odemand_curve,
-							  self.outsupply / 1000000)
-
-		# If the intersection for quantity is further left,
-		# there is a shortage
-		if int_oqs[0] <= int_p[0]:
-			oprice = int_p[1]
-			oquantity = int_oqs[0]
-			
-		# Otherwise, you are charging more, and thus receiving economic rent.
-		else:
-			oprice = int_p[1]
-			oquantity = int_p[0]
-		
-		# Debug
-			
-		print('Supplies:')
-		print(self.insupply)
-		print(self.outsupply)
-		print('Revenue for ' + self.GetName())
-		print(iquantity)
-		print('$ %0.2f' % iprice)
-		print(oquantity)
-		print('$ %0.2f' % oprice)
-		
-		"""
 		# Temp until demand curves are working
-		iquantity = (self.population / math.exp(self.down_rate) * self.insupply / 1000000)
-		oquantity = (self.population / math.exp(self.up_rate) * self.outsupply / 1000000)
+		iquantity = (self.population / math.exp(self.down_rate) * insupply / 1000000)
+		oquantity = (self.population / math.exp(self.up_rate) * outsupply / 1000000)
 		iprice = self.down_rate
 		oprice = self.up_rate
 		revenue = iquantity * iprice + oquantity * oprice
 		return revenue
-				     
-    
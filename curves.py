@@ -1,8 +1,22 @@
 # curves.py
 # Contains classes which represent mathematical equations of curves.
+# The curve classes accept either plain numbers or NumPy arrays for their
+# coefficients and arguments, so a whole set of curves (one per city, say)
+# can be evaluated in one call.
 import math
 
+import numpy as np
+
 from distfuncs import *
+from debuglog import log
+from debugflags import ECONOMY
+
+# True if any of the values is an array rather than a plain number
+def is_array(*values):
+    for value in values:
+        if np.ndim(value) > 0:
+            return True
+    return False
 
 # This class defines a "line equation" object, which represents
 # the equation: y = mx + b
@@ -14,8 +28,17 @@ class Linear():
         # Y intercept
         self.b = b
     
-    # Evaluate the function at a point
+    # Evaluate the function at a point. x may be an array.
     def evaluate(self,x):
+        """
+        Tests:
+        >>> Linear(2,1).evaluate(3)
+        7
+        >>> Linear(2,1).evaluate(np.array([0,1,2])).tolist()
+        [1, 3, 5]
+        """
+        if is_array(x):
+            x = np.asarray(x)
         return self.m * x + self.b
 
     # Returns the angle of the line in radians. Range from -pi to pi radians
@@ -44,6 +67,51 @@ def line_intersect_vline(line1,vline_x):
     # Just evaluate at a point
     return (vline_x,line1.evaluate(vline_x))
 
+# Pack a list of lines into a single line whose slope and intercept are arrays
+def stack_lines(lines):
+    if isinstance(lines,Linear):
+        return Linear(np.asarray(lines.m,dtype=float),np.asarray(lines.b,dtype=float))
+
+    m = np.fromiter((line.m for line in lines),dtype=float,count=len(lines))
+    b = np.fromiter((line.b for line in lines),dtype=float,count=len(lines))
+    return Linear(m,b)
+
+# Batched version of lines_intersect. Takes two lists of lines (or lines
+# holding arrays) and returns arrays of intersection coordinates.
+# Parallel lines give nan.
+def lines_intersect_batch(lines1,lines2):
+    """
+    Tests:
+    >>> (x,y) = lines_intersect_batch([Linear(1,0),Linear(-1,4)],[Linear(-1,2),Linear(1,0)])
+    >>> x.tolist(), y.tolist()
+    ([1.0, 2.0], [1.0, 2.0])
+    >>> (x,y) = lines_intersect_batch([Linear(1,0)],[Linear(1,5)])
+    >>> bool(np.isnan(x[0]))
+    True
+    """
+    line1 = stack_lines(lines1)
+    line2 = stack_lines(lines2)
+
+    with np.errstate(divide='ignore',invalid='ignore'):
+        x = (line2.b - line1.b) / (line1.m - line2.m)
+    x = np.where(np.isfinite(x),x,np.nan)
+    y = line1.m * x + line1.b
+
+    return (x,y)
+
+# Batched version of line_intersect_vline. One vertical line per curve,
+# or a single x shared by all of them.
+def line_intersect_vline_batch(lines,vline_x):
+    """
+    Tests:
+    >>> (x,y) = line_intersect_vline_batch([Linear(1,0),Linear(2,1)],[3,4])
+    >>> x.tolist(), y.tolist()
+    ([3.0, 4.0], [3.0, 9.0])
+    """
+    line = stack_lines(lines)
+    x = np.broadcast_to(np.asarray(vline_x,dtype=float),np.shape(line.m))
+    return (x,line.evaluate(x))
+
 # This class represents a quadratic equaion in the form:
 # y = ax^2 + bx + c
 class Quadratic():
@@ -53,12 +121,23 @@ class Quadratic():
         self.c = c
 
         # Avoid divide by 0
-        if self.a == 0:
+        if is_array(self.a):
+            self.a = np.where(np.asarray(self.a) == 0,0.00000000000001,self.a)
+        elif self.a == 0:
             self.a = 0.00000000000001
 
-    # Evaluates the equation at a point
+    # Evaluates the equation at a point. x may be an array.
     def evaluate(self,x):
-        return (self.a * x **2 + self.b * 2 + self.c)
+        """
+        Tests:
+        >>> Quadratic(1,2,3).evaluate(2)
+        11
+        >>> Quadratic(1,0,0).evaluate(np.array([1,2,3])).tolist()
+        [1, 4, 9]
+        """
+        if is_array(x):
+            x = np.asarray(x)
+        return (self.a * x **2 + self.b * x + self.c)
 
     # This function returns the coordinates of the vertex of the function
     def vertex(self):
@@ -84,12 +163,23 @@ class Quadratic():
 
         x = (-b +/- sqrt(b^2 - 4ac)) / (2a)
 
+        When any coefficient is an array, returns a pair of root arrays
+        instead of a set. Complex roots are nan.
+
         Tests:
         >>> b = Quadratic(1,5,6)
         >>> b.roots() == {-3,-2}
         True
+        >>> (r1,r2) = Quadratic(np.array([1,1]),np.array([5,0]),np.array([6,1])).roots()
+        >>> r1.tolist()
+        [-3.0, nan]
+        >>> r2.tolist()
+        [-2.0, nan]
         """
 
+        if is_array(self.a,self.b,self.c):
+            return self.roots_array()
+
         # Test for complex roots. We don't want to deal with these
         if (self.b**2 - 4 * self.a * self.c) < 0:
             return []
@@ -100,6 +190,24 @@ class Quadratic():
 
         return solutions
 
+    # Array form of roots. Returns a pair of arrays of roots.
+    # Uses q = -(b + sign(b) sqrt(b^2 - 4ac)) / 2, roots q/a and c/q, which
+    # stays accurate when a is the tiny divide by 0 guard (a linear equation).
+    def roots_array(self):
+        a = np.asarray(self.a,dtype=float)
+        b = np.asarray(self.b,dtype=float)
+        c = np.asarray(self.c,dtype=float)
+
+        disc = b**2 - 4 * a * c
+        with np.errstate(invalid='ignore',divide='ignore'):
+            q = -0.5 * (b + np.where(b < 0,-1.0,1.0) * np.sqrt(disc))
+            root1 = q / a
+            root2 = np.where(q == 0,0.0,c / q)
+        root1 = np.where(disc < 0,np.nan,root1)
+        root2 = np.where(disc < 0,np.nan,root2)
+
+        return (root1,root2)
+
     def print(self):
         tempstr = '%0.3fx^2' % self.a + ' + %0.3fx' % self.b + ' + %0.3f' % self.c
         print(tempstr)
@@ -151,17 +259,47 @@ class QuadraticBezier():
         self.P1 = P1
         self.P2 = P2
 
-    # Evaluate for a point at t
+    # Evaluate for a point at t. t may be an array, in which case x and y are arrays.
     def evaluate(self,t):
-        x = math.pow(1-t,2) * self.P0[0] + 2*(t-1)*t*self.P1[0] + math.pow(t,2) * self.P2[0]
-        y = math.pow(1-t,2) * self.P0[1] + 2*(t-1)*t*self.P1[1] + math.pow(t,2) * self.P2[1]
+        """
+        Tests:
+        >>> bez = QuadraticBezier((0,0),(1,2),(2,0))
+        >>> bez.evaluate(0.5)
+        (1.0, 1.0)
+        >>> (x,y) = bez.evaluate(np.array([0,0.5,1]))
+        >>> x.tolist(), y.tolist()
+        ([0.0, 1.0, 2.0], [0.0, 1.0, 0.0])
+        """
+        if is_array(t):
+            t = np.asarray(t,dtype=float)
+        x = (1-t)**2 * self.P0[0] + 2*(1-t)*t*self.P1[0] + t**2 * self.P2[0]
+        y = (1-t)**2 * self.P0[1] + 2*(1-t)*t*self.P1[1] + t**2 * self.P2[1]
 
         return (x,y)
     
     # Find t at point. If the point does not lie on teh curve, return an empty set.
-    def solve(self,pt):
+    # A root of the x equation is taken if a root of the y equation lies within
+    # tol of it. If the point (or the curve) holds arrays, returns an array of t
+    # with nan where the point is not on the curve.
+    def solve(self,pt,tol=1e-9):
+        """
+        Tests:
+        >>> bez = QuadraticBezier((0,0),(1,2),(3,0))
+        >>> bez.solve((1.25,1))
+        {0.5}
+        >>> [round(t,9) for t in bez.solve(bez.evaluate(0.3))]
+        [0.3]
+        >>> bez.solve((1.25,1.5))
+        set()
+        >>> bez = QuadraticBezier((0,0),(1,2),(2,0))
+        >>> np.round(bez.solve((np.array([1.0,0.5,1.0]),np.array([1.0,0.75,0.0]))),6).tolist()
+        [0.5, 0.25, nan]
+        """
 
         (x,y) = pt
+
+        if is_array(x,y,self.P0[0],self.P0[1],self.P1[0],self.P1[1],self.P2[0],self.P2[1]):
+            return self.solve_array(pt,tol)
         
         quadx = Quadratic(self.P0[0] - 2*self.P1[0] + self.P2[0],
                           -2 * self.P0[0] + 2 * self.P1[0],
@@ -177,8 +315,100 @@ class QuadraticBezier():
         solutions = set()
 
         for root in rootx:
-            if root in rooty and 0 <= root <= 1:
-                solutions.add(root)
+            if -tol <= root <= 1 + tol and any(abs(root - r) <= tol for r in rooty):
+                solutions.add(min(max(root,0),1))
+
+        return solutions
+
+    # Split the curve at t into two curves (de Casteljau's algorithm)
+    def split(self,t=0.5):
+        """
+        Tests:
+        >>> (a,b) = QuadraticBezier((0,0),(1,2),(2,0)).split()
+        >>> a.P0, a.P1, a.P2
+        ((0, 0), (0.5, 1.0), (1.0, 1.0))
+        >>> b.P0, b.P1, b.P2
+        ((1.0, 1.0), (1.5, 1.0), (2, 0))
+        """
+        (x0,y0) = self.P0
+        (x1,y1) = self.P1
+        (x2,y2) = self.P2
+
+        a = (x0 + (x1 - x0) * t,y0 + (y1 - y0) * t)
+        b = (x1 + (x2 - x1) * t,y1 + (y2 - y1) * t)
+        mid = (a[0] + (b[0] - a[0]) * t,a[1] + (b[1] - a[1]) * t)
+
+        return (QuadraticBezier(self.P0,a,mid),QuadraticBezier(mid,b,self.P2))
+
+    # Scalar only version of evaluate, for use in tight loops
+    def point(self,t):
+        s = 1 - t
+        x = s * s * self.P0[0] + 2 * s * t * self.P1[0] + t * t * self.P2[0]
+        y = s * s * self.P0[1] + 2 * s * t * self.P1[1] + t * t * self.P2[1]
+        return (x,y)
+
+    # Derivative (dx/dt,dy/dt) at t
+    def derivative(self,t):
+        dx = 2 * (1-t) * (self.P1[0] - self.P0[0]) + 2 * t * (self.P2[0] - self.P1[0])
+        dy = 2 * (1-t) * (self.P1[1] - self.P0[1]) + 2 * t * (self.P2[1] - self.P1[1])
+        return (dx,dy)
+
+    # Range of tangent directions along the curve as (start,width) angles,
+    # taken modulo pi. The tangent turns from P1-P0 to P2-P1, by less than pi.
+    def tangent_range(self):
+        (dx0,dy0) = (self.P1[0] - self.P0[0],self.P1[1] - self.P0[1])
+        (dx1,dy1) = (self.P2[0] - self.P1[0],self.P2[1] - self.P1[1])
+
+        # A repeated control point leaves only one direction to go on
+        if dx0 == 0 and dy0 == 0:
+            (dx0,dy0) = (dx1,dy1)
+        if dx1 == 0 and dy1 == 0:
+            (dx1,dy1) = (dx0,dy0)
+
+        a = math.atan2(dy0,dx0)
+        turn = (math.atan2(dy1,dx1) - a + math.pi) % (2 * math.pi) - math.pi
+        if turn < 0:
+            a = a + turn
+        return (a % math.pi,abs(turn))
+
+    # Bounding box of the control points as (xmin,ymin,xmax,ymax).
+    # The curve always lies inside it.
+    def bbox(self):
+        (x0,y0) = self.P0
+        (x1,y1) = self.P1
+        (x2,y2) = self.P2
+        return (min(x0,x1,x2),min(y0,y1,y2),max(x0,x1,x2),max(y0,y1,y2))
+
+    # Furthest the curve strays from the straight line P0-P2.
+    # Each split at t = 0.5 divides it by 4.
+    def flatness(self):
+        dx = self.P0[0] - 2 * self.P1[0] + self.P2[0]
+        dy = self.P0[1] - 2 * self.P1[1] + self.P2[1]
+        return math.hypot(dx,dy) / 4
+
+    # Array form of solve. A root of the x equation is accepted if a root of the
+    # y equation lies within tol of it. The first accepted root wins.
+    def solve_array(self,pt,tol=1e-9):
+        (x,y) = pt
+        P0x = np.asarray(self.P0[0],dtype=float)
+        P0y = np.asarray(self.P0[1],dtype=float)
+        P1x = np.asarray(self.P1[0],dtype=float)
+        P1y = np.asarray(self.P1[1],dtype=float)
+        P2x = np.asarray(self.P2[0],dtype=float)
+        P2y = np.asarray(self.P2[1],dtype=float)
+
+        # Note the degree drops when P1 is the midpoint. roots_array copes
+        # with the tiny a Quadratic substitutes for 0.
+        rootsx = Quadratic(P0x - 2*P1x + P2x,-2*P0x + 2*P1x,P0x - x).roots_array()
+        rootsy = Quadratic(P0y - 2*P1y + P2y,-2*P0y + 2*P1y,P0y - y).roots_array()
+
+        shape = np.broadcast(rootsx[0],rootsy[0]).shape
+        solutions = np.full(shape,np.nan)
+        with np.errstate(invalid='ignore'):
+            for rx in rootsx:
+                match = (np.abs(rx - rootsy[0]) <= tol) | (np.abs(rx - rootsy[1]) <= tol)
+                match = match & (rx >= -tol) & (rx <= 1 + tol) & np.isnan(solutions)
+                solutions = np.where(match,np.clip(rx,0,1),solutions)
 
         return solutions
 
@@ -188,59 +418,334 @@ def Bez_intersect_vline(bez,x):
     Tests:
 
     >>> bez1 = QuadraticBezier((0,1),(2,0),(3,2))
-    >>> print(Bez_intersect_vline(bez1,1))
-    
+    >>> sorted((round(x,9),round(y,9)) for (x,y) in Bez_intersect_vline(bez1,1))
+    [(1.0, 0.679491924)]
+    >>> Bez_intersect_vline(bez1,4)
+    set()
 
     """
     # This is an easy problem. Define a quadratic
     quad = Quadratic(bez.P0[0]-2*bez.P1[0]+bez.P2[0],-2*bez.P0[0]+2*bez.P1[0],bez.P0[0] - x)
-    quad.print()
     
     # Find the roots, so basically solve for t
     t = quad.roots()
-    print(t)
+    log.Log(ECONOMY,'Bezier at x = %s: %0.3ft^2 + %0.3ft + %0.3f, roots %s',x,quad.a,quad.b,quad.c,t)
 
     # Throw out roots that are out of bounds
-
     solutions = set()
     for root in t:
-        # if root > 0 and root < 1:
-        solutions.add(bez.evaluate(root))
+        if 0 <= root <= 1:
+            solutions.add(bez.evaluate(root))
     
     # Return solution set of intersection points
     return solutions
 
-# Find the intersection between two bezier curves numerically. TODO: Algebraic method
+# Find the intersection between two bezier curves by recursive subdivision.
+# Returns a list of (t1,t2) parameter pairs, one per intersection point.
+# tol is the distance in curve units within which the intersection is located.
+def Bez_intersect(bez1,bez2,tol=1e-6):
+    """
+    How it works:
 
-# THIS FUNCTION DOES NOT WORK YET
-def Bez_intersect(bez1,bez2):
-    # Iterate through the curve
+    A bezier curve lies inside the bounding box of its control points, and
+    within flatness() of the straight line joining its end points. If either
+    test separates two pieces, the pieces cannot intersect. Otherwise split
+    the piece furthest from flat in half and check the halves.
 
-    ir = 200
-    thr = 0.003
+    Once both pieces are nearly flat and their tangent directions do not
+    overlap (so they can cross at most once), the crossing of the straight
+    lines is polished with Newton's method until the two curves are within
+    tol of each other.
 
-    bez1_pts = []
-    for t in range(0,ir):
-        bez1_pts.append(bez1.evaluate(t/ir))
+    Curves which coincide along a stretch share every point of it. They are
+    found before subdividing, and the ends of the stretch are returned.
 
-    bez2_pts = []
-    for t in range(0,ir):
-        bez2_pts.append(bez2.evaluate(t/ir))
+    Tests:
+    >>> bez1 = QuadraticBezier((0,0),(1,2),(2,0))
+    >>> bez2 = QuadraticBezier((0,1),(1,-1),(2,1))
+    >>> [(round(t1,4),round(t2,4)) for (t1,t2) in Bez_intersect(bez1,bez2)]
+    [(0.1464, 0.1464), (0.8536, 0.8536)]
+    >>> Bez_intersect(bez1,QuadraticBezier((0,3),(1,3),(2,3)))
+    []
+
+    Coincident curves give the ends of the stretch they share:
+    >>> Bez_intersect(bez1,bez1)
+    [(0.0, 0.0), (1.0, 1.0)]
+    >>> (a,b) = bez1.split(0.25)
+    >>> [(round(t1,6),round(t2,6)) for (t1,t2) in Bez_intersect(bez1,QuadraticBezier(b.P2,b.P1,b.P0))]
+    [(0.25, 1.0), (1.0, 0.0)]
+    >>> [(round(t1,6),round(t2,6)) for (t1,t2) in Bez_intersect(QuadraticBezier((0,0),(1,0),(4,0)),
+    ...                                                         QuadraticBezier((2,0),(3,0),(6,0)))]
+    [(0.618034, 0.0), (1.0, 0.618034)]
+    """
+    overlap = overlap_ends(bez1,bez2,tol)
+    if overlap != None:
+        return overlap
 
     solutions = []
-    val = []
-    
-    for i in range(0,ir):
-        for j in range(0,ir):
-            distance =  dist(bez1_pts[i][0],bez1_pts[i][1],bez2_pts[j][0],bez2_pts[j][1])
-            # if distance < 0.07: print(distance)
-            a = round(distance,3)
-            if a < thr and a not in val:
-                solutions.append((i/ir,j/ir))
-                val.append(a)
-
+    points = []
+
+    # Pieces only need to be roughly flat before Newton takes over.
+    # Each split makes a piece 4 times flatter.
+    (xmin,ymin,xmax,ymax) = bez1.bbox()
+    coarse = max(tol,math.hypot(xmax - xmin,ymax - ymin) / 10)
+
+    # Each entry is a pair of curve pieces with their parameter ranges
+    todo = [(bez1,0.0,1.0,bez2,0.0,1.0,0)]
+
+    while todo:
+        (c1,lo1,hi1,c2,lo2,hi2,depth) = todo.pop()
+
+        if not boxes_overlap(c1.bbox(),c2.bbox(),tol):
+            continue
+
+        flat1 = c1.flatness()
+        flat2 = c2.flatness()
+
+        if chord_separates(c2,flat2 + tol,c1) or chord_separates(c1,flat1 + tol,c2):
+            continue
+
+        t = None
+        if flat1 <= coarse and flat2 <= coarse and tangents_apart(c1,c2):
+            # Start Newton from where the straight lines cross, or the middle
+            hit = segments_intersect(c1.P0,c1.P2,c2.P0,c2.P2,coarse)
+            if hit == None:
+                hit = (0.5,0.5)
+            (s,u) = hit
+            t = bez_newton(bez1,bez2,lo1 + s * (hi1 - lo1),lo2 + u * (hi2 - lo2),tol)
+
+            # Newton may wander off to a crossing belonging to another piece
+            if t != None:
+                slack1 = (hi1 - lo1) / 100
+                slack2 = (hi2 - lo2) / 100
+                if not (lo1 - slack1 <= t[0] <= hi1 + slack1 and lo2 - slack2 <= t[1] <= hi2 + slack2):
+                    t = None
+
+            # No crossing found, and the pieces can only cross once
+            if t == None and (flat1 <= tol or flat2 <= tol or depth > 64):
+                continue
+
+        # Where the curves only touch, keep splitting until the pieces are
+        # straight to within tol and use the straight lines alone.
+        if t == None and ((flat1 <= tol and flat2 <= tol) or depth > 64):
+            hit = segments_intersect(c1.P0,c1.P2,c2.P0,c2.P2,tol)
+            if hit == None:
+                continue
+            (s,u) = hit
+            t = (lo1 + s * (hi1 - lo1),lo2 + u * (hi2 - lo2))
+
+        if t == None:
+            coarse_split(todo,c1,lo1,hi1,c2,lo2,hi2,depth,flat1,flat2)
+            continue
+
+        pt = bez1.point(t[0])
+
+        # Neighbouring pieces share end points, so the same crossing
+        # can be found twice. There are at most 4 real intersections.
+        duplicate = False
+        for other in points:
+            if dist(pt[0],pt[1],other[0],other[1]) <= 4 * tol:
+                duplicate = True
+                break
+        if not duplicate:
+            points.append(pt)
+            solutions.append(t)
+
+    solutions.sort()
     return solutions
-            
+
+# If bez1 and bez2 coincide along a stretch longer than tol, the (t1,t2) of
+# each end of the stretch, ordered by t1; otherwise None.
+#
+# Two parabolas coincide when bez2 is a piece of bez1's curve run over
+# [a,b]: then the P0 - 2 * P1 + P2 of bez2 is (b - a)^2 times bez1's, and
+# bez2's derivative at 0 is (b - a) times bez1's at a. Straight curves
+# coincide when all their control points are on one line; their
+# parameters are not linear in each other, so each end is solved for.
+def overlap_ends(bez1,bez2,tol):
+    if straight(bez1,tol):
+        return line_overlap_ends(bez1,bez2,tol)
+
+    (ax,ay) = (bez1.P0[0] - 2 * bez1.P1[0] + bez1.P2[0],bez1.P0[1] - 2 * bez1.P1[1] + bez1.P2[1])
+    (cx,cy) = (bez2.P0[0] - 2 * bez2.P1[0] + bez2.P2[0],bez2.P0[1] - 2 * bez2.P1[1] + bez2.P2[1])
+    k = (cx * ax + cy * ay) / (ax * ax + ay * ay)
+    if k <= 0:
+        return None
+
+    (dx,dy) = bez2.derivative(0)
+    (bx,by) = (2 * (bez1.P1[0] - bez1.P0[0]),2 * (bez1.P1[1] - bez1.P0[1]))
+    for d in (math.sqrt(k),-math.sqrt(k)):
+        # bez1's derivative at a is 2 * (P1 - P0) + 2 * a * (P0 - 2 * P1 + P2)
+        a = ((dx / d - bx) * ax + (dy / d - by) * ay) / (2 * (ax * ax + ay * ay))
+        b = a + d
+        (x0,y0) = bez1.point(a)
+        (x2,y2) = bez1.point(b)
+        (tx,ty) = bez1.derivative(a)
+        (x1,y1) = (x0 + d / 2 * tx,y0 + d / 2 * ty)
+        if (dist(x0,y0,*bez2.P0) <= tol and dist(x1,y1,*bez2.P1) <= tol
+                and dist(x2,y2,*bez2.P2) <= tol):
+            lo = max(0.0,min(a,b))
+            hi = min(1.0,max(a,b))
+            if lo > hi:
+                return None
+            (p,q) = (bez1.point(lo),bez1.point(hi))
+            if dist(p[0],p[1],q[0],q[1]) <= tol:
+                return None
+            return [(lo,(lo - a) / d + 0.0),(hi,(hi - a) / d + 0.0)]
+    return None
+
+# True if the control points of bez lie within tol of a line
+def straight(bez,tol):
+    (p0,p1,p2) = (bez.P0,bez.P1,bez.P2)
+    cross = abs((p1[0] - p0[0]) * (p2[1] - p0[1]) - (p1[1] - p0[1]) * (p2[0] - p0[0]))
+    longest = max(dist(*p0,*p1),dist(*p1,*p2),dist(*p0,*p2))
+    return longest <= tol or cross / longest <= tol
+
+# overlap_ends for a straight bez1
+def line_overlap_ends(bez1,bez2,tol):
+    # The line through the two control points furthest apart
+    (p,q) = max(((bez1.P0,bez1.P1),(bez1.P1,bez1.P2),(bez1.P0,bez1.P2)),key=lambda pq: dist(*pq[0],*pq[1]))
+    ((x0,y0),(x1,y1)) = (p,q)
+    length = dist(x0,y0,x1,y1)
+    if length <= tol:
+        return None
+    (ux,uy) = ((x1 - x0) / length,(y1 - y0) / length)
+    for (x,y) in (bez2.P0,bez2.P1,bez2.P2):
+        if abs((x - x0) * uy - (y - y0) * ux) > tol:
+            return None
+
+    # Position along the line at t of each curve, as (a,b,c) of a quadratic
+    def along(bez):
+        (p0,p1,p2) = [(x - x0) * ux + (y - y0) * uy for (x,y) in (bez.P0,bez.P1,bez.P2)]
+        return (p0 - 2 * p1 + p2,2 * (p1 - p0),p0)
+    def extent(quad):
+        (a,b,c) = quad
+        values = [c,a + b + c]
+        if a != 0 and 0 < -b / (2 * a) < 1:
+            values.append(c - b * b / (4 * a))
+        return (min(values),max(values))
+    def solve(quad,pos):
+        (a,b,c) = quad
+        roots = [t for t in Quadratic(a,b,c - pos).roots() if -tol <= t <= 1 + tol]
+        if not roots:
+            return None
+        return min(max(min(roots),0.0),1.0)
+
+    (quad1,quad2) = (along(bez1),along(bez2))
+    (min1,max1) = extent(quad1)
+    (min2,max2) = extent(quad2)
+    (lo,hi) = (max(min1,min2),min(max1,max2))
+    if hi - lo <= tol:
+        return None
+    ends = [(solve(quad1,pos),solve(quad2,pos)) for pos in (lo,hi)]
+    if None in ends[0] or None in ends[1]:
+        return None
+    return sorted(ends)
+
+# True if the control points of bez lie entirely on one side of the line
+# through the end points of chord_bez, further away than margin.
+# chord_bez itself never strays further than its flatness from that line.
+def chord_separates(chord_bez,margin,bez):
+    (x0,y0) = chord_bez.P0
+    dx = chord_bez.P2[0] - x0
+    dy = chord_bez.P2[1] - y0
+    length = math.hypot(dx,dy)
+    if length == 0:
+        return False
+
+    d0 = ((bez.P0[0] - x0) * dy - (bez.P0[1] - y0) * dx) / length
+    d1 = ((bez.P1[0] - x0) * dy - (bez.P1[1] - y0) * dx) / length
+    d2 = ((bez.P2[0] - x0) * dy - (bez.P2[1] - y0) * dx) / length
+    return min(d0,d1,d2) > margin or max(d0,d1,d2) < -margin
+
+# True if the tangent directions of the two pieces do not overlap.
+# Two such pieces cross at most once.
+def tangents_apart(bez1,bez2):
+    (start1,width1) = bez1.tangent_range()
+    (start2,width2) = bez2.tangent_range()
+
+    # Directions are compared as lines, so on a circle of length pi
+    gap = (start2 - start1) % math.pi
+    return width1 < gap and gap + width2 < math.pi
+
+# Split whichever piece is furthest from flat and queue both halves
+def coarse_split(todo,c1,lo1,hi1,c2,lo2,hi2,depth,flat1,flat2):
+    if flat1 >= flat2:
+        mid = (lo1 + hi1) / 2
+        (left,right) = c1.split()
+        todo.append((left,lo1,mid,c2,lo2,hi2,depth + 1))
+        todo.append((right,mid,hi1,c2,lo2,hi2,depth + 1))
+    else:
+        mid = (lo2 + hi2) / 2
+        (left,right) = c2.split()
+        todo.append((c1,lo1,hi1,left,lo2,mid,depth + 1))
+        todo.append((c1,lo1,hi1,right,mid,hi2,depth + 1))
+
+# Solve bez1(t1) = bez2(t2) with Newton's method from a starting guess.
+# Returns (t1,t2), or None if it does not converge to a point on both curves.
+def bez_newton(bez1,bez2,t1,t2,tol):
+    for i in range(16):
+        (x1,y1) = bez1.point(t1)
+        (x2,y2) = bez2.point(t2)
+        fx = x1 - x2
+        fy = y1 - y2
+        if math.hypot(fx,fy) <= tol:
+            if 0 <= t1 <= 1 and 0 <= t2 <= 1:
+                return (t1,t2)
+            return None
+
+        (ax,ay) = bez1.derivative(t1)
+        (bx,by) = bez2.derivative(t2)
+
+        # Jacobian is [[ax,-bx],[ay,-by]]
+        det = -ax * by + bx * ay
+        if det == 0:
+            return None
+        t1 = t1 - (-by * fx + bx * fy) / det
+        t2 = t2 - (-ay * fx + ax * fy) / det
+
+        if not (-0.5 <= t1 <= 1.5 and -0.5 <= t2 <= 1.5):
+            return None
+
+    return None
+
+# Test whether two boxes (xmin,ymin,xmax,ymax) overlap, allowing a margin of tol
+def boxes_overlap(box1,box2,tol=0):
+    return (box1[0] <= box2[2] + tol and box2[0] <= box1[2] + tol and
+            box1[1] <= box2[3] + tol and box2[1] <= box1[3] + tol)
+
+# Intersect the segments p1-p2 and q1-q2. Returns the fractions (s,u) along
+# each segment, or None if they do not cross.
+def segments_intersect(p1,p2,q1,q2,tol=0):
+    """
+    Tests:
+    >>> segments_intersect((0,0),(2,2),(0,2),(2,0))
+    (0.5, 0.5)
+    >>> segments_intersect((0,0),(1,0),(0,1),(1,1)) == None
+    True
+    """
+    rx = p2[0] - p1[0]
+    ry = p2[1] - p1[1]
+    vx = q2[0] - q1[0]
+    vy = q2[1] - q1[1]
+
+    denom = rx * vy - ry * vx
+    # Parallel segments. Overlapping collinear pieces are not reported.
+    if denom == 0:
+        return None
+
+    wx = q1[0] - p1[0]
+    wy = q1[1] - p1[1]
+    s = (wx * vy - wy * vx) / denom
+    u = (wx * ry - wy * rx) / denom
+
+    # Allow the crossing to sit up to tol past either end of a segment
+    slack_s = tol / (math.hypot(rx,ry) + 1e-300)
+    slack_u = tol / (math.hypot(vx,vy) + 1e-300)
+    if -slack_s <= s <= 1 + slack_s and -slack_u <= u <= 1 + slack_u:
+        return (min(max(s,0.0),1.0),min(max(u,0.0),1.0))
+    return None
+
 if __name__ == "__main__":
         import doctest
         doctest.testmod()
@@ -27,6 +27,12 @@ class CapitalDatabase():
     >>> not Data.Radios == None
     True
 
+    Items are referred to by their kind and catalog id:
+    >>> Data.ItemRef(Data.GetRadio(2))
+    ('Radio', 2)
+    >>> Data.GetItem('Radio',2).GetName() == Data.GetRadio(2).GetName()
+    True
+
     """
 
     def __init__(self):
@@ -35,6 +41,11 @@ class CapitalDatabase():
         if file_path != "":
             os.chdir(file_path)
 
+        # Catalog ids by (kind,name), and unchanged items by (kind,id),
+        # filled in as they are asked for
+        self._refs = {}
+        self._templates = {}
+
         # Load in the database dictionaries from files.
         # These dictionaries contain the possible items you can buy for the game.
         try:
@@ -86,6 +97,43 @@ class CapitalDatabase():
     def GetBuilding(self,id):
         return Building(self.Buildings[id])
 
+    # The catalog dictionary and item class of a kind of item. The kinds
+    # are the item class names.
+    def Catalog(self,kind):
+        if kind == 'Tower':
+            return (self.Towers,Tower)
+        elif kind == 'Radio':
+            return (self.Radios,Radio)
+        elif kind == 'Wired':
+            return (self.Wired,Wired)
+        elif kind == 'Router':
+            return (self.Routers,Router)
+        elif kind == 'Building':
+            return (self.Buildings,Building)
+        raise KeyError(kind)
+
+    # Returns the (kind,id) of the catalog entry an item was made from.
+    # Items are matched by kind and name.
+    def ItemRef(self,item):
+        kind = type(item).__name__
+        if (kind,item.name) not in self._refs:
+            (catalog,item_class) = self.Catalog(kind)
+            for (id,fields) in catalog.items():
+                self._refs[(kind,fields[0])] = id
+        return (kind,self._refs[(kind,item.name)])
+
+    # A new item from its catalog entry
+    def GetItem(self,kind,id):
+        (catalog,item_class) = self.Catalog(kind)
+        return item_class(catalog[id])
+
+    # An unchanged item from a catalog entry, shared between callers to
+    # compare items against. Do not modify it.
+    def Template(self,kind,id):
+        if (kind,id) not in self._templates:
+            self._templates[(kind,id)] = self.GetItem(kind,id)
+        return self._templates[(kind,id)]
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
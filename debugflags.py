@@ -0,0 +1,33 @@
+# debugflags.py
+# The global debug flag and its categories.
+#
+# agentsim.debug is this flag. It lives here so the engine modules can test
+# it without importing the user interface. See bitflag for how to set it.
+
+from bitflag import BitFlag
+
+debug = BitFlag()
+
+# Framework categories, as documented in agentsim
+AGENTSIM = 1
+PERSON = 2
+SHAPE = 4
+RESERVED = 8
+
+# Game categories
+TURN = 16          # Phases of a turn
+CAPACITY = 32      # CapReset, CapAtCoord and path finding
+ITEMS = 64         # Item updates and failures
+ACTIONS = 128      # Player actions
+ECONOMY = 256      # Cities, demand curves and revenue
+
+# Names of the categories, for display
+CATEGORIES = {AGENTSIM: 'agentsim',
+              PERSON: 'person',
+              SHAPE: 'shape',
+              RESERVED: 'reserved',
+              TURN: 'turn',
+              CAPACITY: 'capacity',
+              ITEMS: 'items',
+              ACTIONS: 'actions',
+              ECONOMY: 'economy'}
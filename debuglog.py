@@ -0,0 +1,96 @@
+# debuglog.py
+# Debug messages gated by the debug flag categories.
+#
+# A message is only kept while its category's bit is set in the debug flag,
+# so a disabled call costs one bit test. Messages are stored with their
+# format arguments and only formatted when they are written out. They are
+# buffered and written in batches, or when Flush is called.
+#
+#     log.Log(CAPACITY,'path %s carries %0.0f',path,cur_cap)
+#
+# For messages whose arguments are costly to build, test the category first:
+#
+#     if log.Enabled(CAPACITY):
+#         log.Log(CAPACITY,'caps %s',dict(network.cap_at_node))
+
+import sys
+from time import perf_counter
+
+from debugflags import *
+
+class DebugLog():
+    """
+    Tests:
+    >>> import io
+    >>> flag = BitFlag()
+    >>> out = io.StringIO()
+    >>> log = DebugLog(flag,out=out)
+    >>> log.Log(CAPACITY,'not %s','kept')
+    >>> old = flag.set(CAPACITY | ACTIONS)
+    >>> log.Log(CAPACITY,'supply %0.1f',2.25)
+    >>> log.Log(ACTIONS,'action %r',['addnode',[(1,2),'A']])
+    >>> log.Log(ITEMS,'not %s','kept')
+    >>> len(log.records), out.getvalue()
+    (2, '')
+    >>> log.Flush()
+    >>> print(out.getvalue(), end='')
+    [capacity] supply 2.2
+    [actions] action ['addnode', [(1, 2), 'A']]
+    >>> log.records
+    []
+    """
+
+    # flag is the BitFlag gating the categories, out the stream messages
+    # are written to. Every buffer_size messages the buffer is flushed.
+    def __init__(self,flag=debug,out=None,buffer_size=1000,timestamps=False):
+        self.flag = flag
+        self.out = out
+        self.buffer_size = buffer_size
+        self.timestamps = timestamps
+        self.records = []
+
+    # Is the category being logged?
+    def Enabled(self,category):
+        return self.flag._flag & category
+
+    # Keep a message. fmt is formatted with the % operator and args when
+    # the message is written.
+    def Log(self,category,fmt,*args):
+        if not self.flag._flag & category:
+            return
+        self.records.append((perf_counter(),category,fmt,args))
+        if len(self.records) >= self.buffer_size:
+            self.Flush()
+
+    # The buffered messages as text lines
+    def Lines(self):
+        lines = []
+        for (time,category,fmt,args) in self.records:
+            if args:
+                message = fmt % args
+            else:
+                message = fmt
+            line = '[' + CATEGORIES.get(category,str(category)) + '] ' + message
+            if self.timestamps:
+                line = '%0.6f ' % time + line
+            lines.append(line)
+        return lines
+
+    # Write out the buffered messages
+    def Flush(self):
+        if not self.records:
+            return
+        out = self.out
+        if out == None:
+            out = sys.stderr
+        for line in self.Lines():
+            out.write(line + '\n')
+        out.flush()
+        self.records = []
+
+# The log used by the game, gated by the global debug flag
+log = DebugLog()
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -183,8 +183,13 @@ def random_graph(n, m):
     if m > max_num_edges:
         raise ValueError("For {} vertices, you wanted {} edges, but can only have a maximum of {}".format(n, m, max_num_edges))
 
-    while G.num_edges() < m:
-        G.add_edge(random.sample(range(n), 2))
+    # Count the edges here; num_edges() walks every vertex.
+    edges = set()
+    while len(edges) < m:
+        e = tuple(random.sample(range(n), 2))
+        if e not in edges:
+            edges.add(e)
+            G.add_edge(e)
 
     return G
 
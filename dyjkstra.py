@@ -1,4 +1,6 @@
 from digraph import Digraph,compress
+from tracing import tracer
+from debugflags import CAPACITY
 
 # Define a cost testing function
 def costTest(e):
@@ -76,6 +78,11 @@ def least_cost_path(G,start,dest,cost):
                 todo[n] = c + cost((cur,n))
                 parent[n] = cur
 
+    # Count the work done, for the trace
+    if tracer.Enabled(CAPACITY):
+        tracer.Count('paths computed',CAPACITY)
+        tracer.Count('nodes visited',CAPACITY,len(visited))
+
     # now, if there is a path, extract it.  The graph may be disconnected, so return none if it is
     trace = dest
     breakflag = 0
@@ -2,22 +2,37 @@
 # This system determines supply and demand of cities in 
 # the network. It also can update.
 
-# NOTE: THIS CLASS IS CURRENTLY A STUB
-
 import math
 import random
 
+import numpy as np
+
 from city import *
 
 # This is a library which implements linear and quadratic curves.
 from curves import *
 
+# Economic models which can be used to calculate revenue.
+# placeholder - City.Revenue's temporary population based formula
+# market - price and quantity cleared against each city's demand curves
+MODELS = ('placeholder','market')
+
 class Economic():
 
-    def __init__(self,cities_list):
+    def __init__(self,cities_list,model='placeholder'):
         # Cities list is a list of 
         # City objects that are part of the economic system.
         self.cities = cities_list
+        self.SetModel(model)
+
+    # Select the economic model used to calculate revenue
+    def SetModel(self,model):
+        if model not in MODELS:
+            raise ValueError('Unknown economic model: ' + str(model))
+        self.model = model
+
+    def GetModel(self):
+        return self.model
 
     # Accessors:
     def GetCities(self):
@@ -30,8 +45,86 @@ class Economic():
             coord.append(city.GetCoord())
         return coord
 
+    # Revenue for one turn across every city, using the selected model.
+    # supplies is an optional list of (insupply,outsupply) per city; by
+    # default the supply last set on each city is used.
+    def Revenue(self,supplies=None):
+        if supplies == None:
+            supplies = [city.GetSupply() for city in self.cities]
+
+        if self.model == 'market':
+            return self.MarketRevenue(supplies)
+
+        revenue = 0
+        for (city,supply) in zip(self.cities,supplies):
+            revenue = revenue + city.Revenue(supply)
+        return revenue
+
+    # Clear the uplink and downlink markets of every city in one go.
+    def MarketRevenue(self,supplies):
+        """
+        Tests:
+        >>> e = Economic([City('A',0,0,1000),City('B',10,0,2000)],'market')
+        >>> round(e.MarketRevenue([(0,0),(0,0)]),12)
+        0.0
+        >>> r = e.MarketRevenue([(5000000,1000000),(0,0)])
+        >>> round(r / e.cities[0].down_rate)
+        6
+        """
+        n = len(self.cities)
+        if n == 0:
+            return 0
+
+        supply = np.asarray(supplies,dtype=float).reshape(n,2)
+
+        (iprice,iquantity) = clear_market([city.idemand_curve for city in self.cities],
+                                          [city.down_rate for city in self.cities],
+                                          supply[:,0])
+        (oprice,oquantity) = clear_market([city.odemand_curve for city in self.cities],
+                                          [city.up_rate for city in self.cities],
+                                          supply[:,1])
+
+        return float(np.sum(iquantity * iprice) + np.sum(oquantity * oprice))
+
     # Step functions
-    def Update(self,turn):
+    def Update(self,turn,rng=random):
         # This function is called once per step. It updates the system.
+        # rng is the random number generator the cities draw from.
         for city in self.cities:
-            city.Update(turn,1,0)
+            city.Update(turn,1,0,rng)
+
+# Find the clearing price and quantity for a set of markets.
+# demand is a list of Linear demand curves, rate the price charged in each
+# market and supply the capacity available in bit/s.
+# Returns arrays (price,quantity), with quantity in Mbit/s.
+def clear_market(demand,rate,supply):
+    """
+    Tests:
+    >>> (p,q) = clear_market([Linear(-1,10),Linear(-1,10)],[4,4],[2000000,9000000])
+    >>> p.tolist(), q.tolist()
+    ([4.0, 4.0], [2.0, 6.0])
+
+    Charging more than anyone will pay sells nothing:
+    >>> (p,q) = clear_market([Linear(-1,10)],[12],[2000000])
+    >>> q.tolist()
+    [0.0]
+    """
+    demand = stack_lines(demand)
+    rate = np.asarray(rate,dtype=float)
+
+    # Quantity demanded at the price we charge
+    (demanded,price) = lines_intersect_batch(demand,Linear(np.zeros_like(rate),rate))
+
+    # Quantity supplied by the network
+    supplied = np.asarray(supply,dtype=float) / 1000000
+
+    # If the supply is further left, there is a shortage and lost revenue.
+    # Otherwise we sell only what is demanded.
+    quantity = np.where(supplied <= demanded,supplied,demanded)
+    quantity = np.nan_to_num(np.clip(quantity,0,None))
+
+    return (np.broadcast_to(rate,quantity.shape),quantity)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -6,11 +6,9 @@ import copy
 
 from capital import *
 from networkgraph import *
+from events import bus,INVENTORY_CHANGED,LINK_CHANGED,CAPACITY_CHANGED
 import game
 
-global refresh_flag
-refresh_flag = False
-
 class EditLink():
     def __init__(self,parent,inventory,edge,gamenetwork):
         self.inventory = inventory
@@ -114,7 +112,7 @@ class EditLink():
 
         self.slots_list = Listbox(self.sideFrame2,height=15,selectmode='SINGLE')
         self.slots_list.pack(side='top',padx=20,pady=10,fill='both')
-        self.slots_list.bind('<ButtonPress-1>', lambda x: self.get_maint())
+        self.slots_list.bind('<<ListboxSelect>>', lambda x: self.select())
         
         # Buttons
         self.button_add = Button(self.sideFrame2,
@@ -133,12 +131,16 @@ class EditLink():
         self.button_close.pack(side='top',fill='x')
 
 
-        # Standby
-        self.inv_list.bind('<ButtonPress-1>', lambda x: self.get_maint())
-        self.refresh_des()
+        self.inv_list.bind('<<ListboxSelect>>', lambda x: self.select())
+        self.refresh_cap()
         self.refresh_item()
         self.do_item_change()
 
+        # Refresh when the inventory, the link or its capacity change
+        bus.SubscribeWindow(self.root,INVENTORY_CHANGED,self.inventory_changed)
+        bus.SubscribeWindow(self.root,LINK_CHANGED,self.link_changed)
+        bus.SubscribeWindow(self.root,CAPACITY_CHANGED,self.capacity_changed)
+
     # Close the window
     def close(self):
         self.root.destroy()
@@ -179,11 +181,34 @@ class EditLink():
         except:
             pass
 
-        # Refresh max capacity display
+    # Refresh max capacity display
+    def refresh_cap(self):
         self.cap.set('Maximum capacity available at link: %0.2f' % (self.network.MaxCapAtEdge(self.edge) / 1000000) + ' Mbit/s')
         self.capset.set('Current Used capacity available at link: %0.2f' % (self.network.CapAtEdge(self.edge) / 1000000) + ' Mbit/s')
 
-        self.root.after(200,self.refresh_des)
+    # An item was selected in one of the lists
+    def select(self):
+        self.refresh_des()
+        self.get_maint()
+
+    # The game's inventory was replaced
+    def inventory_changed(self,inventory):
+        self.inventory = copy.copy(inventory)
+        self.refresh_inv()
+
+    # Another window changed the items at a link
+    def link_changed(self,network,edge):
+        if network is self.network and edge == self.edge:
+            self.do_item_change()
+            self.refresh_cap()
+
+    # Capacities were computed for a turn. Links deleted since the window
+    # was opened are skipped. The selected item's description is shown
+    # again, as its age and state change every turn.
+    def capacity_changed(self,network):
+        if network is self.network and self.edge in network.E_items:
+            self.refresh_cap()
+            self.select()
 
     def do_item_change(self):
         st = self.network.NodeLinkSlots(self.edge[0])
@@ -221,6 +246,7 @@ class EditLink():
                         if item_toadd.type() == 'Wired':
                             game.action_q.append(['subtractcash',[-item_toadd.GetCost() + item_toadd.GetCost() * self.network.E_lengths[self.edge]]])
                         game.action_q.append(['inv',copy.deepcopy(self.inventory)])
+                        game.link_changed(self.network,self.edge)
                         self.do_item_change()
                     else:
                         messagebox.showwarning('Warning',
@@ -242,6 +268,7 @@ class EditLink():
                 # Item removal was successful
                 self.inventory.append(copy.deepcopy(rem_item))
                 game.action_q.append(['inv',copy.deepcopy(self.inventory)])
+                game.link_changed(self.network,self.edge)
                 self.do_item_change()
             else:
                 messagebox.showwarning('Warning.','Invalid request',parent=self.root)
@@ -249,12 +276,14 @@ class EditLink():
     def new_maint(self):
         # Check which item is selected
         self.sel_item.SetMaintenance(float(self.budget.get()) / 24 / 7)
+        game.link_changed(self.network,self.edge)
         self.get_maint()
 
     def new_target(self):
         # Check which item is selected
         if self.sel_item.type() == 'Radio' or self.sel_item.type() == 'Wired':
             self.sel_item.SetCapacity(float(self.target.get()) * 1000000)
+            game.link_changed(self.network,self.edge)
             self.des.set(self.sel_item.GetInfo())
             
 
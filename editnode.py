@@ -8,11 +8,9 @@ import copy
 from capital import *
 from networkgraph import *
 from subslotedit import *
+from events import bus,INVENTORY_CHANGED,NODE_CHANGED,CAPACITY_CHANGED
 import game
 
-global refresh_flag
-refresh_flag = False
-
 class EditNode():
     def __init__(self,parent,inventory,nodeid,gamenetwork):
         self.inventory = inventory
@@ -62,6 +60,7 @@ class EditNode():
 
         self.inv_list = Listbox(self.sideFrame,height=30,width=60,selectmode='ExTENDED')
         self.inv_list.pack(side='left',padx=5,pady=10)
+        self.inv_list.bind('<<ListboxSelect>>', lambda ev: self.refresh_des())
         self.refresh_inv()
 
         self.scrollbar = Scrollbar(self.sideFrame,orient=VERTICAL,
@@ -86,6 +85,7 @@ class EditNode():
 
         self.site_list = Listbox(self.sideFrame2,height=10,width=40,selectmode='EXTENDED')
         self.site_list.pack(side='top',padx=20,pady=10)
+        self.site_list.bind('<<ListboxSelect>>', lambda ev: self.refresh_des())
         self.refresh_site()
 
         # Add and remove buttons
@@ -111,9 +111,11 @@ class EditNode():
                                     command=self.close)
         self.button_close.pack(side='top',fill='x')
 
-        # Standby
-        self.refresh_des()
-        self.standby()
+        # Refresh when the inventory, the node or its capacity change
+        self.refresh_cap()
+        bus.SubscribeWindow(self.root,INVENTORY_CHANGED,self.inventory_changed)
+        bus.SubscribeWindow(self.root,NODE_CHANGED,self.node_changed)
+        bus.SubscribeWindow(self.root,CAPACITY_CHANGED,self.capacity_changed)
     
 
     def refresh_inv(self):
@@ -146,6 +148,7 @@ class EditNode():
                         self.network.V_items[self.node].append(copy.deepcopy(self.inventory[selected]))
                         self.inventory.pop(selected)
                         game.action_q.append(['inv',copy.deepcopy(self.inventory)])
+                        game.node_changed(self.network,self.node)
                         self.refresh_site()
                         self.refresh_inv()
                     else:
@@ -162,6 +165,7 @@ class EditNode():
                 item = copy.deepcopy(self.network.V_items[self.node].pop(selected))
                 self.inventory.append(item)
                 game.action_q.append(['inv',copy.deepcopy(self.inventory)])
+                game.node_changed(self.network,self.node)
                 self.refresh_site()
                 self.refresh_inv()
 
@@ -185,16 +189,26 @@ class EditNode():
             item = self.network.V_items[self.node][self.sel]
             self.des.set(item.GetInfo())
 
-        
+    def refresh_cap(self):
         self.cap.set('Maximum capacity available at Node: %0.2f' % (self.network.MaxCapAtNode(self.node) / 1000000) + ' Mbit/s')
-        self.capset.set('Current Used capacity available at node: %0.2f' % (self.network.cap_at_node_cached[self.node] / 1000000) + ' Mbit/s')
+        self.capset.set('Current Used capacity available at node: %0.2f' % (self.network.cap_at_node_cached.get(self.node,0) / 1000000) + ' Mbit/s')
+
+    # The game's inventory was replaced
+    def inventory_changed(self,inventory):
+        self.inventory = copy.copy(inventory)
+        self.refresh_inv()
+
+    # Another window changed the items at a node
+    def node_changed(self,network,node):
+        if network is self.network and node == self.node:
+            self.refresh_site()
+            self.refresh_cap()
+
+    # Capacities were computed for a turn. Nodes deleted since the window
+    # was opened are skipped. The selected item's description is shown
+    # again, as its age and state change every turn.
+    def capacity_changed(self,network):
+        if network is self.network and self.node in network.V_items:
+            self.refresh_cap()
+            self.refresh_des()
 
-        self.root.after(200,self.refresh_des)
-        
-    def standby(self):
-        global refresh_flag
-        if refresh_flag:
-            self.refresh_inv()
-            refresh_flag = False
-            
-        self.root.after(500,self.standby)
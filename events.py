@@ -0,0 +1,66 @@
+# events.py
+# Tells the windows showing parts of the game when those parts change, so
+# they are redrawn when something changed instead of on a timer.
+#
+# Topics, and the arguments their subscribers are called with:
+#
+#     INVENTORY_CHANGED   inventory        the player's inventory was replaced
+#     NODE_CHANGED        network, node    the items at a node were changed
+#     LINK_CHANGED        network, edge    the items at a link were changed
+#     CAPACITY_CHANGED    network          the turn's capacities were computed
+#
+# The network is passed so windows on a network which was replaced, e.g.
+# by loading a game, can ignore it.
+
+INVENTORY_CHANGED = 'inventory'
+NODE_CHANGED = 'node'
+LINK_CHANGED = 'link'
+CAPACITY_CHANGED = 'capacity'
+
+class EventBus():
+    """
+    Tests:
+    >>> bus = EventBus()
+    >>> seen = []
+    >>> def changed(network,node):
+    ...     seen.append(node)
+    >>> bus.Subscribe(NODE_CHANGED,changed)
+    >>> bus.Publish(NODE_CHANGED,None,4)
+    >>> bus.Publish(LINK_CHANGED,None,(4,5))
+    >>> bus.Unsubscribe(NODE_CHANGED,changed)
+    >>> bus.Publish(NODE_CHANGED,None,5)
+    >>> seen
+    [4]
+    """
+
+    def __init__(self):
+        # Lists of functions by topic
+        self.subscribers = {}
+
+    def Subscribe(self,topic,fn):
+        self.subscribers.setdefault(topic,[]).append(fn)
+
+    def Unsubscribe(self,topic,fn):
+        if fn in self.subscribers.get(topic,()):
+            self.subscribers[topic].remove(fn)
+
+    # Subscribe fn until a Tk window is destroyed
+    def SubscribeWindow(self,window,topic,fn):
+        self.Subscribe(topic,fn)
+        def destroyed(event):
+            # The window's children pass their Destroy events up to it
+            if event.widget == window:
+                self.Unsubscribe(topic,fn)
+        window.bind('<Destroy>',destroyed,add='+')
+
+    # Call the subscribers of topic. They may unsubscribe while called.
+    def Publish(self,topic,*args):
+        for fn in list(self.subscribers.get(topic,())):
+            fn(*args)
+
+# The bus shared by the game and its windows
+bus = EventBus()
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
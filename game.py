@@ -5,10 +5,10 @@
 import random
 import math
 import copy
+import os
 import sys
 from tkinter import messagebox
-from agentsim import GUI
-import _thread
+from agentsim import GUI,SCALED
 
 # Import network graph
 from networkgraph import *
@@ -21,11 +21,23 @@ from city import *
 from editlink import *
 from distfuncs import *
 from image import *
+from render import NetworkLayer
+from tiles import canvas_view, MARGIN
+from notify import Notifications,NotificationPanel
+from simulation import Simulation
+from routing import RoutingWorker,ParallelRouter
+from actionlog import ActionLog
+from savegame import SaveFile
+from planner import Planner
+from debuglog import log
+from tracing import tracer
+from debugflags import ACTIONS,TURN
+from events import bus,NODE_CHANGED,LINK_CHANGED,INVENTORY_CHANGED
 import store
 import editnode
 
-# Import a level
-import LEVEL1_map
+# Levels
+from level import load_level
 
 # Globals for mouse clicks.
 global lastx, lasty
@@ -35,6 +47,44 @@ global action_q
 global bg
 action_q = []
 
+# Icon files by name
+ICONS = {'sstower': 'images/tower.gif',
+         'sstower_active': 'images/tower_active.gif',
+         'node': 'images/node.gif',
+         'node_active': 'images/node_active.gif',
+         'close': 'images/close.gif',
+         'close_active': 'images/close_active.gif',
+         'addbutton': 'images/addbutton.gif',
+         'addbutton_active': 'images/addbutton_active.gif',
+         'notify': 'images/notify.gif',
+         'backpane': 'images/backpane.gif',
+         'city': 'images/city-icon.gif',
+         'city_active': 'images/city-icon_active.gif',
+         'big_city': 'images/big_city.gif',
+         'big_city_active': 'images/big_city_active.gif',
+         'town': 'images/town.gif',
+         'town_active': 'images/town_active.gif',
+
+         # Canvas submenu
+         'addnode': 'images/canvassubmenu/addnode.gif',
+         'addnode_active': 'images/canvassubmenu/addnode_active.gif',
+         'addnode_inactive': 'images/canvassubmenu/addnode_inactive.gif',
+         'delnode': 'images/canvassubmenu/delnode.gif',
+         'delnode_active': 'images/canvassubmenu/delnode_active.gif',
+         'delnode_inactive': 'images/canvassubmenu/delnode_inactive.gif',
+         'addlink': 'images/canvassubmenu/newlink.gif',
+         'addlink_active': 'images/canvassubmenu/newlink_active.gif',
+         'addlink_inactive': 'images/canvassubmenu/newlink_inactive.gif',
+         'dellink': 'images/canvassubmenu/dellink.gif',
+         'dellink_active': 'images/canvassubmenu/dellink_active.gif',
+         'dellink_inactive': 'images/canvassubmenu/dellink_inactive.gif'}
+
+# The level played
+LEVEL_FILE = 'levels/level1.lvl'
+
+# Where F5 saves the game and autosaves are written
+SAVE_FILE = 'savegame.tnt'
+
 # Change right button event
 if sys.platform == 'darwin':
     mouse_rightbtn = "<ButtonPress-2>"
@@ -52,11 +102,28 @@ until emptied every step, and the instruction swill be executed.
 Action format:
 [ <action string>, [ <action argument list. ] ]
 
+The planner's actions (see planner.Plan.Actions) refer to the nodes they
+add by the key given in the addnode action.
+
 """
 
     
 
 
+# Record the items at a node after a dialog changed them, and tell the
+# other windows showing the node.
+def node_changed(network,node):
+    action_q.append(['nodeitems',[node,copy.deepcopy(network.V_items[node])]])
+    bus.Publish(NODE_CHANGED,network,node)
+
+# Record the items at a link, and at its end nodes whose link slots they
+# use, after a dialog changed them.
+def link_changed(network,edge):
+    action_q.append(['linkitems',[edge,copy.deepcopy(network.E_items[edge])]])
+    bus.Publish(LINK_CHANGED,network,edge)
+    node_changed(network,edge[0])
+    node_changed(network,edge[1])
+
 # Event callbacks:
 
 # This event is called back when the left mouse button is pressed.
@@ -67,28 +134,50 @@ def xy(event):
     lasty = event.y
     clicked = True
 
-class Game:
-    def __init__(self,title="Telecom Network Tycoon"):
+class Game(Simulation):
+    # seed seeds the game's random number generator. If record is given the
+    # game's actions are recorded, to be saved there by SaveRecording.
+    # The game is saved to SAVE_FILE every autosave turns, if it is given.
+    # If worker is true each turn's traffic is routed in a worker thread,
+    # so the map and dialogs stay responsive while it is. If processes is
+    # given the turn's paths are found in a pool of that many processes.
+    # model is the economic model used to calculate revenue.
+    def __init__(self,title="Telecom Network Tycoon",seed=None,record=None,autosave=None,worker=False,
+                 processes=None,model='placeholder'):
 
         # Load up the asset database. This contains purchaseable items.
         self.ItemDatabase = CapitalDatabase()
 
-        # Initialize message stack. 
-        # This stack will contain the messages 
-        # which will display at turns.
-        self._messages = []
+        # Messages for the player, shown in a panel beside the map
+        self.notifications = Notifications()
         self.inventory = []
 
+        # Load the level: its cities, map and any network it starts with
+        self.level = load_level(LEVEL_FILE,self.ItemDatabase)
+
         # Initial cash
-        self.cash = 1000000
+        self.cash = self.level.cash
+
+        self.seed = seed
+        self.record = record
+        self.autosave = autosave
+
+        # The RoutingWorker routing turns, if they are routed in a thread
+        self.worker = None
+        if worker:
+            self.worker = RoutingWorker()
+        self.parallel_router = None
+        if processes:
+            self.parallel_router = ParallelRouter(processes)
         
         # let us modify the value of the global gui variable
         global gui
-        (self.economy, self.bgf,w,h) = LEVEL1_map.level1_setup()
+        (self.economy, self.bgf,w,h) = (self.level.economy,self.level.backgrounds,self.level.width,self.level.height)
+        self.economy.SetModel(model)
         
         gui = GUI(copy.copy(self.inventory),self.ItemDatabase,self.bgf,
-              init_fn=self.do_init, step_fn=self.do_turn, 
-              xmax=w,ymax=h,title=title)
+              init_fn=self.do_init, step_fn=self.do_turn, render_fn=self.do_render,
+              xmax=w,ymax=h,title=title,tiles=self.level.tiles)
 
     def start(self):
         gui.start()
@@ -96,27 +185,23 @@ class Game:
     def do_init(self):
         global lastx, lasty
 
-        # Load up a network graph object which contains the actual network
-        # Not calling the optional scale factor argument. Set to default
-        self.gameNetwork = NetworkGraph()
+        # Start the game model: the network and economy from the level,
+        # the inventory, message stack and turn counter.
+        Simulation.__init__(self,self.economy,self.cash,self.level.network,seed=self.seed)
+        self.router = self.parallel_router
+        if self.record:
+            self.recorder = ActionLog(self.ItemDatabase,self.seed,LEVEL_FILE,self.cash,
+                                      self.economy.GetModel())
 
         # Load up the canvas, load up bg
         self._canvas = gui.get_canvas()   
-        
-        # Load up the economy from the level setup. This defines cities, populations, and demand
-        # for the game engine
-        
-        # Initialize message stack
-        self._messages = []
 
         # Initialize the action queue to be empty
         global action_q
         action_q = []
 
         # Initialize game parameters:
-        self.inventory = []
         self.loans = []
-        self.turn = 1
 
         self.first_time = 0
 
@@ -134,38 +219,56 @@ class Game:
         self.cashLabel['textvariable'] = self.cashcontents
         self.cashcontents.set(' $ ' + str(self.cash))
 
+        self.notice_panel = NotificationPanel(gui.get_noticeframe(),self.notifications)
+        # Failures of the turns run since the last frame was drawn
+        self.unshown_failures = []
+        # (maintenance cost, revenue) of the last turn
+        self.last_costs = (0,0)
+        # The turn being routed by the worker and its maintenance cost
+        self.routing = None
+        # Saving waits for the turn being routed to finish
+        self.save_pending = False
+
         # Bind mouse motion events to the canvas to allow for clickable options
         self._canvas.bind("<ButtonPress-1>", xy)
         self._canvas.bind(mouse_rightbtn, xy)
         self._canvas.bind(mouse_rightbtnRel, lambda x: self.submenuother())
 
+        # F3 toggles the turn profiler and its overlay.
+        self.profile_text = None
+        gui.GetRoot().bind("<Key-F3>", lambda ev: self.ToggleProfiler())
+
+        # F5 saves the game, F9 loads the saved game.
+        self.savefile = SaveFile(SAVE_FILE,self.ItemDatabase)
+        gui.GetRoot().bind("<Key-F5>", lambda ev: self.SaveGame())
+        gui.GetRoot().bind("<Key-F9>", lambda ev: self.LoadGame())
+
+        # F7 plans a network joining the cities and builds it.
+        # Nodes added by queued plan actions, by the key the actions use
+        self.planned_nodes = {}
+        gui.GetRoot().bind("<Key-F7>", lambda ev: self.PlanNetwork())
+
             # Initialize image dictionaries
-        self.E_lines = { }
-        self.E_text = {}
-        self.E_direction_marker = { }
-        self.V_images = { }
-        self.V_notify = { }
         self.V_displays = set()
-        self.V_text = { }
         self.city_images = {}
         self.city_text = {}
 
-            # Draw cities
-        for city in self.economy.GetCities():
-            self.DrawCity(city)
+            # Draw cities. Only the cities near the view are drawn, found
+            # with the level's city grid; more are drawn as the view moves.
+        self.city_grid = self.level.grid
+        self.DrawCities()
+        gui.AddViewListener(self.DrawCities)
 
         
 
-        # Draw any inital edges which may be in the network graph
-        for edge in self.gameNetwork.GetEdges():
-            self.NewEdgeCanvas(edge)
-            
-        # Initialize dictionary of node imagery
-        
-
-        # Draw any initial nodes which may be in the network graph
-        for node in self.gameNetwork.GetNodes():
-            self.NewNodeCanvas(node)
+        # Draw the network. Only the nodes and links in view are drawn,
+        # and they are redrawn as the view moves.
+        self.layer = NetworkLayer(self._canvas,self.gameNetwork,self.icons,lambda: gui.scale)
+        self.layer.BindNodes("<ButtonRelease-1>",self.displayNode)
+        self.layer.BindNodes(mouse_rightbtnRel,self.submenuNode)
+        self.layer.BindLinks("<ButtonRelease-1>",self.editLink)
+        self.layer.BindLinks(mouse_rightbtnRel,self.submenuLink)
+        gui.AddViewListener(self.layer.Update)
 
         # Create initial submenu
         self.submenu =  CanvasSubMenu(100,100,
@@ -174,13 +277,25 @@ class Game:
 
 
 
-    # Draw cities on the canvas map
+    # Draw the cities whose range reaches into the view, or within MARGIN
+    # pixels of it, which are not drawn yet
+    def DrawCities(self):
+        scale = gui.scale
+        (x0,y0,x1,y1) = [v / scale for v in canvas_view(self._canvas)]
+        reach = MARGIN / scale + self.city_grid.max_range
+        for city in self.city_grid.InRect(x0 - reach,y0 - reach,x1 + reach,y1 + reach):
+            if city.GetName() not in self.city_images:
+                self.DrawCity(city)
+
+    # Draw cities on the canvas map, at the current zoom
     def DrawCity(self,city):
         # Get the coordinates of the city.
+        scale = gui.scale
         (x,y) = city.GetCoord()
+        (x,y,r) = (x * scale,y * scale,city.range * scale)
 
         # Show the effective radius where nodes can be placed
-        self._canvas.create_oval(x-city.range,y-city.range,x+city.range,y+city.range,outline='blue')
+        self._canvas.create_oval(x-r,y-r,x+r,y+r,outline='blue',tags=(SCALED,))
 
         
         # Draw different pictures for different populations.
@@ -191,28 +306,28 @@ class Game:
             self.city_images[city.GetName()] =  self._canvas.create_image(x,y,
                               image=self.icons['big_city'],
                               activeimage=self.icons['big_city_active'],
-                              anchor='center')
+                              anchor='center',tags=(SCALED,))
             vspace = 150
 
         elif 50000 <= city.GetPopulation() < 1000000:
             self.city_images[city.GetName()] =  self._canvas.create_image(x,y,
                               image=self.icons['city'],
                               activeimage=self.icons['city_active'],
-                              anchor='center')
+                              anchor='center',tags=(SCALED,))
             vspace = 130
 
         elif city.GetPopulation() < 50000:
             self.city_images[city.GetName()] =  self._canvas.create_image(x,y,
                               image=self.icons['town'],
                               activeimage=self.icons['town_active'],
-                              anchor='center')
+                              anchor='center',tags=(SCALED,))
             vspace = 110
 
         
         # Draw the name of the city
-        self.city_text[city.GetName()] = self._canvas.create_text(x,y + vspace,
+        self.city_text[city.GetName()] = self._canvas.create_text(x,y + vspace * scale,
                      text=city.GetName(),
-                     anchor='center',fill='white')
+                     anchor='center',fill='white',tags=(SCALED,))
 
         
 
@@ -226,89 +341,6 @@ class Game:
         messagebox.showinfo('City Info','Population:  %0.0f' % city.GetPopulation() + '\nDownlink Supply: %0.3f' %(o / 1000000000) + ' Gbit/s' + '\nUplink Supply: %0.3f' %(i / 1000000000) + ' Gbit/s')
         
 
-        # Draw a new edge on the canvas, and keep track of the canvas object handlers so it can be deleted later
-    def NewEdgeCanvas(self,edge):
-        (x1,y1) = self.gameNetwork.V_coord[edge[0]]
-        (x2,y2) = self.gameNetwork.V_coord[edge[1]]
-        x1 *= self.zoom_factor
-        x2 *= self.zoom_factor
-        y1 *= self.zoom_factor
-        y2 *= self.zoom_factor
-        # Color code nodes by operation
-        if len(self.gameNetwork.E_items[edge]) > 0:
-            fillcolor = 'green'
-        else:
-            fillcolor='black'
-
-        # Calculate new coordinates for links so bidirectional link lines do not intersect. 
-        # Have them offset slightly. Determined experimentally
-        x1 = x1 + 5 * math.cos(math.atan2(y2-y1,x2-x1) + math.pi/2)
-        x2 = x2 + 5 * math.cos(math.atan2(y2-y1,x2-x1) + math.pi/2)
-        y1 = y1 + 5 * math.sin(math.atan2(y2-y1,x2-x1) + math.pi/2)
-        y2 = y2 + 5 * math.sin(math.atan2(y2-y1,x2-x1) + math.pi/2)
-
-        # Add a little bit of separation so bidirectional links can be selected.
-        self.E_lines[edge] = self._canvas.create_line(x1,y1,x2,y2,
-                      fill=fillcolor,activefill='purple',width=3)
-                      
-        # Be sure to not obscure text and node images
-        self._canvas.tag_raise(self.V_images[edge[0]])
-        self._canvas.tag_raise(self.V_images[edge[1]])
-        self._canvas.tag_raise(self.V_text[edge[0]])
-        self._canvas.tag_raise(self.V_text[edge[1]])
-        
-        (mid_x,mid_y) = midpoint((x1,y1),(x2,y2))
-
-        # Draw arrow indicator for bidirectional links
-        (mid2_x,mid2_y) = midpoint((mid_x,mid_y),(x2,y2))
-        self.E_direction_marker[edge] = [self._canvas.create_line(mid2_x,mid2_y,
-                         mid2_x + 10 * math.cos(math.atan2(y2-y1,x2-x1) + 3.5 * math.pi/4),
-                         mid2_y + 10 * math.sin(math.atan2(y2-y1,x2-x1) + 3.5 * math.pi/4),
-                         fill='blue',width=2),
-                 self._canvas.create_line(mid2_x,mid2_y,
-                          mid2_x + 10 * math.cos(math.atan2(y2-y1,x2-x1) - 3.5 * math.pi/4),
-                          mid2_y + 10 * math.sin(math.atan2(y2-y1,x2-x1) - 3.5 * math.pi/4),
-                          fill='blue',width=2)]
-
-        # Draw distances in km at edges
-        self.E_text[edge] = self._canvas.create_text(mid_x + 20 * math.cos(math.atan2(y2-y1,x2-x1) - math.pi / 2),
-                     mid_y + 30 * math.sin(math.atan2(y2-y1,x2-x1) - math.pi / 2),
-                     anchor='center',text=('%0.2f' % (self.gameNetwork.E_lengths[edge]) + ' km'),
-                     fill='white')
-                     
-        # Attach mouse events for click regions
-        self._canvas.tag_bind(self.E_lines[edge],mouse_rightbtnRel, lambda x: self.submenuLink(edge))
-        self._canvas.tag_bind(self.E_lines[edge],"<ButtonRelease-1>", lambda x: self.editLink(edge))
-
-        # Delete a link from the canvas. Destroy object handlers to delete it from view
-    def DelLinkCanvas(self,link):
-        self._canvas.delete(self.E_lines[link])
-        for i in self.E_direction_marker[link]: self._canvas.delete(i)
-        self._canvas.delete(self.E_text[link])
-
-        # Function adds new node imagery dictionaries and canvas
-    def NewNodeCanvas(self,node):
-        (x,y) = self.gameNetwork.V_coord[node]
-        # Draw the node icon
-        x *= self.zoom_factor
-        y *= self.zoom_factor
-        self.V_images[node] = self._canvas.create_image(x,y,
-                    image=self.icons['node'],
-                    activeimage=self.icons['node_active'],
-                    anchor='center')
-        # Draw node name
-        self.V_text[node] = self._canvas.create_text(x,y + 20,
-                     text=(self.gameNetwork.V_name[node]),
-                     anchor='center',fill='white')
-        # Attach mouse events to each node iamge
-        self._canvas.tag_bind(self.V_images[node],"<ButtonRelease-1>", lambda x: self.displayNode(node))
-        self._canvas.tag_bind(self.V_images[node],mouse_rightbtnRel, lambda x: self.submenuNode(node))
-
-    # Delete a node from canvas
-    def DelNodeCanvas(self,node):
-        self._canvas.delete(self.V_images[node])
-        self._canvas.delete(self.V_text[node])
-
     # Creates an instance of a window to display the node data.
     def displayNode(self,node):
         self.V_displays.add(node)
@@ -367,47 +399,14 @@ class Game:
                      self._canvas.canvasy(lasty),
                      self._canvas,0,
                      self.icons,self.zoom_factor)
-    # Loads a dictionary of imags from files
+    # Makes the dictionary of icons. Each icon is loaded from its file the
+    # first time it is drawn, and shared through the image cache.
     def loadImages(self):
-        self.icons = { }
-        self.icons['sstower'] = PhotoImage(file = 'images/tower.gif')
-        self.icons['sstower_active'] = PhotoImage(file = 'images/tower_active.gif')
-        self.icons['node'] = PhotoImage(file = 'images/node.gif')
-        self.icons['node_active'] = PhotoImage(file = 'images/node_active.gif')
-        
-
-
-
-        
-        self.icons['close']= PhotoImage(file = 'images/close.gif')
-        self.icons['close_active']= PhotoImage(file = 'images/close_active.gif')
-        self.icons['addbutton']= PhotoImage(file = 'images/addbutton.gif')
-        self.icons['addbutton_active']= PhotoImage(file = 'images/addbutton_active.gif')
-        self.icons['notify']= PhotoImage(file = 'images/notify.gif')
-        self.icons['backpane']= PhotoImage(file = 'images/backpane.gif')
-        self.icons['city']= PhotoImage(file = 'images/city-icon.gif')
-        self.icons['city_active']= PhotoImage(file = 'images/city-icon_active.gif')
-        self.icons['big_city']= PhotoImage(file = 'images/big_city.gif')
-        self.icons['big_city_active']= PhotoImage(file = 'images/big_city_active.gif')
-        self.icons['town']= PhotoImage(file = 'images/town.gif')
-        self.icons['town_active']= PhotoImage(file = 'images/town_active.gif')
-
-        # Canvas submenu
-        self.icons['addnode']= PhotoImage(file = 'images/canvassubmenu/addnode.gif')
-        self.icons['addnode_active']= PhotoImage(file = 'images/canvassubmenu/addnode_active.gif')
-        self.icons['addnode_inactive']= PhotoImage(file = 'images/canvassubmenu/addnode_inactive.gif')
-        self.icons['delnode']= PhotoImage(file = 'images/canvassubmenu/delnode.gif')
-        self.icons['delnode_active']= PhotoImage(file = 'images/canvassubmenu/delnode_active.gif')
-        self.icons['delnode_inactive']= PhotoImage(file = 'images/canvassubmenu/delnode_inactive.gif')
-        self.icons['addlink']= PhotoImage(file = 'images/canvassubmenu/newlink.gif')
-        self.icons['addlink_active']= PhotoImage(file = 'images/canvassubmenu/newlink_active.gif')
-        self.icons['addlink_inactive']= PhotoImage(file = 'images/canvassubmenu/newlink_inactive.gif')
-        self.icons['dellink']= PhotoImage(file = 'images/canvassubmenu/dellink.gif')
-        self.icons['dellink_active']= PhotoImage(file = 'images/canvassubmenu/dellink_active.gif')
-        self.icons['dellink_inactive']= PhotoImage(file = 'images/canvassubmenu/dellink_inactive.gif')
+        self.icons = Icons(ICONS)
 
     # Most important game function
-    # Executes to carry out any operations required for a turn
+    # Executes to carry out any operations required for a turn. The GUI
+    # runs as many turns as are due each frame, then calls do_render once.
     def do_turn(self):
     
         # Tried playing. Setting -50000 was too hard.
@@ -416,6 +415,11 @@ class Game:
             messagebox.showinfo(message='YOU LOSE. YOU WENT TOO FAR INTO DEBT.\nGAME OVER')
             quit()
 
+        if self.worker != None:
+            return self.do_worker_turn()
+
+        self.profiler.Start()
+
         # Deal with action queue.
         global action_q
         
@@ -423,9 +427,70 @@ class Game:
         while len(action_q) > 0:
             action = action_q.pop(0)
             self.processAction(action)
-
-        # Calculate maintenance costs in the network
-        total_maintCost = 0
+        self.profiler.Mark('actions')
+
+        # Advance the network and the economy by one turn
+        self.last_costs = self.Step()
+
+        # Failures are shown when the frame is drawn
+        self.unshown_failures.extend(self.failures)
+
+        # Autosave writes only what changed since the last save
+        if self.autosave and self.turn % self.autosave == 0:
+            self.savefile.Update(self)
+            self.profiler.Mark('autosave')
+        self.profiler.End()
+
+    # A turn whose traffic is routed by the worker thread. Each call
+    # finishes the turn routed since the last call and starts the next, so
+    # the worker routes while the Tk thread draws and handles input.
+    # Returns False, so the GUI does not count a turn, while the worker is
+    # still routing.
+    def do_worker_turn(self):
+        self.profiler.Start()
+        finished = False
+        if self.routing != None:
+            result = self.worker.Result()
+            if result == None:
+                return False
+
+            (turn,total_maintCost) = self.routing
+            self.routing = None
+            with tracer.Span('finish turn',TURN,{'turn': turn}):
+                self.CommitCapacity(*result)
+                self.last_costs = self.FinishTurn(total_maintCost)
+            self.EndTurn(turn)
+            self.unshown_failures.extend(self.failures)
+            finished = True
+
+            if self.autosave and self.turn % self.autosave == 0:
+                self.savefile.Update(self)
+                self.profiler.Mark('autosave')
+            if self.save_pending:
+                self.SaveGame()
+
+        # Actions are carried out between turns, as the worker routes a
+        # copy of the network made when the turn starts
+        global action_q
+        while len(action_q) > 0:
+            action = action_q.pop(0)
+            self.processAction(action)
+        self.profiler.Mark('actions')
+
+        with tracer.Span('start turn',TURN,{'turn': self.turn}):
+            total_maintCost = self.StartTurn()
+            snapshot = self.SnapshotRouting()
+        self.profiler.Mark('snapshot')
+        self.routing = (self.turn,total_maintCost)
+        self.worker.Start(snapshot)
+        self.profiler.End()
+        return finished
+
+    # Show the state of the game after the turns of a frame
+    def do_render(self):
+        # The drawing phases are timed apart from the turns: Start without
+        # End records them without counting a turn.
+        self.profiler.Start()
 
         # Refresh ll stat windows, which will be need updating with new information.
         # Pass new inventory and capacity fraction indicators.
@@ -438,95 +503,22 @@ class Game:
                 # Note avoiding divide by zero error above
             else:
                 self.subwindows.remove(window)
+        self.profiler.Mark('windows')
 
-        # Updat all of the items at nides for a turn.
-        for nodeKey in self.gameNetwork.V_items.keys():
-
-            # Pay rent per step. This amounts to $1000 a month
-            total_maintCost = total_maintCost + 1.38
-
-            if not self.gameNetwork.NodeOperational(nodeKey):
-                # Show a notification item if something fails. If there is a key error in the notification dictionary,
-                # we know the image must not exist.
-                try: 
-                    self.V_notify[nodeKey]
-                except:
-                    self.V_notify[nodeKey] = self._canvas.create_image(self.gameNetwork.V_coord[nodeKey][0] - 8,
-                                   self.gameNetwork.V_coord[nodeKey ][1] - 16,
-                                   image=self.icons['notify'],
-                                   anchor='se')
-            else:
-                try: self._canvas.delete(self.V_notify[nodeKey])
-                except: pass
-            
-            # update items in the node build slots
-            for item in self.gameNetwork.V_items[nodeKey]:
-                fail = item.Update()
-                # Add a message telling what failed and where, if it did.
-                if fail == True:
-                    self._messages.append(item.GetName() + " failed at " + self.gameNetwork.V_name[nodeKey])      
-                if item.Operating():
-                    # Record maintennace cost
-                    total_maintCost = total_maintCost + item.GetMaintenance()
-
-                    # Service items that are within node items.
-                    for subitem in item.GetInventory():
-                        fail_subitem = subitem.Update()
-                        # Add a message telling what failed and where, if it did.
-                        if fail_subitem == True:
-                            self._messages.append(subitem.GetName() + " failed at " + self.gameNetwork.V_name[nodeKey])   
-                        if subitem.Operating():
-                            # Record maintennace cost
-                            total_maintCost = total_maintCost + subitem.GetMaintenance()
-        
-        # Update items at edges
-        for edgekey in self.gameNetwork.E_items.keys():
-            if len(self.gameNetwork.E_items[edgekey]) > 0:
-                self._canvas.itemconfigure(self.E_lines[edgekey],fill='green')
-            else:
-                self._canvas.itemconfigure(self.E_lines[edgekey],fill='black')
-            for item in self.gameNetwork.E_items[edgekey]:
-                fail = item.Update()
-                # Add a message telling what failed and where, if it did.
-                if fail == True:
-                    self._messages.append(item.GetName() + " failed ")
-                    
-                else:
-                    # Record maintennace cost
-                    total_maintCost = total_maintCost + item.GetMaintenance()
-
-                if not item.Operating():
-                    self._canvas.itemconfigure(self.E_lines[edgekey],fill='red')
-            
-        
-        # Update how much money to make per turn
-        revenue = 0
-
-        # Reset the capacity calculations from last time
-        self.gameNetwork.CapReset()
-        for city in self.economy.GetCities():
-            # This function needs the above reset because it calculates network bottlenecks based on current capacities
-            # caused by traffic created by other cities.
-            city.SetSupply(self.gameNetwork.CapAtCoord(city.GetCoord(),self.economy.GetCitiesCoord(),city.range))
-            # Debug
-            #print(city.GetName() + ': ' + str(city.GetSupply()))
-
-            # Add revenue to the total
-            revenue = revenue + city.Revenue()
-        
-        # Cache the capacity calculations so the data can be displayed on node displays.
-        self.gameNetwork.CapCache()
-        
-        # Update the economy 
-        self.economy.Update(self.turn)
+        # Show a notification item at nodes where something failed and
+        # colour links by the state of their items. Only the nodes and
+        # links in view whose state changed are redrawn.
+        self.layer.Refresh()
+        self.profiler.Mark('canvas')
 
-        # Update game parameters
-        self.cash = self.cash - total_maintCost + revenue
-
-        # A turn corresponds to one hour, just to check
-        self.turn = self.turn + 1
+        # Tell the player what failed since the last frame, summed up so a
+        # bad turn does not stop the game with a window per failure.
+        self.notifications.Failures(self.turn - 1,self.unshown_failures)
+        self.unshown_failures = []
+        self.profiler.Mark('notifications')
 
         # update the status display on the top bar
+        (total_maintCost,revenue) = self.last_costs
         tempstr = 'Cash:  $ %0.2f' % self.cash + '  Cost per week: $%0.2f' % (total_maintCost * 24 * 7)
         tempstr = tempstr + '  Weekly Revenue: $%0.2f' % (revenue * 24 * 7)
         tempstr = tempstr + '  Net Profit per week: $ %0.2f' % ((-total_maintCost + revenue) * 7 * 24)
@@ -534,17 +526,73 @@ class Game:
         tempstr = tempstr + '  Day: ' + str(self.turn // 24 % 365)
         tempstr = tempstr + ' Year: ' + str(self.turn  //  (365 * 24))
         self.cashcontents.set(tempstr)
-        
-        # Empty the message stack to the user. I realize it's more like a queue at this point than a stack,
-        # but the original intention was to have a fifo message box which would show previous messages and 
-        # allow the user to pop ones he didn't want to see. If we had more time, this could be implemented.
-        while len(self._messages) > 0:
-            messagebox.showinfo("Message",self._messages.pop(0),
-                icon='warning')
+        self.profiler.Mark('status')
+        self.ShowProfile()
+
+    def SaveGame(self):
+        # A turn half done is not saved; the save is made when it finishes
+        self.save_pending = self.routing != None
+        if self.save_pending:
+            return
+        self.savefile.Save(self)
+        self.notifications.Post(self.turn,'Game saved to ' + SAVE_FILE)
+
+    # Load the saved game, replacing the network on the canvas
+    def LoadGame(self):
+        if not os.path.exists(SAVE_FILE):
+            messagebox.showinfo(message='There is no saved game.')
+            return
+
+        # Close the windows on the old network and drop queued actions
+        # which refer to it.
+        for window in self.subwindows:
+            window.close()
+        self.subwindows = []
+        del action_q[:]
+
+        # The turn being routed was on the old network
+        if self.routing != None:
+            self.worker.Cancel()
+            self.routing = None
+        self.unshown_failures = []
+
+        self.savefile.Load(self)
+        bus.Publish(INVENTORY_CHANGED,self.inventory)
+        self.layer.SetNetwork(self.gameNetwork)
+
+    # Save the recorded actions for replaying
+    def SaveRecording(self):
+        if self.recorder:
+            self.recorder.Save(self.record)
+
+    # Turn the turn profiler on or off. Turning it off saves the timings
+    # to turn_profile.csv and turn_profile.json.
+    def ToggleProfiler(self):
+        if self.profiler.enabled:
+            self.profiler.Enable(False)
+            if self.profiler.turns > 0:
+                self.profiler.ExportCSV('turn_profile.csv')
+                self.profiler.ExportJSON('turn_profile.json')
+            self._canvas.delete(self.profile_text)
+            self.profile_text = None
+        else:
+            self.profiler.Reset()
+            self.profiler.Enable()
+            self.profile_text = self._canvas.create_text(0,0,anchor='nw',
+                                font=('Courier',10),fill='yellow')
+            self.ShowProfile()
+
+    # Draw the profiler's statistics in the top left of the visible map
+    def ShowProfile(self):
+        if self.profile_text == None:
+            return
+        self._canvas.coords(self.profile_text,self._canvas.canvasx(10),self._canvas.canvasy(10))
+        self._canvas.itemconfigure(self.profile_text,text=self.profiler.Text())
+        self._canvas.tag_raise(self.profile_text)
 
     # Process individual action from the action stack
     def processAction(self,action):
-        # print(action)
+        log.Log(ACTIONS,'Turn %d action %r',self.turn,action)
 
         # DIfferent actions are possible based on the item at index 0.
 
@@ -558,8 +606,19 @@ class Game:
             coord = (x , y)
             
             # add the node
-            node = self.gameNetwork.NewNode(coord,name,[])
-            self.NewNodeCanvas(node)
+            node = self.ApplyAction(['addnode',[coord,name]])
+            self.layer.AddNode(node)
+
+            # Later actions of a plan refer to the node by its key
+            if len(action[1]) > 2:
+                self.planned_nodes[action[1][2]] = node
+            return
+
+        # A link between two nodes named by a plan, which needs no confirming
+        elif action[0] == 'addlink' and len(action[1]) > 2 and action[1][2]:
+            edge = (self.PlannedNode(action[1][0]),self.PlannedNode(action[1][1]))
+            self.ApplyAction(['addlink',list(edge)])
+            self.layer.AddLink(edge)
             return
 
         elif action[0] == 'addlink':
@@ -578,15 +637,15 @@ class Game:
             if closestNode == node or distance > 100:
                 return
 
-            # ask if the user wants to add the edge.
+            # ask if the user wants to add the edge
             answer = messagebox.askyesno('Question',
                      'Add link from ' + self.gameNetwork.V_name[node] + ' to ' + self.gameNetwork.V_name[closestNode] + '?')
             if answer == False:
                 return
-            else:
-                self.gameNetwork.AddEdgeID(node,closestNode,[])
-                self.NewEdgeCanvas((node,closestNode))
-                return
+
+            self.ApplyAction(['addlink',[node,closestNode]])
+            self.layer.AddLink((node,closestNode))
+            return
 
         # Delete a node
         elif action[0] == 'delnode':
@@ -595,27 +654,10 @@ class Game:
                      'Are you sure you want to delete ' + self.gameNetwork.V_name[node_to_del] + ' and all of its contents?')
             
             if answer:
-            # Start by deleting all links attached to the node.
-            # Copy the list so you can iterate over it without changing size.
-            # Python doesn't allow iterating lists which change size.
-                adj = copy.deepcopy(self.gameNetwork.graph.vertices())
-
-                for i in adj:
-                    # We want to delete any links connected to the node
-                    # as well as the node itself.
-                    try:
-                        self.gameNetwork.DelLink((node_to_del,i))
-                        self.DelLinkCanvas((node_to_del,i))
-
-                        # Delete both ways
-                        self.gameNetwork.DelLink((i, node_to_del))
-                        self.DelLinkCanvas((i, node_to_del))
-                    except:
-                        # Kinda like "on error resume next", Visual Basic Style
-                        continue
-
-                new_inv = self.gameNetwork.DelNode(node_to_del)
-                self.DelNodeCanvas(node_to_del)
+                # Links attached to the node are deleted with it.
+                for link in self.ApplyAction(['delnode',[node_to_del]]):
+                    self.layer.DelLink(link)
+                self.layer.DelNode(node_to_del)
                 return
 
         elif action[0] == 'dellink':
@@ -623,13 +665,13 @@ class Game:
             answer = messagebox.askyesno('Warning',
                      'Are you sure you want to delete this link and all of its contents?')
             if answer:
-                self.gameNetwork.DelLink(link_to_del)
-                self.DelLinkCanvas(link_to_del)
+                self.ApplyAction(['dellink',[link_to_del]])
+                self.layer.DelLink(link_to_del)
                 return
             
 
         elif action[0] == 'subtractcash':
-            self.cash = self.cash - action[1][0]
+            self.ApplyAction(action)
             return
 
         elif action[0] == 'rescale':
@@ -641,10 +683,51 @@ class Game:
         # Change the inventory to the incoming inventory.
         elif action[0] == 'inv':
             # It seemed to be easier to replace the inventory instead of trying to determine
-            # what changed. 
-            self.inventory = copy.deepcopy(action[1])
-            global gui
-            gui.inventory = self.inventory
+            # what changed. The inventory list and open windows are told
+            # of the new inventory.
+            self.ApplyAction(action)
+
+        # A dialog changed the items at a node or link. The change is
+        # already made, so it is only recorded.
+        elif action[0] == 'nodeitems' or action[0] == 'linkitems':
+            self.RecordAction(action)
+
+        # A plan puts items at a node or link
+        elif action[0] == 'equipnode':
+            node = self.PlannedNode(action[1][0])
+            self.ApplyAction(['nodeitems',[node,action[1][1]]])
+            bus.Publish(NODE_CHANGED,self.gameNetwork,node)
+
+        elif action[0] == 'equiplink':
+            edge = (self.PlannedNode(action[1][0]),self.PlannedNode(action[1][1]))
+            self.ApplyAction(['linkitems',[edge,action[1][2]]])
+            bus.Publish(LINK_CHANGED,self.gameNetwork,edge)
+
+    # The node a plan action refers to: a node added by the plan, by key,
+    # or an existing node, by id
+    def PlannedNode(self,ref):
+        return self.planned_nodes.get(ref,ref)
+
+    # Plan a network joining the cities with the cash there is and, once
+    # the player agrees to its cost, queue the actions which build it.
+    # They are carried out between turns like the player's own.
+    def PlanNetwork(self):
+        cities = self.economy.GetCities()
+        plan = Planner(cities,self.ItemDatabase,self.cash).Plan()
+        if not plan.links:
+            messagebox.showinfo('Plan','No cities can be joined with the cash there is.')
+            return
+        try:
+            actions = plan.Actions(self.gameNetwork,self.ItemDatabase,cities,self.cash,gui.scale)
+        except ValueError as error:
+            messagebox.showinfo('Plan',str(error))
+            return
+
+        nodes = len([action for action in actions if action[0] == 'addnode'])
+        links = len([action for action in actions if action[0] == 'addlink'])
+        if messagebox.askyesno('Plan','Build %d nodes and %d links for $%0.0f?' % (nodes,links,plan.cost)):
+            self.planned_nodes = {}
+            action_q.extend(actions)
 
         
 
@@ -1,28 +1,114 @@
 
-
+from fractions import Fraction
 from tkinter import *
 
+# Images are decoded the first time they are asked for, and each scaled
+# variant is made once, from the full size image, and shared.
+class ImageCache():
+    """
+    Tests, with a stand in for PhotoImage:
+    >>> class Image():
+    ...     def __init__(self,path,size=10):
+    ...         (self.path,self.size) = (path,size)
+    ...     def zoom(self,n):
+    ...         return Image(self.path,self.size * n)
+    ...     def subsample(self,n):
+    ...         return Image(self.path,self.size // n)
+    >>> cache = ImageCache(Image)
+    >>> cache.Get('node.gif') is cache.Get('node.gif')
+    True
+    >>> cache.Get('node.gif',0.4).size, cache.Get('node.gif',0.5).size
+    (4, 5)
+    >>> cache.loads
+    1
+    """
+
+    # loader makes an image from a file; PhotoImage by default
+    def __init__(self,loader=None):
+        if loader == None:
+            loader = lambda path: PhotoImage(file=path)
+        self.loader = loader
+        # Images by (path,scale)
+        self.images = {}
+        # Number of files decoded
+        self.loads = 0
+
+    # The image in path, scaled by scale. Tk can only zoom and subsample by
+    # whole numbers, so scales are rounded to a fraction with a small
+    # denominator.
+    def Get(self,path,scale=1.0):
+        key = (path,scale)
+        if key in self.images:
+            return self.images[key]
+
+        if scale == 1.0:
+            image = self.loader(path)
+            self.loads = self.loads + 1
+        else:
+            fraction = Fraction(scale).limit_denominator(10)
+            image = self.Get(path)
+            if fraction.numerator != 1:
+                image = image.zoom(fraction.numerator)
+            image = image.subsample(fraction.denominator)
+        self.images[key] = image
+        return image
+
+    def Clear(self):
+        self.images = {}
+
+# The image cache shared by everything drawn on the canvas
+images = ImageCache()
+
+# A dictionary of icons by name which loads each icon the first time it is
+# looked up.
+class Icons():
+    """
+    Tests:
+    >>> icons = Icons({'node': 'node.gif','close': 'close.gif'},ImageCache(lambda path: path))
+    >>> icons['node'], len(icons), icons.cache.loads
+    ('node.gif', 2, 1)
+    """
+
+    # paths are the image files by icon name
+    def __init__(self,paths,cache=images,scale=1.0):
+        self.paths = paths
+        self.cache = cache
+        self.scale = scale
+
+    def __getitem__(self,name):
+        return self.cache.Get(self.paths[name],self.scale)
+
+    def __contains__(self,name):
+        return name in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def keys(self):
+        return self.paths.keys()
+
+    # The same icons at another scale
+    def Scaled(self,scale):
+        return Icons(self.paths,self.cache,scale)
+
 class ScaleableImage():
-    def __init__(self,x,y,img,scale,canvas,activeimage=None,anchor='cemter'):
+    def __init__(self,x,y,path,scale,canvas,activepath=None,anchor='center'):
         self.scale = scale
         self.x = x
         self.y = y
         self.anchor = anchor
 
-        self.img = img
-        if activeimage == None:
-            self.aimg = img
+        self.path = path
+        if activepath == None:
+            self.apath = path
         else:
-            self.aimg = activeimage
-
-        self.img40 = self.img.zoom(int(self.img.width() * 0.4),int(self.img.height() * 0.4))
-        self.img60 = self.img.zoom(int(self.img.width() * 0.6),int(self.img.height() * 0.6))
-        self.img80 = self.img.zoom(int(self.img.width() * 0.8),int(self.img.height() * 0.8))
-
-        self.aimg40 = self.aimg.zoom(int(self.aimg.width() * 0.4),int(self.aimg.height() * 0.4))
-        self.aimg60 = self.aimg.zoom(int(self.aimg.width() * 0.6),int(self.aimg.height() * 0.6))
-        self.aimg80 = self.aimg.zoom(int(self.aimg.width() * 0.8),int(self.aimg.height() * 0.8))
+            self.apath = activepath
 
+        # The scaled images are shared through the image cache, so each
+        # instance only holds its canvas item.
         self.id = None
         self.canvas = canvas
 
@@ -31,25 +117,12 @@ class ScaleableImage():
         if self.id:
             self.canvas.delete(self.id)
 
-        if scale == 0.4:
-            self.canvas.create_image(self.x,self.y,
-                                image=self.img40,
-                                activeimage=self.aimg40,
-                                anchor=self.anchor)
-        elif scale == 0.6:
-            self.canvas.create_image(self.x,self.y,
-                                image=self.img60,
-                                activeimage=self.aimg60,
-                                anchor=self.anchor)
-
-        elif scale == 0.8:
-            self.canvas.create_image(self.x,self.y,
-                                image=self.img80,
-                                activeimage=self.aimg80,
-                                anchor=self.anchor)
+        self.scale = scale
+        self.id = self.canvas.create_image(self.x,self.y,
+                            image=images.Get(self.path,scale),
+                            activeimage=images.Get(self.apath,scale),
+                            anchor=self.anchor)
 
-        else:
-            self.canvas.create_image(self.x,self.y,
-                                image=self.img,
-                                activeimage=self.aimg,
-                                anchor=self.anchor)
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
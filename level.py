@@ -0,0 +1,255 @@
+# level.py
+# Loads levels from level files.
+#
+# A level file is made of sections, each started by a [name] line and
+# holding comma separated rows. Lines starting with # are comments.
+#
+#     [level]          key,value rows: name, width, height, cash, tiles
+#     [backgrounds]    image paths, from the most zoomed out to full size
+#     [cities]         name,x,y,population[,growth_factor[,range]]
+#     [nodes]          id,x,y,name[,items]           (optional)
+#     [links]          start,end[,items]             (optional)
+#
+# tiles is an optional tile set directory for the backgrounds, made with
+# tiles.py.
+#
+# Items are catalog references separated by spaces, with the items inside
+# a structure in brackets, e.g. "Tower:0 Building:1(Router:0 Router:2)".
+# Node ids are only used to refer to nodes in the links section. Each link
+# row is one direction of a link.
+#
+# The file is read a row at a time, so only the level itself is kept in
+# memory. Cities are put in a grid as they are read, so the cities near a
+# point can be found without looking at all of them; the game uses it to
+# draw only the cities near the view.
+
+import csv
+import math
+import re
+
+from city import City
+from economic import Economic
+from database import CapitalDatabase
+from networkgraph import NetworkGraph
+
+# Size of the city grid cells, in map units
+GRID_CELL = 500
+
+class CityGrid():
+    """
+    Tests:
+    >>> grid = CityGrid(100)
+    >>> for (name,x,y) in (('A',0,0),('B',150,0),('C',1000,1000)):
+    ...     grid.Add(City(name,x,y,1000))
+    >>> sorted(city.GetName() for city in grid.Near((10,0),200))
+    ['A', 'B']
+    >>> [city.GetName() for city in grid.InRect(900,900,2000,2000)]
+    ['C']
+
+    Cities whose range covers a point:
+    >>> round(grid.Get('A').range,1)
+    80.0
+    >>> [city.GetName() for city in grid.Covering((60,0))]
+    ['A']
+    """
+
+    def __init__(self,cell=GRID_CELL):
+        self.cell = cell
+        # Lists of cities by (column,row)
+        self.cells = {}
+        self.by_name = {}
+        self.max_range = 0
+
+    def Add(self,city):
+        key = (int(city.x // self.cell),int(city.y // self.cell))
+        self.cells.setdefault(key,[]).append(city)
+        self.by_name[city.GetName()] = city
+        if city.range > self.max_range:
+            self.max_range = city.range
+
+    def Get(self,name):
+        return self.by_name[name]
+
+    # Cities with x0 <= x < x1 and y0 <= y < y1
+    def InRect(self,x0,y0,x1,y1):
+        found = []
+        for i in range(int(x0 // self.cell),int(x1 // self.cell) + 1):
+            for j in range(int(y0 // self.cell),int(y1 // self.cell) + 1):
+                for city in self.cells.get((i,j),()):
+                    if x0 <= city.x < x1 and y0 <= city.y < y1:
+                        found.append(city)
+        return found
+
+    # Cities within radius of coord
+    def Near(self,coord,radius):
+        (x,y) = coord
+        found = []
+        for city in self.InRect(x - radius,y - radius,x + radius,y + radius):
+            if math.hypot(city.x - x,city.y - y) <= radius:
+                found.append(city)
+        return found
+
+    # Cities whose range covers coord
+    def Covering(self,coord):
+        (x,y) = coord
+        found = []
+        for city in self.Near(coord,self.max_range):
+            if math.hypot(city.x - x,city.y - y) <= city.range:
+                found.append(city)
+        return found
+
+class Level():
+    def __init__(self):
+        self.name = ''
+        self.width = 1000
+        self.height = 1000
+        self.cash = 1000000
+        self.backgrounds = []
+        self.tiles = None
+        self.cities = []
+        self.grid = CityGrid()
+        self.network = NetworkGraph()
+        self.economy = None
+
+ITEM = re.compile(r'(\w+):(\d+)(?:\(([^)]*)\))?')
+
+# Make the items of a level file item list
+def parse_items(database,text):
+    """
+    Tests:
+    >>> items = parse_items(CapitalDatabase(),'Tower:0 Building:1(Router:0 Router:2)')
+    >>> [type(item).__name__ for item in items]
+    ['Tower', 'Building']
+    >>> len(items[1].GetInventory())
+    2
+    """
+    items = []
+    for (kind,id,inside) in ITEM.findall(text):
+        item = database.GetItem(kind,int(id))
+        if inside:
+            for sub in parse_items(database,inside):
+                if not item.AddItem(sub):
+                    raise ValueError('too many items in ' + item.GetName())
+        items.append(item)
+    return items
+
+# The (section,row) of each row of a level file
+def rows(lines):
+    section = None
+    for row in csv.reader(lines):
+        if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+            continue
+        first = row[0].strip()
+        if len(row) == 1 and first.startswith('[') and first.endswith(']'):
+            section = first[1:-1]
+            continue
+        yield (section,[field.strip() for field in row])
+
+# Load a level. source is a file name or an open file.
+def load_level(source,database=None):
+    """
+    Tests:
+    >>> import io
+    >>> text = '''
+    ... [level]
+    ... name,Test
+    ... width,800
+    ... height,600
+    ... [cities]
+    ... # name,x,y,population
+    ... "Calgary, AB",100,100,1000000
+    ... Airdrie,150,50,60000,1
+    ... [nodes]
+    ... 1,100,100,Calgary node,Tower:0 Building:0(Router:0)
+    ... 2,150,50,Airdrie node,Tower:0
+    ... [links]
+    ... 1,2,Radio:0
+    ... '''
+    >>> level = load_level(io.StringIO(text))
+    >>> (level.name, level.width, len(level.cities), level.cities[0].GetName())
+    ('Test', 800, 2, 'Calgary, AB')
+    >>> network = level.network
+    >>> sorted(network.V_name.values())
+    ['Airdrie node', 'Calgary node']
+    >>> [item.GetName() for item in network.E_items[(1,2)]] == [CapitalDatabase().GetRadio(0).GetName()]
+    True
+    >>> [city.GetName() for city in level.grid.Near((140,60),20)]
+    ['Airdrie']
+
+    >>> level = load_level('levels/level1.lvl')
+    >>> (level.width, level.height, len(level.backgrounds))
+    (6000, 10828, 4)
+    >>> level.grid.Get('Drumheller').GetCoord()
+    (3702.0, 49.0)
+    """
+    if database == None:
+        database = CapitalDatabase()
+
+    if isinstance(source,str):
+        with open(source,newline='') as inFile:
+            return read_level(inFile,database,source)
+    return read_level(source,database,'level')
+
+def read_level(lines,database,filename):
+    level = Level()
+    network = level.network
+    # Network node ids by level file node id
+    nodes = {}
+
+    for (section,row) in rows(lines):
+        try:
+            if section == 'level':
+                (key,value) = row[:2]
+                if key == 'name':
+                    level.name = value
+                elif key == 'width':
+                    level.width = int(value)
+                elif key == 'height':
+                    level.height = int(value)
+                elif key == 'cash':
+                    level.cash = int(value)
+                elif key == 'tiles':
+                    level.tiles = value
+
+            elif section == 'backgrounds':
+                level.backgrounds.append(row[0])
+
+            elif section == 'cities':
+                (name,x,y,population) = row[:4]
+                growth = 1
+                if len(row) > 4:
+                    growth = float(row[4])
+                city = City(name,float(x),float(y),int(population),growth)
+                if len(row) > 5:
+                    city.range = float(row[5])
+                level.cities.append(city)
+                level.grid.Add(city)
+
+            elif section == 'nodes':
+                (id,x,y,name) = row[:4]
+                items = []
+                if len(row) > 4:
+                    items = parse_items(database,row[4])
+                nodes[id] = network.NewNode((float(x),float(y)),name,items)
+
+            elif section == 'links':
+                edge = (nodes[row[0]],nodes[row[1]])
+                network.AddEdgeID(edge[0],edge[1],[])
+                if len(row) > 2:
+                    for item in parse_items(database,row[2]):
+                        if item.type() == 'Wired':
+                            item.SetWireMaxCapacity(network.E_lengths[edge])
+                        if not network.AddItemToEdge(edge,item):
+                            raise ValueError('no link slots for ' + item.GetName())
+
+            else:
+                raise ValueError('row outside a known section')
+        except (ValueError,KeyError) as error:
+            raise ValueError('%s, section %s, row %s: %s' % (filename,section,','.join(row),error))
+
+    level.economy = Economic(level.cities)
+    return level
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,102 @@
+# listview.py
+# Shows a long list of names in a Tk Listbox a screenful at a time.
+#
+# The listbox only ever holds the rows in view. Setting new names, or
+# scrolling, compares the rows which should be in view with those in the
+# listbox and only deletes and inserts the rows which differ, so a list
+# which did not change costs nothing to show again however long it is.
+
+from difflib import SequenceMatcher
+
+class VirtualList():
+    """
+    Tests, with a stand in for the listbox which records calls:
+    >>> class Listbox():
+    ...     def __init__(self):
+    ...         (self.rows,self.calls) = ([],[])
+    ...     def cget(self,option):
+    ...         return 3
+    ...     def insert(self,index,*names):
+    ...         self.rows[index:index] = names
+    ...         self.calls.append(('insert',index) + names)
+    ...     def delete(self,first,last):
+    ...         del self.rows[first:last + 1]
+    ...         self.calls.append(('delete',first,last))
+    >>> listbox = Listbox()
+    >>> view = VirtualList(listbox)
+    >>> view.Set(['Tower','Radio','Router','Wire','Building'])
+    >>> listbox.rows
+    ['Tower', 'Radio', 'Router']
+
+    Setting the same names again does nothing; a change only touches the
+    rows which differ:
+    >>> del listbox.calls[:]
+    >>> view.Set(['Tower','Radio','Router','Wire','Building'])
+    >>> view.Set(['Tower','Router','Wire','Building'])
+    >>> listbox.rows, listbox.calls
+    (['Tower', 'Router', 'Wire'], [('insert', 3, 'Wire'), ('delete', 1, 1)])
+
+    Scrolling shows the rows below:
+    >>> view.Scroll('scroll',1,'units')
+    >>> listbox.rows, view.top
+    (['Router', 'Wire', 'Building'], 1)
+    >>> view.Scroll('moveto',0.0)
+    >>> listbox.rows
+    ['Tower', 'Router', 'Wire']
+    """
+
+    # listbox shows rows names at a time, by default its height.
+    # scrollbar is set to show the part of the list in view.
+    def __init__(self,listbox,scrollbar=None,rows=None):
+        self.listbox = listbox
+        self.scrollbar = scrollbar
+        if rows == None:
+            rows = int(listbox.cget('height'))
+        self.rows = rows
+        # All of the names, and those in the listbox
+        self.names = []
+        self.shown = []
+        # Index of the first name in view
+        self.top = 0
+
+    def Set(self,names):
+        self.names = list(names)
+        self._Draw()
+
+    # Scrollbar command: 'moveto',fraction or 'scroll',n,'units'/'pages'
+    def Scroll(self,*args):
+        if args[0] == 'moveto':
+            self.top = int(round(float(args[1]) * len(self.names)))
+        elif args[0] == 'scroll':
+            n = int(args[1])
+            if args[2] == 'pages':
+                n = n * self.rows
+            self.top = self.top + n
+        self._Draw()
+
+    # Bring the listbox up to date with the names in view
+    def _Draw(self):
+        self.top = max(0,min(self.top,len(self.names) - self.rows))
+        view = self.names[self.top:self.top + self.rows]
+        if view != self.shown:
+            opcodes = SequenceMatcher(None,self.shown,view,autojunk=False).get_opcodes()
+            # From the end, so the indices of earlier rows do not move
+            for (tag,i1,i2,j1,j2) in reversed(opcodes):
+                if tag == 'equal':
+                    continue
+                if j2 > j1:
+                    self.listbox.insert(i2,*view[j1:j2])
+                if i2 > i1:
+                    self.listbox.delete(i1,i2 - 1)
+            self.shown = view
+
+        if self.scrollbar != None:
+            if self.names:
+                self.scrollbar.set(self.top / len(self.names),
+                                   min(1.0,(self.top + self.rows) / len(self.names)))
+            else:
+                self.scrollbar.set(0.0,1.0)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -5,18 +5,49 @@ Main Game Starter
 
 import sys
 import random
+import argparse
+import atexit
 from game import *
 import agentsim
+from tracing import tracer
+from debuglog import log
+from debugflags import TURN,CAPACITY,ITEMS
 
 global playinggame
 
 arg_debug = 0
 
 def main():
+    global arg_debug
+    parser = argparse.ArgumentParser(description='Telecom Network Tycoon')
+    parser.add_argument('--debug',type=int,default=0,help='value of the agentsim.debug flag')
+    parser.add_argument('--trace',help='save a Chrome trace of the game to this file on exit')
+    parser.add_argument('--record',help='record the game to this file on exit, for actionlog.py to replay')
+    parser.add_argument('--seed',type=int,help='seed for the random number generator')
+    parser.add_argument('--autosave',type=int,help='save the game every this many turns')
+    parser.add_argument('--worker',action='store_true',help='route traffic in a worker thread, so the map stays responsive on large maps')
+    parser.add_argument('--processes',type=int,help="find each turn's paths in a pool of this many processes")
+    parser.add_argument('--model',choices=MODELS,default='placeholder',help='economic model used to calculate revenue')
+    args = parser.parse_args()
+
+    arg_debug = args.debug
+    if args.trace and not arg_debug:
+        arg_debug = TURN | CAPACITY | ITEMS
+    agentsim.debug.set(arg_debug)
+    atexit.register(log.Flush)
+    if args.trace:
+        atexit.register(tracer.Save,args.trace)
+
     global action_stack
     action_stack = []
     global playinggame
-    playinggame = Game(title="Telecom Network Tycoon")
+    playinggame = Game(title="Telecom Network Tycoon",seed=args.seed,record=args.record,
+                       autosave=args.autosave,worker=args.worker,
+                       processes=args.processes,model=args.model)
+    if args.record:
+        atexit.register(playinggame.SaveRecording)
+    if args.processes:
+        atexit.register(playinggame.parallel_router.Close)
     playinggame.start()
 
 if __name__ == "__main__":
@@ -5,6 +5,9 @@ from digraph import Digraph
 import dyjkstra
 import math
 
+from debuglog import log
+from debugflags import CAPACITY
+
 from capital import *
 
 class NetworkGraph:
@@ -417,7 +420,15 @@ class NetworkGraph:
 	# Premise is to use Dyjkstra's algorithm from every node near a city to every other node near every other city.
 	# While doing so, we will add up the current traffic flows through links and nodes in order to figure out
 	# how saturated links are, and restrict traffic flow accordingly.
-	def CapAtCoord(self,pt,to_pts,range):
+	# paths optionally holds the least cost path of each (start,end) pair
+	# of nodes, found beforehand; see routing.ParallelRouter.
+	def CapAtCoord(self,pt,to_pts,range,paths=None):
+		(closest,to_nodes) = self.RouteEnds(pt,to_pts,range)
+		return self.CapBetween(pt,closest,to_nodes,paths)
+
+	# The nodes within range of pt, and the node nearest each of the other
+	# points, if there is one within 100 units
+	def RouteEnds(self,pt,to_pts,range):
 		(x, y) = pt
 
 		# Make a list of nodes which are within 100 units of the point.
@@ -435,7 +446,11 @@ class NetworkGraph:
 			n = self.ReturnClosePointThresh(pts,100)
 			if n:
 				to_nodes.append(n[0])
+		return (closest,to_nodes)
 
+	# Route traffic between the nodes near a point and the nodes near the
+	# other points. Returns the (outgoing,incoming) supply at the point.
+	def CapBetween(self,pt,closest,to_nodes,paths=None):
 		# we now can calculate the available bandwidth from every city to every other city
 
 		# Now step over the list and find paths for the outgoing supply
@@ -445,18 +460,19 @@ class NetworkGraph:
 				if to_node == node: continue
 				
 				# Find the path to the other node
-				path = dyjkstra.least_cost_path(self.graph,node,to_node,self.cost)
+				if paths == None:
+					path = dyjkstra.least_cost_path(self.graph,node,to_node,self.cost)
+				else:
+					path = paths[(node,to_node)]
 				if not path:
 					continue
 				
 				# Step through the path and see how much bandwidth is available
 				index = 0
-				
-				#print('Outgoing start:')
 
 				# If the edge does not have enough caacity, cap flow at this amount
 				cur_cap = self.cap_at_edge[(path[0],path[1])]
-				#print(cur_cap)
+				log.Log(CAPACITY,'Outgoing path %s, first link capacity %s',path,cur_cap)
 				while index < len(path) - 1 and cur_cap > 0:
 					# Step through and calculate bandwidth
 					
@@ -486,16 +502,18 @@ class NetworkGraph:
 				if to_node == node: continue
 				
 				# Find the path to the other node
-				path = dyjkstra.least_cost_path(self.graph,node,to_node,self.cost)
+				if paths == None:
+					path = dyjkstra.least_cost_path(self.graph,node,to_node,self.cost)
+				else:
+					path = paths[(node,to_node)]
 				if not path:
 					continue
 				
 				# Step through the path and see how much bandwidth is available
 				index = 0
-				#print('Incoming start:')
-				
+
 				cur_cap = self.cap_at_edge[(path[0],path[1])]
-				#print(cur_cap)
+				log.Log(CAPACITY,'Incoming path %s, first link capacity %s',path,cur_cap)
 				while index < len(path) - 1 and cur_cap > 0:
 					# Step through and calculate bandwidth
 					
@@ -519,7 +537,7 @@ class NetworkGraph:
 				total_incoming_supply = total_incoming_supply + cur_cap
 		
 		# Return the values
-		#print(str(total_outgoing_supply) + ' ' + str(total_incoming_supply))
+		log.Log(CAPACITY,'Supply at %s: outgoing %s, incoming %s',pt,total_outgoing_supply,total_incoming_supply)
 		return (total_outgoing_supply,total_incoming_supply)
 		
 				
@@ -5,11 +5,14 @@ from tkinter import *
 import copy
 
 from game import *
+import game
 from capital import *
 from database import *
 from networkgraph import *
 from subslotedit import *
 from getvaluedialog import *
+from debuglog import log
+from debugflags import AGENTSIM
 from editnode import *
 
 import random
@@ -30,7 +33,7 @@ class NodeDisplay():
         self.inventory = inventory
         self.closed = False
 
-        # print(cap_fraction)
+        log.Log(AGENTSIM,'Node %s display, capacity fraction %s',node_num,cap_fraction)
 
         # Use a dictionary to get slot index from ID
         self.slot_dict = { }
@@ -232,6 +235,7 @@ class NodeDisplay():
         data = self.entry0.get()
         if data:
             self.item_to_change.SetMaintenance(float(data) / 24 / 7)
+            game.node_changed(self.network,self.node)
             self.top.destroy()
             self.refresh()
 
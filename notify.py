@@ -0,0 +1,121 @@
+# notify.py
+# Messages for the player, shown in a panel which never stops the game.
+#
+# The failures of a turn are summed up by kind of item and place, e.g.
+# "12 radios failed across 5 links", rather than shown one at a time. The
+# panel keeps the latest HISTORY messages, newest first.
+
+from collections import deque
+from tkinter import *
+
+from listview import VirtualList
+
+# Messages kept
+HISTORY = 200
+
+# What the failures of each type of item are called
+PLURALS = {'Structure': 'towers and buildings',
+           'Radio': 'radios',
+           'Router': 'routers',
+           'Wired': 'wired connections'}
+
+# The time of a turn, as shown in the status bar
+def turn_label(turn):
+    return 'Day %d %02d:00' % (turn // 24 % 365,turn % 24)
+
+# Sum up a turn's failures. failures are (item,place,place name), where the
+# place is a node or a link (a tuple of nodes).
+def summarize_failures(failures):
+    """
+    Tests:
+    >>> from database import CapitalDatabase
+    >>> data = CapitalDatabase()
+    >>> radio = data.GetRadio(0)
+    >>> failures = [(data.GetRadio(0),(1,2),'A to B'),(data.GetRadio(0),(2,3),'B to C'),
+    ...             (data.GetRadio(0),(2,3),'B to C'),(data.GetTower(0),1,'A')]
+    >>> for line in summarize_failures(failures):
+    ...     print(line.replace(data.GetTower(0).GetName(),'<tower>'))
+    3 radios failed across 2 links
+    <tower> failed at A
+    """
+    # [count,places,first failure] by (type,place is a link)
+    groups = {}
+    for (item,place,name) in failures:
+        key = (item.type(),isinstance(place,tuple))
+        if key not in groups:
+            groups[key] = [0,set(),(item,name)]
+        group = groups[key]
+        group[0] = group[0] + 1
+        group[1].add(place)
+
+    lines = []
+    for ((kind,link),(count,places,(item,name))) in groups.items():
+        if count == 1:
+            lines.append(item.GetName() + ' failed at ' + name)
+        elif len(places) == 1:
+            lines.append('%d %s failed at %s' % (count,PLURALS.get(kind,kind),name))
+        else:
+            lines.append('%d %s failed across %d %s' % (count,PLURALS.get(kind,kind),len(places),
+                                                       'links' if link else 'nodes'))
+    return lines
+
+class Notifications():
+    """
+    Tests:
+    >>> notes = Notifications(history=2)
+    >>> shown = []
+    >>> notes.listeners.append(lambda: shown.append(len(notes.messages)))
+    >>> for text in ('one','two','three'):
+    ...     notes.Post(30,text)
+    >>> list(notes.messages), shown
+    (['Day 1 06:00  three', 'Day 1 06:00  two'], [1, 2, 2])
+    """
+
+    def __init__(self,history=HISTORY):
+        # Newest first
+        self.messages = deque(maxlen=history)
+        # Functions called when messages are posted
+        self.listeners = []
+
+    def Post(self,turn,*texts):
+        if not texts:
+            return
+        for text in texts:
+            self.messages.appendleft(turn_label(turn) + '  ' + text)
+        for fn in self.listeners:
+            fn()
+
+    def Failures(self,turn,failures):
+        self.Post(turn,*summarize_failures(failures))
+
+    def Clear(self):
+        self.messages.clear()
+        for fn in self.listeners:
+            fn()
+
+# A panel showing the notifications in a frame of the main window
+class NotificationPanel():
+    def __init__(self,parent,notifications,rows=8):
+        self.notifications = notifications
+
+        self.frame = Frame(parent)
+        self.frame.pack(anchor='w', fill='x')
+        self.title = Label(self.frame,text='Messages:',anchor='w')
+        self.title.pack(side='top',anchor='w')
+        self.clear_button = Button(self.frame,text='Clear',command=notifications.Clear)
+        self.clear_button.pack(side='bottom',fill='x')
+        self.list = Listbox(self.frame,height=rows,width=40)
+        self.list.pack(side='left',fill='x')
+        self.scroll = Scrollbar(self.frame,orient=VERTICAL)
+        self.scroll.pack(side='right',fill='y')
+
+        self.view = VirtualList(self.list,self.scroll)
+        self.scroll.configure(command=self.view.Scroll)
+        notifications.listeners.append(self.Refresh)
+
+    def Refresh(self):
+        self.view.Set(self.notifications.messages)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
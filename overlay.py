@@ -0,0 +1,287 @@
+# overlay.py
+# Copy-on-write "what if" views of a NetworkGraph.
+#
+# An OverlayGraph behaves like the NetworkGraph it was made from, but every
+# change (new nodes, links, items) is kept in the overlay. The base graph is
+# never touched, so hypothetical builds can be scored and thrown away.
+
+import copy
+from collections.abc import MutableMapping
+
+from digraph import Digraph
+from networkgraph import NetworkGraph
+
+# A dictionary which reads through to a base dictionary. Writes and deletes
+# are kept locally, so the base is never changed.
+class OverlayDict(MutableMapping):
+    """
+    Tests:
+    >>> base = {1: 'a', 2: 'b'}
+    >>> d = OverlayDict(base)
+    >>> d[3] = 'c'
+    >>> del d[1]
+    >>> sorted(d.items())
+    [(2, 'b'), (3, 'c')]
+    >>> base
+    {1: 'a', 2: 'b'}
+    >>> sorted(d.Touched())
+    [1, 3]
+    """
+
+    def __init__(self,base):
+        self.base = base
+        self.local = {}
+        self.deleted = set()
+
+    def __getitem__(self,key):
+        if key in self.local:
+            return self.local[key]
+        if key in self.deleted:
+            raise KeyError(key)
+        return self.base[key]
+
+    def __setitem__(self,key,value):
+        self.local[key] = value
+        self.deleted.discard(key)
+
+    def __delitem__(self,key):
+        if key in self.local:
+            del self.local[key]
+            if key in self.base:
+                self.deleted.add(key)
+        elif key in self.base and key not in self.deleted:
+            self.deleted.add(key)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self,key):
+        if key in self.local:
+            return True
+        return key in self.base and key not in self.deleted
+
+    def __iter__(self):
+        if not self.local and not self.deleted:
+            return iter(self.base)
+        return self._iter()
+
+    def _iter(self):
+        for key in self.base:
+            if key not in self.local and key not in self.deleted:
+                yield key
+        for key in self.local:
+            yield key
+
+    def __len__(self):
+        n = len(self.base) - len(self.deleted)
+        for key in self.local:
+            if key not in self.base or key in self.deleted:
+                n = n + 1
+        return n
+
+    # Returns True if the key has a local copy
+    def Owned(self,key):
+        return key in self.local
+
+    # The keys which differ from the base
+    def Touched(self):
+        return set(self.local) | self.deleted
+
+# A Digraph layered over another one. Adjacency sets are copied the first
+# time they are changed.
+class OverlayDigraph(Digraph):
+    """
+    Tests:
+    >>> G = Digraph([(1, 2), (2, 3)])
+    >>> H = OverlayDigraph(G)
+    >>> H.add_edge((3, 4))
+    >>> H.del_edge((1, 2))
+    >>> sorted(H.edges())
+    [(2, 3), (3, 4)]
+    >>> sorted(G.edges())
+    [(1, 2), (2, 3)]
+    """
+
+    def __init__(self,base):
+        self._tosets = OverlayDict(base._tosets)
+        self._fromsets = OverlayDict(base._fromsets)
+
+    # Make a local copy of a vertex's adjacency set before changing it
+    def _own(self,sets,v):
+        if not sets.Owned(v):
+            sets[v] = set(sets[v])
+        return sets[v]
+
+    def add_vertex(self,v):
+        if v not in self._tosets:
+            self._tosets[v] = set()
+            self._fromsets[v] = set()
+
+    def add_edge(self,e):
+        for v in e:
+            self.add_vertex(v)
+
+        self._own(self._tosets,e[0]).add(e[1])
+        self._own(self._fromsets,e[1]).add(e[0])
+
+    def del_edge(self,e):
+        self._own(self._tosets,e[0]).remove(e[1])
+        self._own(self._fromsets,e[1]).remove(e[0])
+
+    # Vertices whose adjacency differs from the base
+    def Touched(self):
+        return self._tosets.Touched() | self._fromsets.Touched()
+
+# Compile the maximum capacities of every node and edge of a network.
+# These are the values CapReset starts a turn with.
+def BaseCaps(network):
+    node_caps = {}
+    edge_caps = {}
+    for n in network.graph.vertices():
+        node_caps[n] = network.MaxCapAtNode(n)
+    for e in network.graph.edges():
+        edge_caps[e] = network.MaxCapAtEdge(e)
+    return (node_caps,edge_caps)
+
+class OverlayGraph(NetworkGraph):
+    """
+    Tests:
+    >>> from database import CapitalDatabase
+    >>> data = CapitalDatabase()
+    >>> base = NetworkGraph()
+    >>> a = base.NewNode((0,0),'A',[data.GetTower(0)])
+    >>> b = base.NewNode((100,0),'B',[data.GetTower(0)])
+    >>> base.AddEdgeID(a,b,[])
+
+    Build a new node and a radio link in the overlay:
+    >>> what_if = OverlayGraph(base)
+    >>> c = what_if.NewNode((0,100),'C',[data.GetTower(0)])
+    >>> what_if.AddEdgeID(a,c,[])
+    >>> what_if.AddItemToEdge((a,b),data.GetRadio(0))
+    True
+    >>> len(what_if.GetNodes()), len(what_if.E_items[(a,b)])
+    (3, 1)
+
+    The base is untouched:
+    >>> len(base.GetNodes()), len(base.E_items[(a,b)]), base.V_items[a][0].GetCurLinkSlots()
+    (2, 0, 0)
+
+    Capacities match a full reset of the same network:
+    >>> what_if.CapReset()
+    >>> full = copy.deepcopy(base)
+    >>> c = full.NewNode((0,100),'C',[data.GetTower(0)])
+    >>> full.AddEdgeID(a,c,[])
+    >>> full.AddItemToEdge((a,b),data.GetRadio(0))
+    True
+    >>> full.CapReset()
+    >>> what_if.cap_at_node == full.cap_at_node and what_if.cap_at_edge == full.cap_at_edge
+    True
+    """
+
+    # base is the NetworkGraph to layer over. base_caps is an optional
+    # result of BaseCaps(base), so many overlays can share the work.
+    def __init__(self,base,base_caps=None):
+        self.base = base
+        self.graph = OverlayDigraph(base.graph)
+        self.vertex_counter = base.vertex_counter
+        self.max_slots = base.max_slots
+        self.scale_factor = base.scale_factor
+
+        self.V_coord = OverlayDict(base.V_coord)
+        self.V_name = OverlayDict(base.V_name)
+        self.V_items = OverlayDict(base.V_items)
+        self.E_items = OverlayDict(base.E_items)
+        self.E_lengths = OverlayDict(base.E_lengths)
+
+        if base_caps == None:
+            base_caps = BaseCaps(base)
+        self.base_caps = base_caps
+
+        self.cap_at_node = {}
+        self.cap_at_edge = {}
+        self.cap_at_node_cached = {}
+        self.cap_at_edge_cached = {}
+
+    # Items at a node, copied into the overlay so they can be changed
+    def NodeItemsForEdit(self,node):
+        if not self.V_items.Owned(node):
+            self.V_items[node] = copy.deepcopy(self.V_items[node])
+        return self.V_items[node]
+
+    # Items at an edge, copied into the overlay so they can be changed
+    def EdgeItemsForEdit(self,edge):
+        if not self.E_items.Owned(edge):
+            self.E_items[edge] = copy.deepcopy(self.E_items[edge])
+        return self.E_items[edge]
+
+    def AddItemsToNode(self,node_name,items):
+        self.NodeItemsForEdit(self.GetNodeNumber(node_name))
+        NetworkGraph.AddItemsToNode(self,node_name,items)
+
+    def RemoveItemsFromNode(self,node_name,items):
+        self.NodeItemsForEdit(self.GetNodeNumber(node_name))
+        NetworkGraph.RemoveItemsFromNode(self,node_name,items)
+
+    # Link items use up link slots on the structures at both ends
+    def AddItemToEdge(self,edge,item):
+        self.NodeItemsForEdit(edge[0])
+        self.NodeItemsForEdit(edge[1])
+        self.EdgeItemsForEdit(edge)
+        return NetworkGraph.AddItemToEdge(self,edge,item)
+
+    def RemoveItemFromEdge(self,edge,index):
+        self.NodeItemsForEdit(edge[0])
+        self.NodeItemsForEdit(edge[1])
+        self.EdgeItemsForEdit(edge)
+        return NetworkGraph.RemoveItemFromEdge(self,edge,index)
+
+    # Resets the capacity dictionaries. Starts from the base network's
+    # capacities and recomputes only what the overlay changed.
+    def CapReset(self):
+        (node_caps,edge_caps) = self.base_caps
+        self.cap_at_node = dict(node_caps)
+        self.cap_at_edge = dict(edge_caps)
+
+        # Node capacity depends on the node's items and number of connections
+        nodes = self.V_items.Touched() | self.graph.Touched()
+        for n in nodes:
+            if n in self.V_items:
+                self.cap_at_node[n] = self.MaxCapAtNode(n)
+            elif n in self.cap_at_node:
+                del self.cap_at_node[n]
+
+        for e in self.E_items.Touched():
+            if e in self.E_items:
+                self.cap_at_edge[e] = self.MaxCapAtEdge(e)
+            elif e in self.cap_at_edge:
+                del self.cap_at_edge[e]
+
+# Run the capacity and revenue pipeline over a network without changing
+# the supply recorded on the cities. Returns the revenue for one turn.
+def NetworkRevenue(network,economy):
+    network.CapReset()
+    coords = economy.GetCitiesCoord()
+    supplies = []
+    for city in economy.GetCities():
+        supplies.append(network.CapAtCoord(city.GetCoord(),coords,city.range))
+    return economy.Revenue(supplies)
+
+# Scores hypothetical builds against a fixed snapshot of the network.
+# Create a new one once the real network has changed.
+class WhatIf():
+    def __init__(self,network,economy):
+        self.network = network
+        self.economy = economy
+        self.caps = BaseCaps(network)
+        self.base_revenue = NetworkRevenue(self.NewOverlay(),economy)
+
+    # A fresh overlay to try a build on
+    def NewOverlay(self):
+        return OverlayGraph(self.network,self.caps)
+
+    # Change in revenue per turn if the overlay's changes were built
+    def RevenueChange(self,overlay):
+        return NetworkRevenue(overlay,self.economy) - self.base_revenue
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
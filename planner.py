@@ -0,0 +1,509 @@
+# planner.py
+# Proposes a network which connects the cities of a level.
+#
+# The layout is a spanning tree grown from the largest city (Prim's
+# algorithm). Each candidate link is costed with the cheapest radio or wired
+# equipment which can carry the traffic of the cities behind it, with relay
+# nodes wherever the link is longer than the equipment's maximum length.
+# Cities are joined in order of demand served per dollar until the budget
+# runs out.
+#
+# Plan.Actions gives the actions which build the plan, equipment included,
+# for the game's action queue; Plan.Build applies them to a simulation.
+
+import copy
+import math
+
+import numpy as np
+
+from distfuncs import dist
+from networkgraph import NetworkGraph
+
+# Bandwidth planned for each person in a city, in bits per second.
+PER_CAPITA = 10000
+
+# Longest chain of relays the planner will build for one link. Keeps short
+# range equipment from being strung across the map.
+MAX_HOPS = 20
+
+# One way to build a link: a catalog item repeated in parallel on every hop,
+# with a relay structure every max_length km.
+class LinkOption():
+    def __init__(self,kind,id,item,structure,structure_cost,max_slots):
+        # kind is 'Radio' or 'Wired', id is the catalog id of the item
+        self.kind = kind
+        self.id = id
+        self.cost = item.GetCost()
+        self.capacity = item.GetMaxCapacity()
+        self.max_length = item.GetMaxLength()
+        # Wired items are priced per km
+        self.per_km = kind == 'Wired'
+        # Cheapest tower or building to hold the link's ends, as a
+        # (kind,id) catalog reference, and its cost
+        self.structure = structure
+        self.structure_cost = structure_cost
+        # Most parallel items a structure can hold
+        self.max_slots = max_slots
+
+    # Number of hops and parallel items for a link of length km
+    # carrying need bit/s.
+    def Size(self,length,need):
+        hops = max(math.ceil(length / self.max_length),1)
+        count = max(math.ceil(need / self.capacity),1)
+        return (hops,count)
+
+# Compile the link options out of a CapitalDatabase
+def LinkOptions(database):
+    options = []
+    structures = (('Radio',database.Radios,database.GetRadio,'Tower',database.Towers,database.GetTower),
+                  ('Wired',database.Wired,database.GetWired,'Building',database.Buildings,database.GetBuilding))
+
+    for (kind,links,GetLink,struct_kind,structs,GetStruct) in structures:
+        costs = {}
+        slots = []
+        for id in structs:
+            struct = GetStruct(id)
+            costs[id] = struct.GetCost() + float(struct.GetFoundationCost())
+            slots.append(struct.GetMaxLinkSlots())
+        cheapest = min(costs,key=costs.get)
+
+        for id in links:
+            options.append(LinkOption(kind,id,GetLink(id),(struct_kind,cheapest),costs[cheapest],max(slots)))
+
+    return options
+
+# A proposed layout. Nodes are (coord,name) pairs, cities first and then
+# relays. Links are [start,end,option,count] between node indices, one per
+# hop; count is the number of parallel items of the option. cost is what
+# building the plan on an empty network costs, equipment included.
+class Plan():
+    def __init__(self,budget=None):
+        self.nodes = []
+        self.links = []
+        self.cost = 0
+        self.budget = budget
+
+    # Build the plan on network, which is changed: the nodes linked are
+    # added, except that cities with a node within range are connected to
+    # the existing node. Links are added in both directions, each with its
+    # parallel items, the nodes get the towers or buildings whose link slots
+    # those need, and nodes which can not route traffic get the cheapest
+    # router, in the cheapest building. Returns (ids,added,changed,cost):
+    # the node id of each of the plan's nodes (None where it is not linked),
+    # the ids added, the ids whose items changed, and the cost of the
+    # equipment.
+    def Lay(self,network,database,cities):
+        linked = set()
+        for (start,end,option,count) in self.links:
+            linked.update((start,end))
+
+        ids = []
+        added = set()
+        for (index,(coord,name)) in enumerate(self.nodes):
+            close = None
+            if index < len(cities) and index in linked:
+                close = network.ReturnClosePointThresh(coord,cities[index].range)
+
+            if index not in linked:
+                ids.append(None)
+            elif close:
+                ids.append(close[0])
+            else:
+                ids.append(network.NewNode(coord,name,[]))
+                added.add(ids[-1])
+
+        cost = 0
+        changed = set(added)
+        for node in ids:
+            if node != None and network.MaxCapAtNode(node) == 0:
+                cost = cost + add_router(network,node,database)
+                changed.add(node)
+
+        for (start,end,option,count) in self.links:
+            (a,b) = (ids[start],ids[end])
+            # Cities close enough to share a node
+            if a == b:
+                continue
+            for node in (a,b):
+                cost = cost + add_structures(network,node,option,2 * count,database)
+                changed.add(node)
+
+            for edge in ((a,b),(b,a)):
+                if edge not in network.E_items:
+                    network.AddEdgeID(edge[0],edge[1],[])
+                for i in range(count):
+                    item = database.GetItem(option.kind,option.id)
+                    if option.per_km:
+                        item.SetWireMaxCapacity(network.E_lengths[edge])
+                    if network.AddItemToEdge(edge,item):
+                        cost = cost + option.cost * (network.E_lengths[edge] if option.per_km else 1)
+
+        return (ids,added,changed,cost)
+
+    # The actions which build the plan on network, for the game's action
+    # queue, and what they cost. network is not changed: the plan is laid
+    # on a copy first, to find what changes. Nodes the plan adds are
+    # referred to by the key given in their addnode action, ('plan',index);
+    # links are added in both directions with addlink actions which name
+    # both ends and need no confirming. equipnode and equiplink actions put
+    # the items of the copy at each node and link which changed, and the
+    # equipment is paid for with subtractcash. Coordinates are scaled by
+    # zoom_factor, as the canvas is. cost is set to what the actions spend.
+    # Raises ValueError if that is more than the budget or than cash.
+    def Actions(self,network,database,cities,cash,zoom_factor=1.0):
+        """
+        Tests:
+        >>> from database import CapitalDatabase
+        >>> from networkgraph import NetworkGraph
+        >>> from city import City
+        >>> cities = [City('A',0,0,100000), City('B',200,0,50000)]
+        >>> plan = Planner(cities,CapitalDatabase(),1000000).Plan()
+        >>> network = NetworkGraph()
+        >>> actions = plan.Actions(network,CapitalDatabase(),cities,1000000)
+        >>> [action[0] for action in actions]
+        ['addnode', 'addnode', 'addlink', 'addlink', 'equipnode', 'equipnode', 'equiplink', 'equiplink', 'subtractcash']
+        >>> actions[2][1]
+        [('plan', 0), ('plan', 1), True]
+        >>> actions[-1][1][0] == plan.cost, len(network.GetNodes())
+        (True, 0)
+
+        An existing node in a city's range is used:
+        >>> node = network.NewNode((10,0),'A',[])
+        >>> [action[1][0] for action in plan.Actions(network,CapitalDatabase(),cities,1000000)
+        ...  if action[0] == 'addlink']
+        [1, ('plan', 1)]
+
+        >>> plan.Actions(NetworkGraph(),CapitalDatabase(),cities,1000)   # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+        ...
+        ValueError: The plan costs $...
+        """
+        scratch = copy.deepcopy(network)
+        edges_before = set(scratch.E_items)
+        (ids,added,changed,cost) = self.Lay(scratch,database,cities)
+
+        if cost > cash or (self.budget != None and cost > self.budget):
+            raise ValueError('The plan costs $%0.0f, more than the $%0.0f which can be spent'
+                             % (cost,min(cash,self.budget if self.budget != None else cash)))
+
+        def ref(node):
+            if node in added:
+                return ('plan',ids.index(node))
+            return node
+
+        actions = []
+        for (index,node) in enumerate(ids):
+            # Cities sharing a node add it once
+            if node in added and ids.index(node) == index:
+                (x,y) = self.nodes[index][0]
+                actions.append(['addnode',[(x * zoom_factor,y * zoom_factor),self.nodes[index][1],('plan',index)]])
+        links = [edge for edge in scratch.E_items if edge not in edges_before]
+        for edge in links:
+            actions.append(['addlink',[ref(edge[0]),ref(edge[1]),True]])
+        for node in sorted(changed):
+            actions.append(['equipnode',[ref(node),scratch.V_items[node]]])
+        for edge in links:
+            actions.append(['equiplink',[ref(edge[0]),ref(edge[1]),scratch.E_items[edge]]])
+        actions.append(['subtractcash',[cost]])
+        self.cost = cost
+        return actions
+
+    # Build the plan on the network of sim, a Simulation, by applying its
+    # Actions as the game does, so they are recorded. Returns the ids of
+    # the nodes added, by key.
+    def Build(self,sim,database,cities):
+        placed = {}
+        def node(ref):
+            return placed.get(ref,ref)
+        for (name,args) in self.Actions(sim.gameNetwork,database,cities,sim.cash):
+            if name == 'addnode':
+                placed[args[2]] = sim.ApplyAction(['addnode',args[:2]])
+            elif name == 'addlink':
+                sim.ApplyAction(['addlink',[node(args[0]),node(args[1])]])
+            elif name == 'equipnode':
+                sim.ApplyAction(['nodeitems',[node(args[0]),args[1]]])
+            elif name == 'equiplink':
+                sim.ApplyAction(['linkitems',[(node(args[0]),node(args[1])),args[2]]])
+            else:
+                sim.ApplyAction([name,args])
+        return placed
+
+# The id of the cheapest item of a catalog, by cost(item)
+def cheapest(ids,GetItem,cost):
+    return min(ids,key=lambda id: cost(GetItem(id)))
+
+def cheapest_router(database):
+    return cheapest(database.Routers,database.GetRouter,lambda item: item.GetCost())
+
+def cheapest_building(database):
+    return cheapest(database.Buildings,database.GetBuilding,
+                    lambda item: item.GetCost() + float(item.GetFoundationCost()))
+
+# The cost of the cheapest router in the cheapest building
+def router_cost(database):
+    building = database.GetBuilding(cheapest_building(database))
+    return (building.GetCost() + float(building.GetFoundationCost())
+            + database.GetRouter(cheapest_router(database)).GetCost())
+
+# Put the cheapest router at node, in a building with room for it, adding
+# the cheapest building if there is none and the node has room. Returns
+# the cost.
+def add_router(network,node,database):
+    items = network.V_items[node]
+    router = database.GetRouter(cheapest_router(database))
+    for item in items:
+        if item.StructType() == 'Building' and item.AddItem(router):
+            return router.GetCost()
+
+    if len(items) >= network.max_slots:
+        return 0
+    building = database.GetBuilding(cheapest_building(database))
+    building.AddItem(router)
+    items.append(building)
+    return building.GetCost() + float(building.GetFoundationCost()) + router.GetCost()
+
+# Add option's structure to node until it has free link slots for need more
+# of option's items, as long as the node has room. Returns the cost.
+def add_structures(network,node,option,need,database):
+    items = network.V_items[node]
+    (kind,id) = option.structure
+    free = 0
+    for item in items:
+        if item.StructType() == kind:
+            free = free + item.GetMaxLinkSlots() - item.GetCurLinkSlots()
+
+    cost = 0
+    while free < need and len(items) < network.max_slots:
+        struct = database.GetItem(kind,id)
+        items.append(struct)
+        free = free + struct.GetMaxLinkSlots()
+        cost = cost + option.structure_cost
+    return cost
+
+class Planner():
+    """
+    Tests:
+    >>> from database import CapitalDatabase
+    >>> from city import City
+    >>> cities = [City('A',0,0,100000), City('B',300,0,50000),
+    ...           City('C',300,400,20000), City('D',-300,0,1000)]
+    >>> planner = Planner(cities,CapitalDatabase(),10000000)
+    >>> plan = planner.Plan()
+    >>> [name for (coord,name) in plan.nodes[:4]]
+    ['A', 'B', 'C', 'D']
+    >>> sorted(planner.parent.items())
+    [(1, 0), (2, 1), (3, 0)]
+    >>> plan.cost <= 10000000
+    True
+
+    Links are split into hops no longer than the equipment allows:
+    >>> all(dist(*plan.nodes[a][0],*plan.nodes[b][0]) * 0.24 <= o.max_length + 1e-9
+    ...     for (a,b,o,count) in plan.links)
+    True
+
+    A small budget only reaches the cheapest cities:
+    >>> plan = Planner(cities,CapitalDatabase(),150000).Plan()
+    >>> len(plan.links) < 3, plan.cost <= 150000
+    (True, True)
+
+    The plan is built with the ids of the nodes it adds, and equipped:
+    >>> from simulation import Simulation
+    >>> from economic import Economic
+    >>> plan = planner.Plan()
+    >>> sim = Simulation(Economic(cities),cash=10000000)
+    >>> cost = plan.cost
+    >>> placed = plan.Build(sim,CapitalDatabase(),cities)
+    >>> len(sim.gameNetwork.GetNodes()) == len(plan.nodes)
+    True
+    >>> ids = [placed[('plan',index)] for index in range(len(plan.nodes))]
+    >>> all(sim.gameNetwork.E_items[(ids[a],ids[b])] and sim.gameNetwork.E_items[(ids[b],ids[a])]
+    ...     for (a,b,o,count) in plan.links)
+    True
+
+    Building costs what the plan said, within the budget:
+    >>> 10000000 - sim.cash == plan.cost == cost, cost <= 10000000
+    (True, True)
+    >>> (maintenance,revenue) = sim.Step()
+    >>> all(sum(city.GetSupply()) > 0 for city in cities)
+    True
+    """
+
+    # cities is a list of City objects, as from Economic.GetCities().
+    # scale_factor converts map distance to km, as in NetworkGraph.
+    def __init__(self,cities,database,budget,scale_factor=0.24,per_capita=PER_CAPITA):
+        self.cities = cities
+        self.database = database
+        self.budget = budget
+        self.scale_factor = scale_factor
+        self.options = LinkOptions(database)
+        # What making a node able to route traffic costs: the cheapest
+        # router in the cheapest building
+        self.node_cost = router_cost(database)
+
+        # The options as columns, so every option is costed at once
+        self.unit_cost = np.array([o.cost for o in self.options])[:,None]
+        self.capacity = np.array([o.capacity for o in self.options])[:,None]
+        self.max_length = np.array([o.max_length for o in self.options])[:,None]
+        self.per_km = np.array([o.per_km for o in self.options])[:,None]
+        self.structure_cost = np.array([o.structure_cost for o in self.options])[:,None]
+        self.max_slots = np.array([o.max_slots for o in self.options])[:,None]
+        self.kind = np.array([o.kind for o in self.options])
+
+        self.coord = np.array([city.GetCoord() for city in cities],dtype=float).reshape(-1,2)
+        self.demand = np.array([city.GetPopulation() for city in cities],dtype=float) * per_capita
+
+    # Cost of every option for links of the given lengths (km) carrying
+    # need (bit/s). Returns an array with a row per option. The cost is the
+    # equipment plus one structure and router per hop: the relays and the
+    # far end.
+    # inf where the option needs too many relays, or more parallel items
+    # than a structure can hold.
+    def OptionCosts(self,length,need):
+        length = np.atleast_1d(length)
+        hops = np.maximum(np.ceil(length / self.max_length),1)
+        count = np.maximum(np.ceil(need / self.capacity),1)
+        equipment = np.where(self.per_km,count * self.unit_cost * length,hops * count * self.unit_cost)
+        cost = equipment + hops * (self.structure_cost + self.node_cost)
+        return np.where((count <= self.max_slots) & (hops <= MAX_HOPS),cost,np.inf)
+
+    # Cheapest way to link city u to every city. Returns arrays of cost and
+    # option index, sized for the demand of the far city.
+    def LinkCosts(self,u):
+        delta = self.coord - self.coord[u]
+        length = np.hypot(delta[:,0],delta[:,1]) * self.scale_factor
+        costs = self.OptionCosts(length,self.demand)
+        best = np.argmin(costs,axis=0)
+        return (costs[best,np.arange(len(best))],best)
+
+    # Cheapest options which carry the flows over links built with the
+    # given kinds of equipment. Changing kind needs a new structure at the
+    # near end too. Returns arrays of cost and option index.
+    def Resize(self,kinds,lengths,flows):
+        costs = self.OptionCosts(np.array(lengths),np.array(flows))
+        costs = costs + np.where(self.kind[:,None] == np.array(kinds),0,self.structure_cost)
+        best = np.argmin(costs,axis=0)
+        return (costs[best,np.arange(len(best))],best)
+
+    # Grow the tree. Returns a Plan.
+    def Plan(self):
+        n = len(self.cities)
+        plan = Plan(self.budget)
+        if n == 0:
+            return plan
+
+        in_tree = np.zeros(n,dtype=bool)
+        rejected = np.zeros(n,dtype=bool)
+        best_cost = np.full(n,np.inf)
+        best_option = np.zeros(n,dtype=int)
+        best_parent = np.full(n,-1)
+
+        # Links are kept by child: parent, option, length, flow and cost
+        self.parent = {}
+        link = {}
+        kinds = [set() for i in range(n)]
+        # The root's router
+        total = self.node_cost
+
+        root = int(np.argmax(self.demand))
+        in_tree[root] = True
+
+        def add_to_tree(u):
+            (cost,option) = self.LinkCosts(u)
+            better = ~in_tree & (cost < best_cost)
+            best_cost[better] = cost[better]
+            best_option[better] = option[better]
+            best_parent[better] = u
+
+        add_to_tree(root)
+
+        while True:
+            candidates = ~in_tree & ~rejected & np.isfinite(best_cost)
+            if not candidates.any():
+                break
+
+            # Most demand served per dollar
+            value = np.where(candidates,self.demand / np.maximum(best_cost,1),-1)
+            j = int(np.argmax(value))
+            p = int(best_parent[j])
+            option = self.options[best_option[j]]
+            length = dist(*self.coord[j],*self.coord[p]) * self.scale_factor
+            cost = float(best_cost[j])
+
+            # The parent needs a structure of the same kind
+            if option.kind not in kinds[p]:
+                cost = cost + option.structure_cost
+
+            # Links on the way back to the root carry the new city's traffic
+            path = []
+            v = p
+            while v != root:
+                path.append(v)
+                v = link[v][0]
+
+            upgrades = {}
+            if path:
+                (new_costs,new_options) = self.Resize([link[v][1].kind for v in path],
+                                                      [link[v][2] for v in path],
+                                                      [link[v][3] + self.demand[j] for v in path])
+                for (v,new_cost,new_option) in zip(path,new_costs,new_options):
+                    (vp,voption,vlength,vflow,vcost) = link[v]
+                    upgrades[v] = (vp,self.options[new_option],vlength,vflow + self.demand[j],float(new_cost))
+                    cost = cost + float(new_cost) - vcost
+
+            if total + cost > self.budget:
+                rejected[j] = True
+                continue
+
+            total = total + cost
+            link.update(upgrades)
+            for (v,(vp,voption,vlength,vflow,vcost)) in upgrades.items():
+                kinds[v].add(voption.kind)
+                kinds[vp].add(voption.kind)
+            link[j] = (p,option,length,self.demand[j],float(best_cost[j]))
+            self.parent[j] = p
+            kinds[p].add(option.kind)
+            kinds[j].add(option.kind)
+            in_tree[j] = True
+            add_to_tree(j)
+
+        # The tree was costed a structure per hop, while building it may need
+        # more to hold the parallel items. Cities are dropped, the last
+        # joined first, until what it costs to build fits the budget.
+        plan = self.Layout(link)
+        while plan.cost > self.budget and link:
+            j = list(link)[-1]
+            del link[j]
+            del self.parent[j]
+            plan = self.Layout(link)
+        return plan
+
+    # The Plan of the links of the tree, by child, priced by laying it on
+    # an empty network
+    def Layout(self,link):
+        plan = Plan(self.budget)
+        for city in self.cities:
+            plan.nodes.append((city.GetCoord(),city.GetName()))
+
+        # Split each link into hops, with relay nodes in between
+        for j in sorted(link):
+            (p,option,length,flow,cost) = link[j]
+            (hops,count) = option.Size(length,flow)
+            (x1,y1) = self.cities[p].GetCoord()
+            (x2,y2) = self.cities[j].GetCoord()
+
+            previous = p
+            for hop in range(1,hops):
+                coord = (x1 + (x2 - x1) * hop / hops,y1 + (y2 - y1) * hop / hops)
+                name = self.cities[p].GetName() + '-' + self.cities[j].GetName() + ' relay ' + str(hop)
+                plan.nodes.append((coord,name))
+                relay = len(plan.nodes) - 1
+                plan.links.append([previous,relay,option,count])
+                previous = relay
+            plan.links.append([previous,j,option,count])
+
+        plan.cost = plan.Lay(NetworkGraph(),self.database,[])[3]
+        return plan
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
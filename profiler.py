@@ -0,0 +1,127 @@
+# profiler.py
+# Times the phases of a game turn.
+#
+# Call Start() at the beginning of a turn, Mark(phase) at the end of each
+# phase and End() when the turn is done. Durations are kept for the last
+# few turns so rolling statistics can be shown or exported. While the
+# profiler is disabled, each call returns right away.
+
+import csv
+import json
+import math
+from collections import deque
+from time import perf_counter
+
+# Phase name used for the time of a whole turn
+TOTAL = 'total'
+
+class TurnProfiler():
+    """
+    Tests:
+    >>> p = TurnProfiler()
+    >>> p.Start(); p.Mark('a'); p.End()
+    >>> p.Phases()
+    []
+
+    >>> p = TurnProfiler(enabled=True)
+    >>> for i in range(10):
+    ...     p.Start(); p.Mark('actions'); p.Mark('capacity'); p.End()
+    >>> p.Phases()
+    ['actions', 'capacity', 'total']
+    >>> stats = p.Stats('capacity')
+    >>> stats['count'], stats['p50'] <= stats['p95'] <= stats['max']
+    (10, True)
+    >>> percentile([4, 1, 3, 2], 50), percentile([4, 1, 3, 2], 95)
+    (2, 4)
+    """
+
+    # window is the number of turns kept per phase
+    def __init__(self,window=200,enabled=False):
+        self.window = window
+        self.enabled = enabled
+        self.times = {}
+        self.turns = 0
+        self._start = 0
+        self._last = 0
+
+    def Enable(self,enabled=True):
+        self.enabled = enabled
+
+    def Reset(self):
+        self.times = {}
+        self.turns = 0
+
+    # Begin timing a turn
+    def Start(self):
+        if not self.enabled:
+            return
+        self._start = self._last = perf_counter()
+
+    # Record the time since the last mark as the given phase
+    def Mark(self,phase):
+        if not self.enabled:
+            return
+        now = perf_counter()
+        self._record(phase,now - self._last)
+        self._last = now
+
+    # Finish timing a turn
+    def End(self):
+        if not self.enabled:
+            return
+        self._record(TOTAL,perf_counter() - self._start)
+        self.turns = self.turns + 1
+
+    def _record(self,phase,seconds):
+        if phase not in self.times:
+            self.times[phase] = deque(maxlen=self.window)
+        self.times[phase].append(seconds)
+
+    # Phases in the order they were first recorded
+    def Phases(self):
+        return list(self.times)
+
+    # Rolling statistics for a phase, in seconds
+    def Stats(self,phase):
+        times = list(self.times[phase])
+        return {'count': len(times),
+                'mean': sum(times) / len(times),
+                'p50': percentile(times,50),
+                'p95': percentile(times,95),
+                'max': max(times)}
+
+    # Statistics for every phase
+    def Report(self):
+        report = {}
+        for phase in self.times:
+            report[phase] = self.Stats(phase)
+        return report
+
+    def ExportJSON(self,filename):
+        with open(filename,'w') as outFile:
+            json.dump({'turns': self.turns,'window': self.window,'phases': self.Report()},outFile,indent=2)
+
+    def ExportCSV(self,filename):
+        with open(filename,'w',newline='') as outFile:
+            writer = csv.writer(outFile)
+            writer.writerow(['phase','count','mean','p50','p95','max'])
+            for (phase,stats) in self.Report().items():
+                writer.writerow([phase,stats['count'],stats['mean'],stats['p50'],stats['p95'],stats['max']])
+
+    # A short table of the statistics in milliseconds, for display
+    def Text(self):
+        tempstr = 'Turn profile (ms)   mean    p95    max'
+        for (phase,stats) in self.Report().items():
+            tempstr = tempstr + '\n%-16s %7.2f %6.2f %6.2f' % (phase,stats['mean'] * 1000,
+                                                            stats['p95'] * 1000,stats['max'] * 1000)
+        return tempstr
+
+# Nearest-rank percentile of a list of numbers
+def percentile(values,percent):
+    values = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(values)),1)
+    return values[rank - 1]
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,698 @@
+# render.py
+# Draws the network on the map canvas, only where it can be seen.
+#
+# Nodes and links are kept in a grid index by their map coordinates. Only
+# the nodes and links inside the visible part of the canvas, grown by a
+# margin, have canvas items. As the view moves, the items of those which
+# left it are hidden and reused for those which came into view, so the
+# canvas holds about as many items as fit on the screen however big the
+# network is. Clicks are bound once to the 'node' and 'link' tags and
+# looked up by the item clicked.
+
+import math
+
+import numpy as np
+
+from tiles import canvas_view, MARGIN
+
+# Size of the grid cells, in map units
+GRID_CELL = 250
+
+# Hidden node and link items kept for reuse
+POOL = 256
+
+# Level of detail. Node and link labels and direction arrows are drawn
+# from DETAIL_ZOOM; up to CLUSTER_ZOOM, cells of CLUSTER_SIZE pixels holding
+# at least CLUSTER_MIN nodes are drawn as one cluster glyph.
+DETAIL_ZOOM = 0.8
+CLUSTER_ZOOM = 0.5
+CLUSTER_SIZE = 48
+CLUSTER_MIN = 3
+
+# A grid of keys by their bounding boxes, for finding those in an area.
+# Keys whose box spans several cells are in each of them.
+class SpatialGrid():
+    """
+    Tests:
+    >>> grid = SpatialGrid(100)
+    >>> grid.Add('a',(10,10,10,10))
+    >>> grid.Add('ab',(10,10,450,30))
+    >>> grid.Add('c',(900,900,900,900))
+    >>> sorted(grid.InRect(0,0,200,200))
+    ['a', 'ab']
+    >>> sorted(grid.InRect(300,0,400,100))
+    ['ab']
+    >>> grid.Remove('ab')
+    >>> sorted(grid.InRect(-1000,-1000,5000,5000)), len(grid)
+    (['a', 'c'], 2)
+    """
+
+    def __init__(self,cell=GRID_CELL):
+        self.cell = cell
+        # Sets of keys by (column,row)
+        self.cells = {}
+        # (x0,y0,x1,y1) of each key
+        self.boxes = {}
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self,key):
+        return key in self.boxes
+
+    def _Span(self,box):
+        (x0,y0,x1,y1) = box
+        return (int(x0 // self.cell),int(y0 // self.cell),int(x1 // self.cell),int(y1 // self.cell))
+
+    def _Cells(self,box):
+        (c0,r0,c1,r1) = self._Span(box)
+        for c in range(c0,c1 + 1):
+            for r in range(r0,r1 + 1):
+                yield (c,r)
+
+    def Add(self,key,box):
+        if key in self.boxes:
+            self.Remove(key)
+        self.boxes[key] = box
+        for cell in self._Cells(box):
+            self.cells.setdefault(cell,set()).add(key)
+
+    def Remove(self,key):
+        box = self.boxes.pop(key,None)
+        if box == None:
+            return
+        for cell in self._Cells(box):
+            keys = self.cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self.cells[cell]
+
+    # The keys whose boxes overlap x0,y0 to x1,y1
+    def InRect(self,x0,y0,x1,y1):
+        (c0,r0,c1,r1) = self._Span((x0,y0,x1,y1))
+        # Zoomed out, the area can cover more cells than are filled
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > len(self.cells):
+            cells = [keys for ((c,r),keys) in self.cells.items() if c0 <= c <= c1 and r0 <= r <= r1]
+        else:
+            cells = [self.cells[cell] for cell in self._Cells((x0,y0,x1,y1)) if cell in self.cells]
+
+        found = set()
+        for keys in cells:
+            for key in keys:
+                (a0,b0,a1,b1) = self.boxes[key]
+                if a0 <= x1 and x0 <= a1 and b0 <= y1 and y0 <= b1:
+                    found.add(key)
+        return found
+
+# The bounding box of a link between two map points
+def link_box(p1,p2):
+    return (min(p1[0],p2[0]),min(p1[1],p2[1]),max(p1[0],p2[0]),max(p1[1],p2[1]))
+
+# Canvas coordinates of the lines of links drawn between points starts[i]
+# and ends[i], given as (n,2) arrays. Each row is the line, the two arrow
+# head lines and the position of the distance label:
+#     x1,y1,x2,y2, hx,hy,ax,ay, hx,hy,bx,by, lx,ly
+def link_geometries(starts,ends):
+    starts = np.asarray(starts,dtype=float).reshape(-1,2)
+    ends = np.asarray(ends,dtype=float).reshape(-1,2)
+    d = ends - starts
+    angle = np.arctan2(d[:,1],d[:,0])
+
+    def polar(r,a):
+        return np.stack((r * np.cos(a),r * np.sin(a)),axis=1)
+
+    # Offset the line slightly so the lines of a bidirectional link do not
+    # overlap and each can be selected. Determined experimentally.
+    offset = polar(5,angle + math.pi/2)
+    p1 = starts + offset
+    p2 = ends + offset
+    mid = (p1 + p2) / 2
+
+    # Arrow head three quarters of the way along, showing the direction
+    head = (mid + p2) / 2
+    arrow1 = head + polar(10,angle + 3.5 * math.pi/4)
+    arrow2 = head + polar(10,angle - 3.5 * math.pi/4)
+
+    # Distance label to one side of the line
+    side = angle - math.pi / 2
+    label = mid + np.stack((20 * np.cos(side),30 * np.sin(side)),axis=1)
+    return np.hstack((p1,p2,head,arrow1,head,arrow2,label))
+
+# A row of link_geometries as (line,arrow1,arrow2,label) tuples
+def split_geometry(row):
+    return (tuple(row[0:4]),tuple(row[4:8]),tuple(row[8:12]),tuple(row[12:14]))
+
+# The geometry of one link between two canvas points
+def link_geometry(p1,p2):
+    """
+    Tests:
+    >>> (line,arrow1,arrow2,label) = link_geometry((0,0),(100,0))
+    >>> [round(v) for v in line]
+    [0, 5, 100, 5]
+    >>> [round(v) for v in arrow1[:2]], [round(v) for v in label]
+    ([75, 5], [50, -25])
+    """
+    return split_geometry(link_geometries(p1,p2)[0].tolist())
+
+# The canvas geometry of every link at each zoom. The first time a zoom is
+# drawn the geometry of all links is computed in one pass and kept, so
+# drawing, panning back and zooming only look it up.
+class LinkGeometry():
+    """
+    Tests:
+    >>> from networkgraph import NetworkGraph
+    >>> network = NetworkGraph()
+    >>> a = network.NewNode((0,0),'A',[])
+    >>> b = network.NewNode((200,0),'B',[])
+    >>> network.AddEdgeID(a,b,[])
+    >>> network.AddEdgeID(b,a,[])
+    >>> geometry = LinkGeometry(network)
+    >>> geometry.Get((a,b),0.5) == link_geometry((0,0),(100,0))
+    True
+    >>> [round(v) for v in geometry.Get((b,a),0.5)[0]]
+    [100, -5, 0, -5]
+    >>> len(geometry.zooms[0.5])
+    2
+    """
+
+    def __init__(self,network):
+        self.network = network
+        # Rows of link_geometries by edge, by zoom
+        self.zooms = {}
+
+    def Get(self,edge,zoom):
+        if zoom not in self.zooms:
+            self._Compute(zoom)
+        links = self.zooms[zoom]
+        if edge not in links:
+            coords = self.network.V_coord
+            links[edge] = (link_geometries(np.multiply(coords[edge[0]],zoom),
+                                           np.multiply(coords[edge[1]],zoom))[0].tolist())
+        return split_geometry(links[edge])
+
+    def _Compute(self,zoom):
+        edges = list(self.network.GetEdges())
+        coords = self.network.V_coord
+        starts = np.array([coords[e[0]] for e in edges],dtype=float).reshape(-1,2) * zoom
+        ends = np.array([coords[e[1]] for e in edges],dtype=float).reshape(-1,2) * zoom
+        self.zooms[zoom] = dict(zip(edges,link_geometries(starts,ends).tolist()))
+
+    # Forget a deleted link
+    def Remove(self,edge):
+        for links in self.zooms.values():
+            links.pop(edge,None)
+
+# Colour of a link: red if any of its items failed, green if it has items
+def link_colour(network,edge):
+    items = network.E_items[edge]
+    for item in items:
+        if not item.Operating():
+            return 'red'
+    if items:
+        return 'green'
+    return 'black'
+
+# Nodes grouped by square cells of the map. A cell holding at least minimum
+# nodes is drawn as one cluster glyph in their place.
+class NodeClusters():
+    """
+    Tests:
+    >>> clusters = NodeClusters(100,minimum=3)
+    >>> for (node,coord) in ((1,(10,10)),(2,(20,40)),(3,(90,70)),(4,(150,10))):
+    ...     clusters.Add(node,coord)
+    >>> clusters.Site(1), clusters.Site(4)
+    ((0, 0), 4)
+    >>> clusters.Centre((0,0)), clusters.Count((0,0))
+    ((40.0, 40.0), 3)
+    >>> clusters.Remove(3)
+    >>> clusters.Site(1)
+    1
+    """
+
+    def __init__(self,cell,minimum=CLUSTER_MIN):
+        self.cell = cell
+        self.minimum = minimum
+        # Sets of nodes, and the sums of their coordinates, by (column,row)
+        self.members = {}
+        self.sums = {}
+        # (cell,coord) of each node
+        self.placed = {}
+
+    def Add(self,node,coord):
+        (x,y) = coord
+        cell = (int(x // self.cell),int(y // self.cell))
+        self.placed[node] = (cell,coord)
+        self.members.setdefault(cell,set()).add(node)
+        (sx,sy) = self.sums.get(cell,(0.0,0.0))
+        self.sums[cell] = (sx + x,sy + y)
+
+    def Remove(self,node):
+        (cell,(x,y)) = self.placed.pop(node)
+        self.members[cell].discard(node)
+        if not self.members[cell]:
+            del self.members[cell]
+            del self.sums[cell]
+        else:
+            (sx,sy) = self.sums[cell]
+            self.sums[cell] = (sx - x,sy - y)
+
+    # Where a node is drawn: the (column,row) of its cluster, or the node
+    # itself if its cell is not crowded enough to be clustered
+    def Site(self,node):
+        cell = self.placed[node][0]
+        if len(self.members[cell]) >= self.minimum:
+            return cell
+        return node
+
+    def Count(self,cell):
+        return len(self.members[cell])
+
+    # The mean position of the nodes of a cell
+    def Centre(self,cell):
+        (sx,sy) = self.sums[cell]
+        n = len(self.members[cell])
+        return (sx / n,sy / n)
+
+class NetworkLayer():
+    """
+    Tests, with a stand in for the canvas which counts calls:
+    >>> class Canvas():
+    ...     def __init__(self):
+    ...         self.calls = []
+    ...     def canvasx(self,x):
+    ...         return x
+    ...     canvasy = canvasx
+    ...     def winfo_width(self):
+    ...         return 800
+    ...     winfo_height = winfo_width
+    ...     def __getattr__(self,name):
+    ...         def call(*args,**options):
+    ...             self.calls.append(name)
+    ...             return len(self.calls)
+    ...         return call
+    >>> from networkgraph import NetworkGraph
+    >>> from database import CapitalDatabase
+    >>> network = NetworkGraph()
+    >>> tower = CapitalDatabase().GetTower(0)
+    >>> a = network.NewNode((100,100),'A',[tower])
+    >>> b = network.NewNode((300,100),'B',[])
+    >>> c = network.NewNode((5000,100),'C',[])
+    >>> network.AddEdgeID(a,b,[])
+    >>> canvas = Canvas()
+    >>> layer = NetworkLayer(canvas,network,{'node': 0,'node_active': 0,'notify': 0},lambda: 1.0)
+    >>> sorted(layer.shown_nodes), list(layer.shown_links)
+    ([1, 2], [(1, 2)])
+
+    Refreshing only configures what changed:
+    >>> del canvas.calls[:]
+    >>> layer.Refresh()
+    >>> canvas.calls
+    []
+    >>> tower.SetFail()
+    >>> layer.Refresh()
+    >>> layer.Refresh()
+    >>> canvas.calls
+    ['itemconfigure']
+    """
+
+    # zoom returns the canvas's current scale. margin is in pixels.
+    def __init__(self,canvas,network,icons,zoom,margin=MARGIN):
+        self.canvas = canvas
+        self.icons = icons
+        self.zoom = zoom
+        self.margin = margin
+
+        # Hidden items marking where links and nodes go in the stacking
+        # order: above the background and cities, links under nodes.
+        self.link_marker = canvas.create_line(0,0,0,0,state='hidden')
+        self.node_marker = canvas.create_line(0,0,0,0,state='hidden')
+
+        # (image,label,notify) items of the nodes drawn, (line,arrow,arrow,
+        # label) items of the links drawn and (circle,count) items of the
+        # clusters drawn. Zoomed out, a link drawn can stand for all the
+        # links between two clusters; they are kept in link_edges.
+        self.shown_nodes = {}
+        self.shown_links = {}
+        self.shown_clusters = {}
+        self.link_edges = {}
+        # Node or links of each clickable item
+        self.item_node = {}
+        self.item_link = {}
+        # The value last set on the item showing the state of each node,
+        # cluster or link: the notification's state or the fill colour
+        self.displayed = {}
+        # Hidden item groups for reuse
+        self.free_nodes = []
+        self.free_links = []
+
+        self.SetNetwork(network)
+
+    # Draw another network, e.g. a loaded game's
+    def SetNetwork(self,network):
+        self._Clear()
+        self.network = network
+        self.nodes = SpatialGrid()
+        self.links = SpatialGrid()
+        for node in network.GetNodes():
+            (x,y) = network.V_coord[node]
+            self.nodes.Add(node,(x,y,x,y))
+        for edge in network.GetEdges():
+            self.links.Add(edge,self._LinkBox(edge))
+        self.geometry = LinkGeometry(network)
+        # NodeClusters by zoom, made the first time they are needed
+        self.clusters = {}
+        self.Update()
+
+    # Hide everything drawn
+    def _Clear(self):
+        for node in list(self.shown_nodes):
+            self._HideNode(node)
+        for key in list(self.shown_links):
+            self._HideLink(key)
+        for cell in list(self.shown_clusters):
+            self._HideCluster(cell)
+        # (x0,y0,x1,y1,zoom) of the map area drawn
+        self.drawn = None
+
+    # Call fn(node) or fn(edge) when a node or link is clicked. A line
+    # standing for several links does nothing.
+    def BindNodes(self,sequence,fn):
+        self.canvas.tag_bind('node',sequence,lambda ev: fn(self.item_node[self._Current()]))
+
+    def BindLinks(self,sequence,fn):
+        def clicked(ev):
+            edges = self.item_link[self._Current()]
+            if len(edges) == 1:
+                fn(edges[0])
+        self.canvas.tag_bind('link',sequence,clicked)
+
+    def _Current(self):
+        return self.canvas.find_withtag('current')[0]
+
+    def _LinkBox(self,edge):
+        return link_box(self.network.V_coord[edge[0]],self.network.V_coord[edge[1]])
+
+    # Level of detail at a zoom
+    def Detailed(self,zoom):
+        return zoom >= DETAIL_ZOOM
+
+    def Clustered(self,zoom):
+        return zoom <= CLUSTER_ZOOM
+
+    # The node clusters at a zoom. Clusters are CLUSTER_SIZE pixels across
+    # on the screen.
+    def _Clusters(self,zoom):
+        if zoom not in self.clusters:
+            clusters = NodeClusters(CLUSTER_SIZE / zoom)
+            for (node,box) in self.nodes.boxes.items():
+                clusters.Add(node,box[:2])
+            self.clusters[zoom] = clusters
+        return self.clusters[zoom]
+
+    # Nodes and links added or deleted in the network
+    def AddNode(self,node):
+        (x,y) = self.network.V_coord[node]
+        self.nodes.Add(node,(x,y,x,y))
+        for clusters in self.clusters.values():
+            clusters.Add(node,(x,y))
+        self._Changed(node,self.nodes.boxes[node])
+
+    def DelNode(self,node):
+        for clusters in self.clusters.values():
+            clusters.Remove(node)
+        self.nodes.Remove(node)
+        if node in self.shown_nodes:
+            self._HideNode(node)
+        self._Changed(None,None)
+
+    def AddLink(self,edge):
+        box = self._LinkBox(edge)
+        self.links.Add(edge,box)
+        self._Changed(edge,box)
+
+    def DelLink(self,edge):
+        self.links.Remove(edge)
+        self.geometry.Remove(edge)
+        if edge in self.shown_links:
+            self._HideLink(edge)
+        self._Changed(None,None)
+
+    # Draw a node or link added in view. Clustered, a change can merge or
+    # split clusters, so the view is drawn again once the network is
+    # consistent; a node's links are deleted one at a time.
+    def _Changed(self,key,box):
+        if self.drawn == None:
+            return
+        (x0,y0,x1,y1,zoom) = self.drawn
+        if self.Clustered(zoom):
+            self._Clear()
+            self.canvas.after_idle(self.Update)
+        elif box != None and box[0] <= x1 and x0 <= box[2] and box[1] <= y1 and y0 <= box[3]:
+            if key in self.nodes:
+                self._DrawNode(key)
+            else:
+                self._DrawLink(key,[key],self.geometry.Get(key,self.zoom()))
+
+    # Draw what came into view and hide what left it. Nothing is done while
+    # the view stays well inside the area already drawn.
+    def Update(self):
+        zoom = self.zoom()
+        (x0,y0,x1,y1) = [v / zoom for v in canvas_view(self.canvas)]
+        margin = self.margin / zoom
+        if self.drawn != None:
+            (a0,b0,a1,b1,drawn_zoom) = self.drawn
+            if drawn_zoom == zoom:
+                half = margin / 2
+                if a0 <= x0 - half and b0 <= y0 - half and x1 + half <= a1 and y1 + half <= b1:
+                    return
+            elif (self.Clustered(zoom) or self.Clustered(drawn_zoom)
+                  or self.Detailed(zoom) != self.Detailed(drawn_zoom)):
+                # What is drawn differs between these zooms
+                self._Clear()
+            else:
+                self._Place(zoom)
+
+        area = (x0 - margin,y0 - margin,x1 + margin,y1 + margin)
+        self.drawn = area + (zoom,)
+        nodes = self.nodes.InRect(*area)
+
+        # Links are keyed by edge, or clustered by the pair of sites they join
+        links = {}
+        clusters = set()
+        if self.Clustered(zoom):
+            sites = self._Clusters(zoom)
+            for node in list(nodes):
+                site = sites.Site(node)
+                if site != node:
+                    nodes.discard(node)
+                    clusters.add(site)
+            for edge in self.links.InRect(*area):
+                (a,b) = (sites.Site(edge[0]),sites.Site(edge[1]))
+                if a != b:
+                    links.setdefault(frozenset((a,b)),(a,b,[]))[2].append(edge)
+        else:
+            for edge in self.links.InRect(*area):
+                links[edge] = (edge[0],edge[1],[edge])
+
+        for node in [n for n in self.shown_nodes if n not in nodes]:
+            self._HideNode(node)
+        for cell in [c for c in self.shown_clusters if c not in clusters]:
+            self._HideCluster(cell)
+        for key in [k for k in self.shown_links if k not in links]:
+            self._HideLink(key)
+        new = [(key,a,b,edges) for (key,(a,b,edges)) in links.items() if key not in self.shown_links]
+        for ((key,a,b,edges),geometry) in zip(new,self._Geometries(new,zoom)):
+            self._DrawLink(key,edges,geometry)
+        for node in nodes:
+            if node not in self.shown_nodes:
+                self._DrawNode(node)
+        for cell in clusters:
+            if cell not in self.shown_clusters:
+                self._DrawCluster(cell)
+
+    # Move the nodes and links drawn to their places at a new zoom. The
+    # canvas does not scale them; the icons and the offsets of labels and
+    # arrows keep their size on the screen.
+    def _Place(self,zoom):
+        canvas = self.canvas
+        for (node,(image,label,notify)) in self.shown_nodes.items():
+            (x,y) = self._Position(node,zoom)
+            canvas.coords(image,x,y)
+            canvas.coords(label,x,y + 20)
+            canvas.coords(notify,x - 8,y - 16)
+        for (edge,items) in self.shown_links.items():
+            (line,arrow1,arrow2,label) = self.geometry.Get(edge,zoom)
+            for (item,coords) in zip(items,(line,arrow1,arrow2,label)):
+                canvas.coords(item,*coords)
+
+    # Show the state of the nodes and links drawn: the notification icon
+    # at failed nodes, failed clusters in red and the colour of links.
+    # Only the items whose state changed are configured.
+    def Refresh(self):
+        for (node,(image,label,notify)) in self.shown_nodes.items():
+            self._Show(notify,'state',self._NotifyState(node))
+        for (cell,(circle,count)) in self.shown_clusters.items():
+            self._Show(circle,'fill',self._ClusterColour(cell))
+        for (key,items) in self.shown_links.items():
+            self._Show(items[0],'fill',self._LinkColour(key))
+
+    # Set an item's state option, unless it is already showing value
+    def _Show(self,item,option,value):
+        if self.displayed.get(item) != value:
+            self.displayed[item] = value
+            self.canvas.itemconfigure(item,**{option: value})
+
+    def _NotifyState(self,node):
+        if self.network.NodeOperational(node):
+            return 'hidden'
+        return 'normal'
+
+    def _ClusterColour(self,cell):
+        for node in self.clusters[self.drawn[4]].members[cell]:
+            if not self.network.NodeOperational(node):
+                return 'red'
+        return 'navy'
+
+    # The worst colour of the links a line stands for
+    def _LinkColour(self,key):
+        colours = set(link_colour(self.network,edge) for edge in self.link_edges[key])
+        for colour in ('red','green'):
+            if colour in colours:
+                return colour
+        return 'black'
+
+    # Canvas position of a node or cluster
+    def _Position(self,site,zoom):
+        if isinstance(site,tuple):
+            (x,y) = self.clusters[zoom].Centre(site)
+        else:
+            (x,y) = self.network.V_coord[site]
+        return (x * zoom,y * zoom)
+
+    def _DrawNode(self,node):
+        zoom = self.zoom()
+        (x,y) = self._Position(node,zoom)
+        label_state = 'normal' if self.Detailed(zoom) else 'hidden'
+        canvas = self.canvas
+        if self.free_nodes:
+            (image,label,notify) = self.free_nodes.pop()
+            canvas.coords(image,x,y)
+            canvas.itemconfigure(image,state='normal')
+            canvas.coords(label,x,y + 20)
+            canvas.itemconfigure(label,text=self.network.V_name[node],state=label_state)
+            canvas.coords(notify,x - 8,y - 16)
+        else:
+            image = canvas.create_image(x,y,
+                        image=self.icons['node'],
+                        activeimage=self.icons['node_active'],
+                        anchor='center',tags=('node',))
+            label = canvas.create_text(x,y + 20,
+                        text=self.network.V_name[node],
+                        anchor='center',fill='white',state=label_state)
+            notify = canvas.create_image(x - 8,y - 16,
+                        image=self.icons['notify'],anchor='se')
+            # Each raise goes just above the marker, so the icon ends up
+            # under its label and notification.
+            for item in (notify,label,image):
+                canvas.tag_raise(item,self.node_marker)
+        self._Show(notify,'state',self._NotifyState(node))
+        self.shown_nodes[node] = (image,label,notify)
+        self.item_node[image] = node
+
+    def _HideNode(self,node):
+        items = self.shown_nodes.pop(node)
+        del self.item_node[items[0]]
+        self._Release(items,self.free_nodes)
+
+    # A circle sized by the number of nodes, with the number in it
+    def _DrawCluster(self,cell):
+        zoom = self.zoom()
+        (x,y) = self._Position(cell,zoom)
+        n = self.clusters[zoom].Count(cell)
+        r = 8 + 3 * math.log(n)
+        fill = self._ClusterColour(cell)
+        circle = self.canvas.create_oval(x - r,y - r,x + r,y + r,
+                     fill=fill,outline='white',width=2)
+        self.displayed[circle] = fill
+        count = self.canvas.create_text(x,y,text=str(n),fill='white',anchor='center')
+        for item in (count,circle):
+            self.canvas.tag_raise(item,self.node_marker)
+        self.shown_clusters[cell] = (circle,count)
+
+    def _HideCluster(self,cell):
+        for item in self.shown_clusters.pop(cell):
+            self.displayed.pop(item,None)
+            self.canvas.delete(item)
+
+    # The geometry of each (key,site,site,edges) line. Links are looked up
+    # in the cache; the lines between clusters are computed together.
+    def _Geometries(self,lines,zoom):
+        geometries = []
+        joined = []
+        for (key,a,b,edges) in lines:
+            if key == edges[0]:
+                geometries.append(self.geometry.Get(key,zoom))
+            else:
+                joined.append(len(geometries))
+                geometries.append(None)
+        if joined:
+            starts = [self._Position(lines[i][1],zoom) for i in joined]
+            ends = [self._Position(lines[i][2],zoom) for i in joined]
+            for (i,row) in zip(joined,link_geometries(starts,ends).tolist()):
+                geometries[i] = split_geometry(row)
+        return geometries
+
+    # Draw the line for key, standing for edges
+    def _DrawLink(self,key,edges,geometry):
+        zoom = self.zoom()
+        (line,arrow1,arrow2,(label_x,label_y)) = geometry
+        self.link_edges[key] = edges
+        fill = self._LinkColour(key)
+        # Arrows and distances only make sense for a single link
+        detail_state = 'hidden'
+        if self.Detailed(zoom) and len(edges) == 1:
+            detail_state = 'normal'
+        text = '%0.2f km' % self.network.E_lengths[edges[0]]
+        canvas = self.canvas
+        if self.free_links:
+            items = self.free_links.pop()
+            for (item,coords) in zip(items,(line,arrow1,arrow2)):
+                canvas.coords(item,*coords)
+                canvas.itemconfigure(item,state=detail_state)
+            canvas.itemconfigure(items[0],fill=fill,state='normal')
+            self.displayed[items[0]] = fill
+            canvas.coords(items[3],label_x,label_y)
+            canvas.itemconfigure(items[3],text=text,state=detail_state)
+        else:
+            items = (canvas.create_line(*line,fill=fill,activefill='purple',width=3,tags=('link',)),
+                     canvas.create_line(*arrow1,fill='blue',width=2,state=detail_state),
+                     canvas.create_line(*arrow2,fill='blue',width=2,state=detail_state),
+                     canvas.create_text(label_x,label_y,anchor='center',text=text,fill='white',
+                                        state=detail_state))
+            for item in reversed(items):
+                canvas.tag_raise(item,self.link_marker)
+            self.displayed[items[0]] = fill
+        self.shown_links[key] = items
+        self.item_link[items[0]] = edges
+
+    def _HideLink(self,key):
+        items = self.shown_links.pop(key)
+        del self.link_edges[key]
+        del self.item_link[items[0]]
+        self._Release(items,self.free_links)
+
+    # Hide items for reuse, or delete them once the pool is full
+    def _Release(self,items,pool):
+        for item in items:
+            self.displayed.pop(item,None)
+        if len(pool) < POOL:
+            for item in items:
+                self.canvas.itemconfigure(item,state='hidden')
+            pool.append(items)
+        else:
+            for item in items:
+                self.canvas.delete(item)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,307 @@
+# routing.py
+# Routes a turn's traffic away from the live network.
+#
+# A RoutingSnapshot copies what the capacity phase of a turn reads: the
+# graph, the node coordinates, the starting capacity of every node and link
+# and the cities. Route() then does what Simulation.UpdateCapacity does to
+# the network, CapReset and CapAtCoord for each city, on the copy. Nothing
+# else holds on to the copy, so a RoutingWorker can route it in a thread
+# while the Tk thread goes on drawing and handling dialogs, which may
+# change the network meanwhile. The result is committed to the network by
+# the Tk thread, with Simulation.CommitCapacity.
+#
+# A ParallelRouter finds the paths of a turn in a pool of processes. The
+# processes attach to the graph in shared memory (see sharedgraph.py) once
+# per topology, i.e. until a node or link is added or deleted; each turn
+# the link capacities the costs come from are written there in place and
+# only the pairs of nodes to route are sent to them. Paths are found with
+# the capacities of the start of the turn rather than as left by the cities
+# routed before, so they do not depend on each other; the traffic is then
+# sent along them a city at a time, in order, as before. The result does not
+# depend on the number of processes.
+#
+# A cancelled RoutingWorker thread runs on until its snapshot is routed, so
+# two threads may share a ParallelRouter for a while; it lets one use its
+# pool and shared graph at a time.
+
+import _thread
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+
+import dyjkstra
+from digraph import Digraph
+from networkgraph import NetworkGraph
+from overlay import BaseCaps
+from sharedgraph import export_graph,attach_graph
+
+# Fewer pairs of nodes than this are routed without the pool
+MIN_PARALLEL = 64
+
+# Tasks per process each turn, so the processes finish at about the same
+# time however long their paths take
+TASKS_PER_PROCESS = 4
+
+class RoutingSnapshot(NetworkGraph):
+    """
+    Tests:
+    >>> import copy
+    >>> from benchmark import synthetic_level
+    >>> from database import CapitalDatabase
+    >>> sim = synthetic_level(CapitalDatabase(),30,n_cities=4)
+    >>> snapshot = RoutingSnapshot(sim.gameNetwork,sim.economy.GetCities())
+    >>> supplies = snapshot.Route()
+
+    The same as routing the network itself:
+    >>> sim.UpdateCapacity()
+    >>> supplies == [city.GetSupply() for city in sim.economy.GetCities()]
+    True
+    >>> snapshot.cap_at_edge == sim.gameNetwork.cap_at_edge
+    True
+    """
+
+    # Copy network and the cities' coordinates and ranges. Called on the
+    # thread which changes the network. The paths are found with router,
+    # a ParallelRouter, if it is given.
+    def __init__(self,network,cities,router=None):
+        self.graph = make_graph(network.graph.vertices(),network.graph.edges())
+        self.V_coord = dict(network.V_coord)
+        self.E_lengths = dict(network.E_lengths)
+        # Routing only looks at which nodes there are, not at their items
+        self.V_items = dict.fromkeys(network.V_items)
+        (self.node_caps,self.edge_caps) = BaseCaps(network)
+
+        self.cities = [(city.GetCoord(),city.range) for city in cities]
+        self.city_coords = [coord for (coord,range) in self.cities]
+        self.router = router
+
+        self.cap_at_node = {}
+        self.cap_at_edge = {}
+
+    # The starting capacities, as copied from the network
+    def MaxCapAtNode(self,node):
+        return self.node_caps[node]
+
+    def MaxCapAtEdge(self,edge):
+        return self.edge_caps[edge]
+
+    # Route the traffic of every city. Returns the supply of each, in the
+    # order of the cities given; the capacities left are in cap_at_node
+    # and cap_at_edge.
+    def Route(self):
+        self.CapReset()
+        if self.router != None:
+            return route_parallel(self,self.cities,self.router)
+        supplies = []
+        for (coord,range) in self.cities:
+            supplies.append(self.CapAtCoord(coord,self.city_coords,range))
+        return supplies
+
+# The SharedGraph a pool process is attached to, and its graph
+_shared = None
+_graph = None
+
+# Runs in each new pool process
+def _attach(name):
+    global _shared,_graph
+    _shared = attach_graph(name)
+    _graph = _shared.Graph()
+
+# Runs in the pool processes
+def _find_paths(pairs):
+    return find_paths(_graph,_shared.Edges(),_shared.edge_caps.tolist(),pairs)
+
+def make_graph(vertices,edges):
+    graph = Digraph()
+    for v in vertices:
+        graph.add_vertex(v)
+    for e in edges:
+        graph.add_edge(e)
+    return graph
+
+# The least cost path between each pair of nodes, where caps are the
+# capacities of edges. The costs are NetworkGraph.cost's.
+def find_paths(graph,edges,caps,pairs):
+    cap_at_edge = dict(zip(edges,caps))
+    def cost(e):
+        cap = cap_at_edge[e]
+        if cap == 0: return 0
+        return 1/cap
+    return [dyjkstra.least_cost_path(graph,start,end,cost) for (start,end) in pairs]
+
+# Route the traffic of each (coord,range) of points over network, whose
+# capacities have been reset, with the paths found by router. Returns the
+# supply at each point.
+def route_parallel(network,points,router):
+    to_pts = [coord for (coord,range) in points]
+    ends = [network.RouteEnds(coord,to_pts,range) for (coord,range) in points]
+
+    # Each pair once, in the order they are first needed
+    pairs = {}
+    for (closest,to_nodes) in ends:
+        for node in closest:
+            for to_node in to_nodes:
+                if to_node != node:
+                    pairs[(node,to_node)] = None
+                    pairs[(to_node,node)] = None
+    paths = router.Paths(network,list(pairs))
+
+    supplies = []
+    for ((coord,range),(closest,to_nodes)) in zip(points,ends):
+        supplies.append(network.CapBetween(coord,closest,to_nodes,paths))
+    return supplies
+
+class ParallelRouter():
+    """
+    Tests:
+    >>> from benchmark import synthetic_level
+    >>> from database import CapitalDatabase
+    >>> sim = synthetic_level(CapitalDatabase(),60,n_cities=6)
+    >>> network = sim.gameNetwork
+    >>> network.CapReset()
+    >>> nodes = sorted(network.GetNodes())
+    >>> pairs = [(a,b) for a in nodes[:10] for b in nodes[-10:]]
+
+    The pool finds the same paths as one process:
+    >>> router = ParallelRouter(2)
+    >>> paths = router.Paths(network,pairs)
+    >>> paths == ParallelRouter(1).Paths(network,pairs)
+    True
+    >>> all(paths[pair] == None or (paths[pair][0],paths[pair][-1]) == pair for pair in pairs)
+    True
+
+    The pool is given the graph again only when the topology changes:
+    >>> pool = router.pool
+    >>> paths = router.Paths(network,pairs)
+    >>> router.pool is pool
+    True
+    >>> network.DelLink(sorted(network.GetEdges())[0]) != None
+    True
+    >>> network.CapReset()
+    >>> paths = router.Paths(network,pairs)
+    >>> router.pool is pool
+    False
+    >>> router.Close()
+    """
+
+    # processes is the size of the pool, by default the number of CPUs
+    def __init__(self,processes=None):
+        if processes == None:
+            processes = os.cpu_count() or 1
+        self.processes = processes
+        self.pool = None
+        # The SharedGraph the pool's processes are attached to, and the
+        # (vertices,edges) of its topology
+        self.shared = None
+        self.topology = None
+        # Held while the pool or the shared graph are used or changed
+        self.lock = _thread.allocate_lock()
+
+    # The least cost path of each (start,end) pair in pairs, by pair, with
+    # the costs of network's cap_at_edge
+    def Paths(self,network,pairs):
+        vertices = tuple(sorted(network.graph.vertices()))
+        edges = tuple(sorted(network.graph.edges()))
+
+        if self.processes < 2 or len(pairs) < MIN_PARALLEL:
+            caps = [network.cap_at_edge[e] for e in edges]
+            return dict(zip(pairs,find_paths(make_graph(vertices,edges),edges,caps,pairs)))
+
+        size = -(-len(pairs) // (self.processes * TASKS_PER_PROCESS))
+        chunks = [pairs[i:i + size] for i in range(0,len(pairs),size)]
+        paths = {}
+        with self.lock:
+            if (vertices,edges) != self.topology:
+                self._Close()
+                self.shared = export_graph(network)
+                self.pool = ProcessPoolExecutor(self.processes,initializer=_attach,initargs=(self.shared.name,))
+                self.topology = (vertices,edges)
+            else:
+                # The processes only read the capacities while finding
+                # paths, which is done by the time the lock is let go
+                self.shared.SetCaps(network)
+
+            for (chunk,found) in zip(chunks,self.pool.map(_find_paths,chunks)):
+                paths.update(zip(chunk,found))
+        return paths
+
+    # Stop the pool's processes and free the shared graph, once any paths
+    # being found are done
+    def Close(self):
+        with self.lock:
+            self._Close()
+
+    def _Close(self):
+        if self.pool != None:
+            self.pool.shutdown()
+        if self.shared != None:
+            self.shared.Close()
+            self.shared.Unlink()
+        self.pool = None
+        self.shared = None
+        self.topology = None
+
+class RoutingWorker():
+    """
+    Tests:
+    >>> import time
+    >>> from benchmark import synthetic_level
+    >>> from database import CapitalDatabase
+    >>> sim = synthetic_level(CapitalDatabase(),30,n_cities=4)
+    >>> worker = RoutingWorker()
+    >>> worker.Result() == None
+    True
+    >>> snapshot = RoutingSnapshot(sim.gameNetwork,sim.economy.GetCities())
+    >>> worker.Start(snapshot)
+    >>> result = worker.Result()
+    >>> while result == None:
+    ...     time.sleep(0.01)
+    ...     result = worker.Result()
+    >>> result[0] is snapshot, worker.Routing()
+    (True, False)
+    """
+
+    def __init__(self):
+        # (snapshot,supplies,error) of each snapshot routed
+        self.results = queue.Queue()
+        # The snapshot being routed, None when there is none
+        self.snapshot = None
+
+    def Routing(self):
+        return self.snapshot != None
+
+    # Route snapshot in a new thread
+    def Start(self,snapshot):
+        self.snapshot = snapshot
+        _thread.start_new_thread(self._Route,(snapshot,))
+
+    # Forget the snapshot being routed; its result will be dropped
+    def Cancel(self):
+        self.snapshot = None
+
+    # The (snapshot,supplies) routed, or None while routing. An error
+    # raised by the worker is raised again here.
+    def Result(self):
+        while True:
+            try:
+                (snapshot,supplies,error) = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            # Results of cancelled snapshots are dropped
+            if snapshot is self.snapshot:
+                break
+        self.snapshot = None
+        if error != None:
+            raise error
+        return (snapshot,supplies)
+
+    # Runs in the worker thread
+    def _Route(self,snapshot):
+        try:
+            self.results.put((snapshot,snapshot.Route(),None))
+        except Exception as error:
+            self.results.put((snapshot,None,error))
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
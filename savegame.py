@@ -0,0 +1,417 @@
+# savegame.py
+# Saves and loads the state of a game.
+#
+# A save file is a header followed by zlib compressed sections, an index of
+# the sections and a trailer pointing at the index:
+#
+#     header   'TNTS' magic, format version
+#     section  tag, chunk, length, data         (any number)
+#     index    'INDX', count, then tag, chunk, offset, length per section
+#     trailer  index offset, 'TEND'
+#
+# Node coordinates and links are stored as binary arrays; items are stored
+# as JSON by catalog reference, as in actionlog, so the file does not
+# depend on the item classes. Nodes are split into chunks by id, CHUNK ids
+# to a chunk, and each link goes in the chunk of its start node, so adding
+# or deleting a node changes only its own chunk. The order of the links,
+# which their items are updated in, is a section of its own.
+#
+# Autosaving encodes only the chunks of the nodes and links the simulation
+# marked changed (see Simulation.changed) and appends those of them which
+# differ from the last save, followed by a new index and trailer; the last
+# trailer in the file is the one read. Items at nodes and links store the
+# turn they were made rather than their age, so they only change when the
+# player or a failure changes them. Once the file holds more old sections
+# than live ones it is rewritten. If an append is cut short, e.g. by a crash, the file is loaded
+# from the last complete index and trailer before it, i.e. as it was at the
+# save before.
+
+import hashlib
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from database import CapitalDatabase
+from networkgraph import NetworkGraph
+from actionlog import encode_item,decode_item
+
+MAGIC = b'TNTS'
+VERSION = 2
+
+# Node ids per chunk
+CHUNK = 1024
+
+HEADER = struct.Struct('<4sI')
+SECTION = struct.Struct('<4siI')
+INDEX_ENTRY = struct.Struct('<4siQI')
+TRAILER = struct.Struct('<Q4s')
+
+# Encode the items at a node or link, with the turn each was made in place
+# of its age.
+def encode_placed(database,items,turn):
+    data = []
+    for item in items:
+        item_data = encode_item(database,item)
+        set_born(item_data,item,turn)
+        data.append(item_data)
+    return data
+
+def set_born(data,item,turn):
+    data[2].pop('age',None)
+    data[2]['born'] = turn - item.GetAge()
+    if len(data) > 3:
+        for (sub_data,sub) in zip(data[3],item.GetInventory()):
+            set_born(sub_data,sub,turn)
+
+def decode_placed(database,data,turn):
+    items = []
+    for item_data in data:
+        items.append(decode_item(database,set_age(item_data,turn)))
+    return items
+
+def set_age(data,turn):
+    state = dict(data[2])
+    state['age'] = turn - state.pop('born')
+    if len(data) > 3:
+        return [data[0],data[1],state,[set_age(sub,turn) for sub in data[3]]]
+    return [data[0],data[1],state]
+
+# The chunk of a node, or of a link: that of its start node
+def chunk_of(place):
+    if isinstance(place,tuple):
+        place = place[0]
+    return place // CHUNK
+
+# The sections of a simulation, as a dictionary of raw data by (tag,chunk)
+def encode_sections(sim,database):
+    network = sim.gameNetwork
+    sections = encode_game(sim,database)
+    for chunk in sorted({chunk_of(node) for node in network.V_items}):
+        sections.update(encode_chunk(network,database,sim.turn,chunk))
+    sections[(b'ORDR',-1)] = encode_order(network)
+    return sections
+
+# The sections of the game's state other than the network
+def encode_game(sim,database):
+    network = sim.gameNetwork
+    game = {'cash': sim.cash,
+            'turn': sim.turn,
+            'seed': sim.seed,
+            'random': sim.random.getstate(),
+            'vertex_counter': network.vertex_counter,
+            'scale_factor': network.scale_factor,
+            'max_slots': network.max_slots,
+            'populations': [city.population for city in sim.economy.GetCities()]}
+    return {(b'GAME',-1): json.dumps(game).encode(),
+            (b'INVN',-1): json.dumps([encode_item(database,item) for item in sim.inventory]).encode()}
+
+# The sections of a chunk's nodes and links; none if it has no nodes
+def encode_chunk(network,database,turn,chunk):
+    sections = {}
+    ids = [n for n in range(chunk * CHUNK,(chunk + 1) * CHUNK) if n in network.V_items]
+    if not ids:
+        return sections
+
+    coords = np.array([network.V_coord[n] for n in ids],dtype='<f8')
+    names = '\0'.join(network.V_name[n] for n in ids).encode()
+    sections[(b'NODE',chunk)] = (struct.pack('<I',len(ids)) + np.array(ids,dtype='<i4').tobytes()
+                                 + coords.tobytes() + names)
+    items = [encode_placed(database,network.V_items[n],turn) for n in ids]
+    sections[(b'NITM',chunk)] = json.dumps(items,separators=(',',':')).encode()
+
+    edges = sorted((n,w) for n in ids for w in network.graph.adj_to(n) if (n,w) in network.E_items)
+    if edges:
+        lengths = np.array([network.E_lengths[e] for e in edges],dtype='<f8')
+        sections[(b'LINK',chunk)] = (struct.pack('<I',len(edges)) + np.array(edges,dtype='<i4').tobytes()
+                                     + lengths.tobytes())
+        items = [encode_placed(database,network.E_items[e],turn) for e in edges]
+        sections[(b'LITM',chunk)] = json.dumps(items,separators=(',',':')).encode()
+    return sections
+
+# The links in the order of the network's dictionary, which their items
+# are updated in
+def encode_order(network):
+    return np.array(list(network.E_items),dtype='<i4').tobytes()
+
+# Restore a simulation from its sections
+def decode_sections(sim,sections,database):
+    game = json.loads(sections[(b'GAME',-1)])
+    turn = game['turn']
+
+    network = NetworkGraph(game['scale_factor'])
+    network.max_slots = game['max_slots']
+    network.vertex_counter = game['vertex_counter']
+
+    # Node ids only grow, so the nodes in id order are in the order of the
+    # network's dictionaries
+    for ((tag,chunk),data) in sorted(sections.items()):
+        if tag != b'NODE':
+            continue
+        (n,) = struct.unpack_from('<I',data)
+        ids = np.frombuffer(data,dtype='<i4',count=n,offset=4).tolist()
+        coords = np.frombuffer(data,dtype='<f8',count=2 * n,offset=4 + 4 * n).reshape(n,2).tolist()
+        names = data[4 + 20 * n:].decode().split('\0')
+        items = json.loads(sections[(b'NITM',chunk)])
+        for i in range(n):
+            node = ids[i]
+            network.graph.add_vertex(node)
+            network.V_coord[node] = tuple(coords[i])
+            network.V_name[node] = names[i]
+            network.V_items[node] = decode_placed(database,items[i],turn)
+
+    # The (length,items) of each link, put in the network in order below
+    links = {}
+    for ((tag,chunk),data) in sections.items():
+        if tag != b'LINK':
+            continue
+        (n,) = struct.unpack_from('<I',data)
+        edges = np.frombuffer(data,dtype='<i4',count=2 * n,offset=4).reshape(n,2).tolist()
+        lengths = np.frombuffer(data,dtype='<f8',count=n,offset=4 + 8 * n).tolist()
+        items = json.loads(sections[(b'LITM',chunk)])
+        for i in range(n):
+            links[tuple(edges[i])] = (lengths[i],items[i])
+
+    for e in np.frombuffer(sections[(b'ORDR',-1)],dtype='<i4').reshape(-1,2).tolist():
+        e = tuple(e)
+        (length,items) = links[e]
+        network.graph.add_edge(e)
+        network.E_lengths[e] = length
+        network.E_items[e] = decode_placed(database,items,turn)
+
+    network.CapReset()
+    network.CapCache()
+
+    sim.gameNetwork = network
+    sim.cash = game['cash']
+    sim.turn = turn
+    sim.seed = game['seed']
+    (version,state,gauss) = game['random']
+    sim.random.setstate((version,tuple(state),gauss))
+    for (city,population) in zip(sim.economy.GetCities(),game['populations']):
+        city.population = population
+    sim.inventory = [decode_item(database,item) for item in json.loads(sections[(b'INVN',-1)])]
+
+class SaveFile():
+    """
+    Tests:
+    >>> import os, tempfile, copy
+    >>> from benchmark import synthetic_level
+    >>> data = CapitalDatabase()
+    >>> sim = synthetic_level(data,50,n_cities=3)
+    >>> sim.inventory.append(data.GetRadio(1))
+    >>> for turn in range(3):
+    ...     (maintenance,revenue) = sim.Step()
+    >>> (fd,filename) = tempfile.mkstemp()
+    >>> os.close(fd)
+    >>> save = SaveFile(filename,data)
+    >>> save.Save(sim)
+
+    >>> from simulation import Simulation
+    >>> loaded = Simulation(copy.deepcopy(sim.economy))
+    >>> SaveFile(filename,data).Load(loaded)
+    >>> (loaded.turn, loaded.cash == sim.cash, len(loaded.gameNetwork.GetNodes()))
+    (4, True, 50)
+    >>> loaded.gameNetwork.E_lengths == sim.gameNetwork.E_lengths
+    True
+
+    Both play on the same:
+    >>> for turn in range(20):
+    ...     (a,b) = (sim.Step(),loaded.Step())
+    >>> loaded.cash == sim.cash
+    True
+
+    Autosaving only writes what changed; here one node's items:
+    >>> node = min(sim.gameNetwork.GetNodes())
+    >>> sim.gameNetwork.V_items[node].pop()     # doctest: +ELLIPSIS
+    <capital.Building object at ...>
+    >>> sim.changed.add(node)
+    >>> save.Update(sim)
+    >>> sorted(tag for (tag,chunk) in save.written)
+    [b'GAME', b'NITM']
+    >>> SaveFile(filename,data).Load(loaded)
+    >>> len(loaded.gameNetwork.V_items[node])
+    1
+
+    An append cut short loses only that save, and the file is loaded as it
+    was at the save before:
+    >>> item = sim.gameNetwork.V_items[node].pop()
+    >>> sim.changed.add(node)
+    >>> size = os.path.getsize(filename)
+    >>> save.Update(sim)
+    >>> with open(filename,'r+b') as f:
+    ...     size_left = f.truncate(os.path.getsize(filename) - 5)
+    >>> SaveFile(filename,data).Load(loaded)
+    >>> len(loaded.gameNetwork.V_items[node])
+    1
+    >>> with open(filename,'r+b') as f:
+    ...     size_left = f.truncate(size - 5)
+    >>> SaveFile(filename,data).Load(loaded)
+    >>> len(loaded.gameNetwork.V_items[node])
+    2
+
+    Deleting a node writes its own chunk again, but not those after it:
+    >>> big = synthetic_level(data,1100,n_cities=3)
+    >>> save.Save(big)
+    >>> deleted = big.ApplyAction(['delnode',[3]])
+    >>> save.Update(big)
+    >>> sorted(save.written)
+    [(b'LINK', 0), (b'LITM', 0), (b'NITM', 0), (b'NODE', 0), (b'ORDR', -1)]
+    >>> SaveFile(filename,data).Load(loaded)
+    >>> list(loaded.gameNetwork.E_items) == list(big.gameNetwork.E_items)
+    True
+    >>> os.remove(filename)
+    """
+
+    def __init__(self,filename,database=None):
+        if database == None:
+            database = CapitalDatabase()
+        self.filename = filename
+        self.database = database
+
+        # (offset,length,digest) of the live sections by (tag,chunk)
+        self.sections = {}
+        # Bytes of old sections in the file
+        self.garbage = 0
+        # The sections written by the last save
+        self.written = []
+
+    # Write every section to a new file
+    def Save(self,sim):
+        sections = encode_sections(sim,self.database)
+        temp = self.filename + '.tmp'
+        with open(temp,'wb') as outFile:
+            outFile.write(HEADER.pack(MAGIC,VERSION))
+            self.sections = {}
+            self._Append(outFile,sections)
+        os.replace(temp,self.filename)
+        self.garbage = 0
+        sim.changed = set()
+        sim.links_changed = False
+
+    # Append the sections which changed since the last save or load, out
+    # of those of the chunks the simulation marked changed. The whole file
+    # is rewritten if it has not been saved yet, or when it is more than
+    # half old sections.
+    def Update(self,sim):
+        if not self.sections or not os.path.exists(self.filename):
+            self.Save(sim)
+            return
+
+        network = sim.gameNetwork
+        sections = encode_game(sim,self.database)
+        chunks = {chunk_of(place) for place in sim.changed}
+        for chunk in chunks:
+            sections.update(encode_chunk(network,self.database,sim.turn,chunk))
+        if sim.links_changed:
+            sections[(b'ORDR',-1)] = encode_order(network)
+
+        changed = {}
+        for (key,data) in sections.items():
+            if key not in self.sections or self.sections[key][2] != digest(data):
+                changed[key] = data
+        for key in list(self.sections):
+            # The sections of a changed chunk it no longer has, e.g. once
+            # its last node was deleted, are dropped
+            gone = key[1] in chunks and key not in sections
+            if key in changed or gone:
+                self.garbage = self.garbage + self.sections[key][1]
+                if gone:
+                    del self.sections[key]
+        sim.changed = set()
+        sim.links_changed = False
+
+        live = sum(length for (offset,length,d) in self.sections.values())
+        if self.garbage > live:
+            self.Save(sim)
+            return
+
+        try:
+            with open(self.filename,'r+b') as outFile:
+                outFile.seek(0,os.SEEK_END)
+                self._Append(outFile,changed)
+        except:
+            # What reached the file is unknown, so the next save rewrites it
+            self.sections = {}
+            raise
+
+    # Write sections, the index and the trailer at the file position
+    def _Append(self,outFile,sections):
+        self.written = []
+        for (key,data) in sections.items():
+            packed = zlib.compress(data)
+            offset = outFile.tell()
+            outFile.write(SECTION.pack(key[0],key[1],len(packed)))
+            outFile.write(packed)
+            self.sections[key] = (offset,SECTION.size + len(packed),digest(data))
+            self.written.append(key)
+
+        index_offset = outFile.tell()
+        outFile.write(b'INDX' + struct.pack('<I',len(self.sections)))
+        for ((tag,chunk),(offset,length,d)) in self.sections.items():
+            outFile.write(INDEX_ENTRY.pack(tag,chunk,offset,length))
+        outFile.write(TRAILER.pack(index_offset,b'TEND'))
+
+    # Restore the state of a simulation from the file. The simulation
+    # keeps its economy; the cities' populations are restored.
+    def Load(self,sim):
+        with open(self.filename,'rb') as inFile:
+            contents = inFile.read()
+        if len(contents) < HEADER.size:
+            raise ValueError(self.filename + ' is not a saved game')
+        (magic,version) = HEADER.unpack_from(contents)
+        if magic != MAGIC:
+            raise ValueError(self.filename + ' is not a saved game')
+        if version != VERSION:
+            raise ValueError('unsupported saved game version ' + str(version))
+
+        end = len(contents)
+        index_offset = find_index(contents)
+        if index_offset == None:
+            raise ValueError(self.filename + ' is truncated')
+
+        (tag,count) = struct.unpack_from('<4sI',contents,index_offset)
+        index = [INDEX_ENTRY.unpack_from(contents,index_offset + 8 + i * INDEX_ENTRY.size)
+                 for i in range(count)]
+
+        # Each section is decompressed from its place in contents, without
+        # copying it
+        view = memoryview(contents)
+        sections = {}
+        self.sections = {}
+        for (tag,chunk,offset,length) in index:
+            data = zlib.decompress(view[offset + SECTION.size:offset + length])
+            sections[(tag,chunk)] = data
+            self.sections[(tag,chunk)] = (offset,length,digest(data))
+
+        live = sum(length for (offset,length,d) in self.sections.values())
+        self.garbage = end - live
+        decode_sections(sim,sections,self.database)
+        sim.changed = set()
+        sim.links_changed = False
+
+# The offset of the last complete index in contents, the bytes of a save
+# file, or None if there is none. An index is complete when its trailer
+# follows it and points back at its 'INDX' tag.
+def find_index(contents):
+    end = len(contents)
+    while True:
+        end = contents.rfind(b'TEND',HEADER.size,end)
+        if end < 0:
+            return None
+        start = end + 4 - TRAILER.size
+        if start >= HEADER.size:
+            (index_offset,tag) = TRAILER.unpack_from(contents,start)
+            if HEADER.size <= index_offset <= start - 8 and contents[index_offset:index_offset + 4] == b'INDX':
+                (count,) = struct.unpack_from('<I',contents,index_offset + 4)
+                if index_offset + 8 + count * INDEX_ENTRY.size == start:
+                    return index_offset
+
+def digest(data):
+    return hashlib.blake2b(data,digest_size=16).digest()
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
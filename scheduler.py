@@ -0,0 +1,152 @@
+# scheduler.py
+# Decides when to run turns and when to draw, so the game runs at the
+# chosen number of turns per second whatever a turn costs.
+#
+# Each frame runs the turns which have come due since the last frame, as
+# many as fit in TURN_SHARE of a frame judging by what turns have cost so
+# far, and the window is then drawn once. Frames are at most MAX_FPS a
+# second. Turns which did not fit are carried to the next frame, up to two
+# frames' worth; beyond that the game runs slower than asked, which shows
+# in TurnsPerSecond.
+
+from collections import deque
+from time import perf_counter
+
+# Most frames drawn a second
+MAX_FPS = 30
+
+# Part of a frame which may be spent on turns; the rest is left for drawing
+# and for Tk to handle input
+TURN_SHARE = 0.6
+
+# Seconds over which the achieved turns per second is measured
+RATE_WINDOW = 2.0
+
+class FrameScheduler():
+    """
+    Tests, with a clock which only moves when turns are run or the test
+    waits:
+    >>> class Clock():
+    ...     def __init__(self):
+    ...         self.now = 0.0
+    ...     def __call__(self):
+    ...         return self.now
+    >>> clock = Clock()
+    >>> def turn():
+    ...     clock.now = clock.now + 0.005
+    >>> frames = FrameScheduler(rate=100,clock=clock)
+
+    The first frame runs a turn right away, later frames run the turns
+    which came due while waiting:
+    >>> frames.Frame(turn)
+    1
+    >>> frames.Delay()
+    28
+    >>> clock.now = clock.now + 0.028
+    >>> frames.Frame(turn)
+    3
+    >>> for i in range(100):
+    ...     clock.now = clock.now + frames.Delay() / 1000
+    ...     n = frames.Frame(turn)
+    >>> round(frames.TurnsPerSecond())
+    100
+
+    When turns cost more than a frame allows, fewer are run each frame:
+    >>> def slow_turn():
+    ...     clock.now = clock.now + 0.015
+    >>> for i in range(100):
+    ...     clock.now = clock.now + frames.Delay() / 1000
+    ...     n = frames.Frame(slow_turn)
+    >>> n, round(frames.TurnsPerSecond())
+    (1, 30)
+
+    At a slow rate the next frame waits for the next turn:
+    >>> frames.SetRate(2)
+    >>> frames.Restart()
+    >>> frames.Frame(turn), frames.Delay()
+    (1, 495)
+
+    A turn which could not be run stays due:
+    >>> clock.now = clock.now + 0.5
+    >>> frames.Frame(lambda: False), frames.Delay(), frames.Frame(turn)
+    (0, 33, 1)
+    """
+
+    # rate is the turns per second asked for, clock a function giving
+    # the time in seconds
+    def __init__(self,rate=1.0,fps=MAX_FPS,clock=perf_counter):
+        self.rate = rate
+        self.frame = 1.0 / fps
+        self.clock = clock
+        # Turns come due but not yet run
+        self.owed = 0.0
+        # Moving average of the seconds a turn takes
+        self.turn_cost = 0.0
+        # When the last frame started, None before the first
+        self.last = None
+        # (start,turns run) of recent frames
+        self.frames = deque()
+
+    def SetRate(self,rate):
+        self.rate = rate
+
+    # Start afresh after the game was paused, so the turns of the pause
+    # are not run in a rush
+    def Restart(self):
+        self.last = None
+        self.owed = 0.0
+        self.frames.clear()
+
+    # Run the turns due with step_fn. Returns the number run. step_fn may
+    # return False when it could not run a turn, e.g. while a worker is
+    # still routing one; the frame then ends and the turn stays due.
+    def Frame(self,step_fn):
+        now = self.clock()
+        if self.last == None:
+            self.owed = 1.0
+        else:
+            self.owed = min(self.owed + (now - self.last) * self.rate,
+                            max(1.0,2 * self.rate * self.frame))
+        self.last = now
+
+        budget = self.frame * TURN_SHARE
+        turns = 0
+        # At least one turn is run if one is due, however long it takes
+        while self.owed >= 1 and (turns == 0 or self.clock() - now + self.turn_cost <= budget):
+            start = self.clock()
+            if step_fn() == False:
+                break
+            cost = self.clock() - start
+            if self.turn_cost == 0:
+                self.turn_cost = cost
+            else:
+                self.turn_cost = 0.8 * self.turn_cost + 0.2 * cost
+            self.owed = self.owed - 1
+            turns = turns + 1
+
+        self.frames.append((now,turns))
+        while now - self.frames[0][0] > RATE_WINDOW:
+            self.frames.popleft()
+        return turns
+
+    # Milliseconds to wait before the next frame: at least until a frame
+    # time after this one started, and until the next turn is due
+    def Delay(self):
+        now = self.clock()
+        wait = self.frame - (now - self.last)
+        if self.owed < 1 and self.rate > 0:
+            wait = max(wait,(1 - self.owed) / self.rate - (now - self.last))
+        return max(1,int(round(wait * 1000)))
+
+    # Turns run a second over the last RATE_WINDOW seconds
+    def TurnsPerSecond(self):
+        if len(self.frames) < 2:
+            return 0.0
+        span = self.frames[-1][0] - self.frames[0][0]
+        # The turns of the first frame were due before the span started
+        turns = sum(n for (start,n) in self.frames) - self.frames[0][1]
+        return turns / span
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
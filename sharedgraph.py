@@ -0,0 +1,180 @@
+# sharedgraph.py
+# A network's graph in shared memory, for other processes to read without
+# copying it.
+#
+# export_graph lays out a network's topology, node coordinates, link
+# lengths and capacities as NumPy arrays in one multiprocessing.shared_memory
+# block, after a small header giving their sizes. Another process attaches
+# with attach_graph(name) and gets arrays on the same memory, so only the
+# block's name is passed to it. While the topology stays the same the
+# capacities can be rewritten in place with SetCaps, e.g. each turn.
+#
+# Layout of the block, in this order:
+#
+#     header      int64[HEADER]       MAGIC, FORMAT, nodes, edges
+#     node ids    int64[nodes]        in increasing order
+#     coords      float64[nodes,2]
+#     node caps   float64[nodes]      cap_at_node
+#     edges       int64[edges,2]      (start,end) indices into node ids,
+#                                     ordered by start then end
+#     lengths     float64[edges]      E_lengths
+#     edge caps   float64[edges]      cap_at_edge
+#     offsets     int64[nodes + 1]    the links from node i are
+#                                     edges[offsets[i]:offsets[i + 1]]
+
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from digraph import Digraph
+
+# Marks a block as a SharedGraph, and the version of its layout
+MAGIC = 0x47524150484e5454
+FORMAT = 1
+
+# Header size, in int64s
+HEADER = 8
+
+class SharedGraph():
+    """
+    Tests:
+    >>> from benchmark import synthetic_level
+    >>> from database import CapitalDatabase
+    >>> network = synthetic_level(CapitalDatabase(),40).gameNetwork
+    >>> network.CapReset()
+    >>> shared = export_graph(network)
+    >>> other = attach_graph(shared.name)
+    >>> (len(other.node_ids), len(other.edges)) == (len(network.GetNodes()), len(network.GetEdges()))
+    True
+    >>> sorted(other.Edges()) == sorted(network.GetEdges())
+    True
+    >>> start = other.node_ids[0]
+    >>> links = other.edges[other.offsets[0]:other.offsets[1]]
+    >>> sorted(other.node_ids[links[:,1]].tolist()) == sorted(network.graph.adj_to(start))
+    True
+    >>> e = other.Edges()[0]
+    >>> bool(other.edge_caps[0] == network.cap_at_edge[e]), bool(other.lengths[0] == network.E_lengths[e])
+    (True, True)
+
+    Capacities written by one process are seen by the other:
+    >>> network.cap_at_edge[e] = 5.0
+    >>> shared.SetCaps(network)
+    >>> float(other.edge_caps[0])
+    5.0
+
+    A worker process attaches by name:
+    >>> from concurrent.futures import ProcessPoolExecutor
+    >>> with ProcessPoolExecutor(1) as pool:
+    ...     total = pool.submit(total_length,shared.name).result()
+    >>> round(total,6) == round(sum(network.E_lengths.values()),6)
+    True
+    >>> other.Close()
+    >>> shared.Close()
+    >>> shared.Unlink()
+    """
+
+    # memory is the SharedMemory block
+    def __init__(self,memory):
+        self.memory = memory
+
+        header = np.ndarray((HEADER,),dtype=np.int64,buffer=memory.buf)
+        if header[0] != MAGIC or header[1] != FORMAT:
+            raise ValueError('%s is not a shared graph' % memory.name)
+        (n,m) = (int(header[2]),int(header[3]))
+        self.header = header
+
+        offset = header.nbytes
+        def array(shape,dtype):
+            nonlocal offset
+            a = np.ndarray(shape,dtype=dtype,buffer=memory.buf,offset=offset)
+            offset = offset + a.nbytes
+            return a
+        self.node_ids = array((n,),np.int64)
+        self.coords = array((n,2),np.float64)
+        self.node_caps = array((n,),np.float64)
+        self.edges = array((m,2),np.int64)
+        self.lengths = array((m,),np.float64)
+        self.edge_caps = array((m,),np.float64)
+        self.offsets = array((n + 1,),np.int64)
+
+        # Edges(), made when first asked for
+        self.edge_list = None
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    # The links as (start,end) node ids, in the order of the arrays
+    def Edges(self):
+        if self.edge_list == None:
+            self.edge_list = [tuple(e) for e in self.node_ids[self.edges].tolist()]
+        return self.edge_list
+
+    def Graph(self):
+        graph = Digraph()
+        for v in self.node_ids.tolist():
+            graph.add_vertex(v)
+        for e in self.Edges():
+            graph.add_edge(e)
+        return graph
+
+    # Write network's capacities, whose topology must be the one exported
+    def SetCaps(self,network):
+        nodes = self.node_ids.tolist()
+        self.node_caps[:] = [network.cap_at_node.get(v,0) for v in nodes]
+        self.edge_caps[:] = [network.cap_at_edge.get(e,0) for e in self.Edges()]
+
+    # Stop using the block. The arrays can not be used afterwards.
+    def Close(self):
+        for name in ('header','node_ids','coords','node_caps','edges','lengths','edge_caps','offsets'):
+            setattr(self,name,None)
+        self.memory.close()
+
+    # Free the block, once every process has closed it
+    def Unlink(self):
+        self.memory.unlink()
+
+# Put network in a new block of shared memory. The caller owns the block,
+# and should Close and Unlink it when done.
+def export_graph(network):
+    nodes = sorted(network.graph.vertices())
+    edges = sorted(network.graph.edges())
+    index = {v: i for (i,v) in enumerate(nodes)}
+    (n,m) = (len(nodes),len(edges))
+
+    size = 8 * (HEADER + n + 2 * n + n + 2 * m + m + m + n + 1)
+    memory = SharedMemory(create=True,size=size)
+    header = np.ndarray((HEADER,),dtype=np.int64,buffer=memory.buf)
+    header[:] = 0
+    header[:4] = (MAGIC,FORMAT,n,m)
+
+    shared = SharedGraph(memory)
+    try:
+        shared.node_ids[:] = nodes
+        shared.coords[:] = [network.V_coord[v] for v in nodes] if n else np.zeros((0,2))
+        shared.edges[:] = [(index[a],index[b]) for (a,b) in edges] if m else np.zeros((0,2))
+        shared.lengths[:] = [network.E_lengths.get(e,0) for e in edges]
+        shared.offsets[:] = np.searchsorted(shared.edges[:,0],np.arange(n + 1))
+        shared.SetCaps(network)
+    except:
+        shared.Close()
+        shared.Unlink()
+        raise
+    return shared
+
+# Attach to the block of shared memory called name. Meant for processes
+# started by the one which made the block, which share its resource
+# tracker, so the block is freed once, by its owner.
+def attach_graph(name):
+    return SharedGraph(SharedMemory(name=name))
+
+# Runs in a worker process: the total length of the links of a shared graph
+def total_length(name):
+    shared = attach_graph(name)
+    total = float(shared.lengths.sum())
+    shared.Close()
+    return total
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,320 @@
+# simulation.py
+# The game model without a user interface.
+#
+# Simulation holds the network, the economy and the player's cash, and
+# advances them one turn at a time. Game adds the canvas and dialogs on
+# top; benchmarks and tools can run it headless.
+#
+# All random draws come from the simulation's own generator, seeded when it
+# is made, and all changes by the player go through ApplyAction. Together
+# with an ActionLog this lets a game be replayed exactly.
+
+import copy
+import random
+
+from networkgraph import NetworkGraph
+from routing import RoutingSnapshot,route_parallel
+from profiler import TurnProfiler
+from tracing import tracer
+from debuglog import log
+from debugflags import TURN,CAPACITY,ITEMS
+from events import bus,INVENTORY_CHANGED,CAPACITY_CHANGED
+
+# Rent paid for each node per turn. This amounts to $1000 a month
+NODE_RENT = 1.38
+
+class Simulation():
+    """
+    Tests:
+    >>> from database import CapitalDatabase
+    >>> from economic import Economic
+    >>> from city import City
+    >>> data = CapitalDatabase()
+    >>> sim = Simulation(Economic([City('A',0,0), City('B',200,0)]),cash=1000)
+    >>> a = sim.gameNetwork.NewNode((0,0),'A',[data.GetTower(0)])
+    >>> b = sim.gameNetwork.NewNode((200,0),'B',[data.GetTower(0)])
+    >>> (maintenance,revenue) = sim.Step()
+    >>> sim.turn
+    2
+    >>> maintenance >= 2 * NODE_RENT
+    True
+    >>> round(sim.cash,6) == round(1000 - maintenance + revenue,6)
+    True
+
+    A turn may be split so its traffic is routed on a snapshot, as a
+    RoutingWorker does, with the same result:
+    >>> from benchmark import synthetic_level
+    >>> (one,two) = (synthetic_level(data,30),synthetic_level(data,30))
+    >>> (one.random,two.random) = (random.Random(1),random.Random(1))
+    >>> costs = one.Step()
+    >>> maintenance = two.StartTurn()
+    >>> snapshot = two.SnapshotRouting()
+    >>> two.CommitCapacity(snapshot,snapshot.Route())
+    >>> two.FinishTurn(maintenance) == costs and two.cash == one.cash
+    True
+    """
+
+    # seed seeds the random number generator; a random seed is picked if
+    # it is None.
+    def __init__(self,economy,cash=1000000,network=None,seed=None):
+        if network == None:
+            network = NetworkGraph()
+        if seed == None:
+            seed = random.randrange(2 ** 32)
+
+        self.gameNetwork = network
+        self.economy = economy
+        self.cash = cash
+
+        # Items bought but not yet placed in the network
+        self.inventory = []
+
+        # The (item,place,place name) of each item which failed in the last
+        # turn, where the place is a node or a link
+        self.failures = []
+
+        # The nodes and links whose contents changed since the game was
+        # last saved, and whether links were added or deleted since, so
+        # autosaving writes only those again; see savegame.SaveFile
+        self.changed = set()
+        self.links_changed = False
+
+        # A ParallelRouter finding the turn's paths in a pool of processes,
+        # if they are found that way
+        self.router = None
+
+        self.turn = 1
+
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # The ActionLog recording the game, if there is one
+        self.recorder = None
+
+        # Per phase timings; disabled until asked for
+        self.profiler = TurnProfiler()
+
+    # Record an action whose change has already been made, such as an edit
+    # made in a dialog.
+    def RecordAction(self,action):
+        if action[0] == 'nodeitems' or action[0] == 'linkitems':
+            self.changed.add(action[1][0])
+        if self.recorder:
+            self.recorder.Action(self.turn,action)
+
+    # Carry out a player action on the model. Actions are
+    # [<action string>,[<arguments>]] as in the game's action queue, but
+    # with map coordinates and node ids rather than screen positions:
+    #   ['addnode',[coord,name]]          returns the new node
+    #   ['addlink',[start,end]]
+    #   ['delnode',[node]]                returns the links deleted with it
+    #   ['dellink',[edge]]
+    #   ['subtractcash',[amount]]
+    #   ['inv',items]                     replaces the inventory
+    #   ['nodeitems',[node,items]]        replaces the items at a node
+    #   ['linkitems',[edge,items]]        replaces the items at a link
+    # The action is recorded if the game is being recorded.
+    def ApplyAction(self,action):
+        self.RecordAction(action)
+
+        network = self.gameNetwork
+        args = action[1]
+        if action[0] == 'addnode':
+            node = network.NewNode(args[0],args[1],[])
+            self.changed.add(node)
+            return node
+
+        elif action[0] == 'addlink':
+            network.AddEdgeID(args[0],args[1],[])
+            self.changed.add((args[0],args[1]))
+            self.links_changed = True
+
+        elif action[0] == 'delnode':
+            node = args[0]
+            deleted = []
+            for i in list(network.graph.vertices()):
+                for edge in ((node,i),(i,node)):
+                    if edge in network.E_items:
+                        network.DelLink(edge)
+                        deleted.append(edge)
+            network.DelNode(node)
+            self.changed.add(node)
+            self.changed.update(deleted)
+            self.links_changed = self.links_changed or len(deleted) > 0
+            return deleted
+
+        elif action[0] == 'dellink':
+            network.DelLink(args[0])
+            self.changed.add(args[0])
+            self.links_changed = True
+
+        elif action[0] == 'subtractcash':
+            self.cash = self.cash - args[0]
+
+        elif action[0] == 'inv':
+            self.inventory = copy.deepcopy(args)
+            bus.Publish(INVENTORY_CHANGED,self.inventory)
+
+        elif action[0] == 'nodeitems':
+            network.V_items[args[0]] = copy.deepcopy(args[1])
+
+        elif action[0] == 'linkitems':
+            network.E_items[args[0]] = copy.deepcopy(args[1])
+
+    # Update all of the items at nodes for a turn.
+    # Returns the maintenance cost.
+    def UpdateNodeItems(self):
+        total_maintCost = 0
+        updated = 0
+        for nodeKey in self.gameNetwork.V_items.keys():
+
+            # Pay rent per step.
+            total_maintCost = total_maintCost + NODE_RENT
+
+            # update items in the node build slots
+            for item in self.gameNetwork.V_items[nodeKey]:
+                updated = updated + 1
+                fail = item.Update(self.random)
+                # Record what failed and where, if it did.
+                if fail == True:
+                    self.failures.append((item,nodeKey,self.gameNetwork.V_name[nodeKey]))
+                if item.Operating():
+                    # Record maintennace cost
+                    total_maintCost = total_maintCost + item.GetMaintenance()
+
+                    # Service items that are within node items.
+                    for subitem in item.GetInventory():
+                        updated = updated + 1
+                        fail_subitem = subitem.Update(self.random)
+                        # Record what failed and where, if it did.
+                        if fail_subitem == True:
+                            self.failures.append((subitem,nodeKey,self.gameNetwork.V_name[nodeKey]))
+                        if subitem.Operating():
+                            # Record maintennace cost
+                            total_maintCost = total_maintCost + subitem.GetMaintenance()
+
+        tracer.Count('items updated',ITEMS,updated)
+        return total_maintCost
+
+    # Update items at edges. Returns the maintenance cost.
+    def UpdateEdgeItems(self):
+        total_maintCost = 0
+        updated = 0
+        for edgekey in self.gameNetwork.E_items.keys():
+            updated = updated + len(self.gameNetwork.E_items[edgekey])
+            for item in self.gameNetwork.E_items[edgekey]:
+                fail = item.Update(self.random)
+                # Record what failed and where, if it did.
+                if fail == True:
+                    V_name = self.gameNetwork.V_name
+                    self.failures.append((item,edgekey,V_name[edgekey[0]] + ' to ' + V_name[edgekey[1]]))
+                else:
+                    # Record maintennace cost
+                    total_maintCost = total_maintCost + item.GetMaintenance()
+
+        tracer.Count('items updated',ITEMS,updated)
+        return total_maintCost
+
+    # Route traffic between the cities and record the supply each one gets
+    def UpdateCapacity(self):
+        # Reset the capacity calculations from last time
+        with tracer.Span('CapReset',CAPACITY):
+            self.gameNetwork.CapReset()
+        self.profiler.Mark('CapReset')
+
+        if self.router != None:
+            cities = self.economy.GetCities()
+            with tracer.Span('parallel routing',CAPACITY):
+                supplies = route_parallel(self.gameNetwork,[(city.GetCoord(),city.range) for city in cities],self.router)
+            for (city,supply) in zip(cities,supplies):
+                city.SetSupply(supply)
+                log.Log(CAPACITY,'%s: %s',city.GetName(),supply)
+            self.profiler.Mark('CapAtCoord')
+            return
+
+        for city in self.economy.GetCities():
+            # This function needs the above reset because it calculates network bottlenecks based on current capacities
+            # caused by traffic created by other cities.
+            with tracer.Span('CapAtCoord',CAPACITY,{'city': city.GetName()}):
+                city.SetSupply(self.gameNetwork.CapAtCoord(city.GetCoord(),self.economy.GetCitiesCoord(),city.range))
+            log.Log(CAPACITY,'%s: %s',city.GetName(),city.GetSupply())
+        self.profiler.Mark('CapAtCoord')
+
+    # Copy what UpdateCapacity reads, so the turn's traffic can be routed
+    # away from the network, e.g. by a RoutingWorker
+    def SnapshotRouting(self):
+        return RoutingSnapshot(self.gameNetwork,self.economy.GetCities(),self.router)
+
+    # Put the result of routing a RoutingSnapshot into the network and the
+    # cities, as UpdateCapacity would have
+    def CommitCapacity(self,snapshot,supplies):
+        self.gameNetwork.cap_at_node = snapshot.cap_at_node
+        self.gameNetwork.cap_at_edge = snapshot.cap_at_edge
+        for (city,supply) in zip(self.economy.GetCities(),supplies):
+            city.SetSupply(supply)
+            log.Log(CAPACITY,'%s: %s',city.GetName(),supply)
+        self.profiler.Mark('commit')
+
+    # The first part of a turn: update the items at nodes and links.
+    # Returns the maintenance cost.
+    def StartTurn(self):
+        self.failures = []
+        with tracer.Span('node items',ITEMS):
+            total_maintCost = self.UpdateNodeItems()
+        self.profiler.Mark('node items')
+        with tracer.Span('edge items',ITEMS):
+            total_maintCost = total_maintCost + self.UpdateEdgeItems()
+        self.profiler.Mark('edge items')
+
+        # Failed items are saved again
+        for (item,place,name) in self.failures:
+            self.changed.add(place)
+        return total_maintCost
+
+    # The last part of a turn, once the capacities are known: the revenue,
+    # the economy and the cash. Returns the (maintenance cost, revenue).
+    def FinishTurn(self,total_maintCost):
+        # Update how much money to make per turn, using the level's economic model
+        with tracer.Span('revenue',TURN):
+            revenue = self.economy.Revenue()
+        self.profiler.Mark('revenue')
+
+        # Cache the capacity calculations so the data can be displayed on node displays.
+        self.gameNetwork.CapCache()
+        bus.Publish(CAPACITY_CHANGED,self.gameNetwork)
+        self.profiler.Mark('CapCache')
+
+        # Update the economy
+        with tracer.Span('economy',TURN):
+            self.economy.Update(self.turn,self.random)
+        self.profiler.Mark('economy')
+
+        # Update game parameters
+        self.cash = self.cash - total_maintCost + revenue
+
+        # A turn corresponds to one hour, just to check
+        self.turn = self.turn + 1
+        return (total_maintCost,revenue)
+
+    # Record a finished turn
+    def EndTurn(self,turn):
+        if self.recorder:
+            self.recorder.Turn(turn,self.cash,[city.GetSupply() for city in self.economy.GetCities()])
+
+        # One sample of the counters per turn
+        tracer.Sample()
+
+    # Advance the network and the economy by one turn.
+    # Returns the (maintenance cost, revenue) of the turn.
+    def Step(self):
+        turn = self.turn
+        with tracer.Span('turn',TURN,{'turn': turn}):
+            total_maintCost = self.StartTurn()
+            self.UpdateCapacity()
+            costs = self.FinishTurn(total_maintCost)
+        self.EndTurn(turn)
+        return costs
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
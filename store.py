@@ -5,11 +5,9 @@ import copy
 
 from capital import *
 from database import *
+from events import bus,INVENTORY_CHANGED
 import game
 
-global refresh_flag
-refresh_flag = False
-
 class Store():
     def __init__(self,parent,inventory,database):
         self.inventory = inventory
@@ -85,7 +83,7 @@ class Store():
                                      command=self.itemselector.yview)
         self.itemselector.configure(yscrollcommand=self.item_scroll.set)
         self.item_scroll.pack(side='right',fill='both')
-        self.refresh_descrip_sel()
+        self.itemselector.bind('<<ListboxSelect>>', lambda ev: self.refresh_descrip_sel())
 
         self.inv_select = Listbox(self.sideframe,height=20,width=40,selectmode=BROWSE)
         self.inv_select.pack(side='left',padx=1,pady=10)
@@ -93,7 +91,7 @@ class Store():
                                      command=self.inv_select.yview)
         self.inv_select.configure(yscrollcommand=self.inv_scroll.set)
         self.inv_scroll.pack(side='right',fill='both')
-        self.refresh_descrip_inv()
+        self.inv_select.bind('<<ListboxSelect>>', lambda ev: self.refresh_descrip_inv())
         self.refresh_inv()
 
         # Action buttons
@@ -115,8 +113,8 @@ class Store():
         self.v.trace("w", lambda name, index, mode: self.refresh_catlist())
         self.refresh_catlist()
 
-        # Standby
-        self.standby()
+        # Show the inventory again whenever it changes
+        bus.SubscribeWindow(self.root,INVENTORY_CHANGED,self.inventory_changed)
 
     def refresh_catlist(self):
         self.itemselector.delete(0, END)
@@ -179,8 +177,6 @@ class Store():
                 item = self.database.GetRouter(sel)
                 self.sel_item = item
                 self.des.set(item.GetInfo())
-                
-        self.itemselector.after(250,self.refresh_descrip_sel)
 
     def refresh_descrip_inv(self):
         if self.inv_select.curselection():
@@ -188,8 +184,6 @@ class Store():
             item = self.inventory[self.inv_sel]
             self.des.set(item.GetInfo())
 
-        self.inv_select.after(200,self.refresh_descrip_inv)
-        
     def do_add(self):
         if self.sel_item:
             self.inventory.append(copy.deepcopy(self.sel_item))
@@ -221,14 +215,11 @@ class Store():
     def close(self):
         self.root.destroy()
 
-    # This method is called when the window idles.
-    def standby(self):
-        global refresh_flag
-        if refresh_flag:
-            self.refresh_inv()
-            refresh_flag = False
-            
-        self.root.after(500,self.standby)
+    # The game's inventory was replaced
+    def inventory_changed(self,inventory):
+        self.inventory = copy.copy(inventory)
+        self.refresh_inv()
+
         
         
 
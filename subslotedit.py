@@ -6,11 +6,9 @@ import copy
 
 from capital import *
 from networkgraph import *
+from events import bus,INVENTORY_CHANGED,NODE_CHANGED,CAPACITY_CHANGED
 import game
 
-global refresh_flag
-refresh_flag = False
-
 class EditSubslot():
     def __init__(self,parent,inventory,node,gamenetwork,item_index):
         self.inventory = inventory
@@ -57,7 +55,7 @@ class EditSubslot():
                                justify=LEFT)
         self.inv_title.pack(side='top',anchor='w',fill='x')
         self.inv_list = Listbox(self.sideFrame,height=30,width=60,selectmode='ExTENDED')
-        self.inv_list.bind('<ButtonPress-1>', lambda x: self.get_maint())
+        self.inv_list.bind('<<ListboxSelect>>', lambda x: self.select())
         self.inv_list.pack(side='left',padx=0,pady=10,fill='x')
         self.inv_scroll = Scrollbar(self.sideFrame,orient=VERTICAL,
                                      command=self.inv_list.yview,width=20)
@@ -118,7 +116,7 @@ class EditSubslot():
 
         self.slots_list = Listbox(self.sideFrame2,height=15,width=40,selectmode='ExTENDED')
         self.slots_list.pack(side='top',padx=20,pady=10)
-        self.slots_list.bind('<ButtonPress-1>', lambda x: self.get_maint())
+        self.slots_list.bind('<<ListboxSelect>>', lambda x: self.select())
         
         # Buttons
         self.button_add = Button(self.sideFrame2,
@@ -137,11 +135,15 @@ class EditSubslot():
         self.button_close.pack(side='top',fill='x')
 
 
-        # Standby
-        self.refresh_des()
+        self.refresh_cap()
         self.refresh_item()
         self.do_item_change()
 
+        # Refresh when the inventory, the node or its capacity change
+        bus.SubscribeWindow(self.root,INVENTORY_CHANGED,self.inventory_changed)
+        bus.SubscribeWindow(self.root,NODE_CHANGED,self.node_changed)
+        bus.SubscribeWindow(self.root,CAPACITY_CHANGED,self.capacity_changed)
+
     # Close the window
     def close(self):
         self.root.destroy()
@@ -178,10 +180,41 @@ class EditSubslot():
             self.sel_item = self.item.GetInventory()[self.sel]
             self.des.set(self.sel_item.GetInfo())
 
+    def refresh_cap(self):
         self.cap.set('Maximum capacity available at Node: %0.2f' % (self.network.MaxCapAtNode(self.node) / 1000000) + ' Mbit/s')
-        self.capset.set('Current Used capacity available at node: %0.2f' % (self.network.cap_at_node_cached[self.node] / 1000000) + ' Mbit/s')    
+        self.capset.set('Current Used capacity available at node: %0.2f' % (self.network.cap_at_node_cached.get(self.node,0) / 1000000) + ' Mbit/s')
+
+    # An item was selected in one of the lists
+    def select(self):
+        self.refresh_des()
+        self.get_maint()
+
+    # The game's inventory was replaced
+    def inventory_changed(self,inventory):
+        self.inventory = copy.copy(inventory)
+        self.refresh_inv()
+
+    # Another window changed the items at a node. Its items may have been
+    # added or removed, so the item selector is filled again.
+    def node_changed(self,network,node):
+        if network is not self.network or node != self.node or not network.V_items[node]:
+            return
+        selectable = [item.GetName() for item in network.V_items[node]]
+        index = self.item_combobox.current()
+        if index < 0 or index >= len(selectable):
+            index = 0
+        self.item_combobox.configure(values = selectable)
+        self.item_sel.set(selectable[index])
+        self.do_item_change()
+        self.refresh_cap()
 
-        self.root.after(200,self.refresh_des)
+    # Capacities were computed for a turn. Nodes deleted since the window
+    # was opened are skipped. The selected item's description is shown
+    # again, as its age and state change every turn.
+    def capacity_changed(self,network):
+        if network is self.network and self.node in network.V_items:
+            self.refresh_cap()
+            self.select()
 
     def do_item_change(self):
         self.item = self.network.V_items[self.node][self.item_combobox.current()]
@@ -202,6 +235,7 @@ class EditSubslot():
                         self.inventory.pop(self.sel)
                         self.do_item_change()
                         game.action_q.append(['inv',copy.deepcopy(self.inventory)])
+                        game.node_changed(self.network,self.node)
                     else:
                         # Not so successful. Must be full.
                         messagebox.showwarning('Warning',
@@ -219,10 +253,12 @@ class EditSubslot():
             self.inventory.append(copy.deepcopy(item_toremove))
             self.do_item_change()
             game.action_q.append(['inv',copy.deepcopy(self.inventory)])
+            game.node_changed(self.network,self.node)
 
     def new_maint(self):
         # Check which item is selected
             self.sel_item.SetMaintenance(float(self.budget.get()) / 24 / 7)
+            game.node_changed(self.network,self.node)
             self.get_maint()
 
     def get_maint(self):
@@ -0,0 +1,233 @@
+# tiles.py
+# Draws the map background from tiles, loading only the ones in view.
+#
+# A tile set is a directory holding the background at each zoom level,
+# cut into square tiles:
+#
+#     tiles.txt          tile,<size> and a level,scale,width,height row
+#                        per zoom level
+#     <level>/<col>_<row>.gif
+#
+# Tiles are decoded when they first come into view and kept in a least
+# recently used cache, so moving around the map or changing zoom only
+# decodes the tiles which are shown. Make a tile set from a level's
+# background images with:
+#
+#     python tiles.py levels/level1.lvl images/levels/alberta
+
+import argparse
+import csv
+import os
+from collections import OrderedDict
+from tkinter import *
+
+from image import images
+
+TILE_SIZE = 256
+
+# Decoded tiles kept when they go out of view
+CACHE_TILES = 96
+
+# Extra distance around the view in which tiles are drawn, in pixels, so
+# small moves do not show gaps.
+MARGIN = 128
+
+class LRUCache():
+    """
+    Tests:
+    >>> cache = LRUCache(2)
+    >>> loads = []
+    >>> def load(key):
+    ...     loads.append(key)
+    ...     return key.upper()
+    >>> cache.Get('a',load), cache.Get('b',load), cache.Get('a',load)
+    ('A', 'B', 'A')
+    >>> cache.Get('c',load)
+    'C'
+    >>> 'b' in cache, 'a' in cache
+    (False, True)
+    >>> loads
+    ['a', 'b', 'c']
+    """
+
+    def __init__(self,capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+
+    def __contains__(self,key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    # The value for key, made with load(key) if it is not cached. The
+    # least recently used values are dropped beyond the capacity.
+    def Get(self,key,load):
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
+        value = load(key)
+        self.items[key] = value
+        if len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+        return value
+
+    def Clear(self):
+        self.items.clear()
+
+class TileSet():
+    """
+    Tests:
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> with open(os.path.join(directory,'tiles.txt'),'w') as outFile:
+    ...     n = outFile.write('tile,256\\n0,0.5,1000,600\\n1,1.0,2000,1200\\n')
+    >>> tiles = TileSet(directory)
+    >>> tiles.Grid(0)
+    (4, 3)
+
+    The tiles in view, with the margin:
+    >>> tiles.InView(1,300,300,700,500,margin=0)
+    [(1, 1), (2, 1)]
+    >>> os.path.basename(tiles.Path(1,2,1))
+    '2_1.gif'
+    """
+
+    def __init__(self,directory):
+        self.directory = directory
+        self.tile = TILE_SIZE
+        # (scale,width,height) of each zoom level
+        self.levels = {}
+        with open(os.path.join(directory,'tiles.txt'),newline='') as inFile:
+            for row in csv.reader(inFile):
+                if not row or row[0].startswith('#'):
+                    continue
+                if row[0] == 'tile':
+                    self.tile = int(row[1])
+                else:
+                    self.levels[int(row[0])] = (float(row[1]),int(row[2]),int(row[3]))
+
+    # The number of (columns,rows) of tiles at a level
+    def Grid(self,level):
+        (scale,width,height) = self.levels[level]
+        return (-(-width // self.tile),-(-height // self.tile))
+
+    def Path(self,level,col,row):
+        return os.path.join(self.directory,str(level),'%d_%d.gif' % (col,row))
+
+    # The (col,row) of the tiles of a level overlapping the area
+    # x0,y0 to x1,y1 grown by margin.
+    def InView(self,level,x0,y0,x1,y1,margin=MARGIN):
+        (cols,rows) = self.Grid(level)
+        c0 = max(0,int((x0 - margin) // self.tile))
+        r0 = max(0,int((y0 - margin) // self.tile))
+        c1 = min(cols - 1,int((x1 + margin) // self.tile))
+        r1 = min(rows - 1,int((y1 + margin) // self.tile))
+        return [(c,r) for r in range(r0,r1 + 1) for c in range(c0,c1 + 1)]
+
+# Visible area of a canvas, in canvas coordinates
+def canvas_view(canvas):
+    x0 = canvas.canvasx(0)
+    y0 = canvas.canvasy(0)
+    return (x0,y0,x0 + canvas.winfo_width(),y0 + canvas.winfo_height())
+
+class TiledBackground():
+    def __init__(self,canvas,tileset,cache_tiles=CACHE_TILES):
+        self.canvas = canvas
+        self.tileset = tileset
+        self.cache = LRUCache(cache_tiles)
+        self.level = max(tileset.levels)
+        # Canvas image items by (col,row)
+        self.shown = {}
+
+    def _Load(self,key):
+        return PhotoImage(file=self.tileset.Path(*key))
+
+    # Change the zoom level. The tiles of the old level are all removed.
+    def SetLevel(self,level):
+        for item in self.shown.values():
+            self.canvas.delete(item)
+        self.shown = {}
+        self.level = level
+        self.Update()
+
+    # Draw the tiles which came into view and remove those which left it
+    def Update(self):
+        tile = self.tileset.tile
+        wanted = set(self.tileset.InView(self.level,*canvas_view(self.canvas)))
+
+        for key in list(self.shown):
+            if key not in wanted:
+                self.canvas.delete(self.shown.pop(key))
+
+        for key in wanted:
+            if key in self.shown:
+                continue
+            image = self.cache.Get((self.level,) + key,self._Load)
+            self.shown[key] = self.canvas.create_image(key[0] * tile,key[1] * tile,
+                                 image=image,anchor='nw',tags=('background',))
+        self.canvas.tag_lower('background')
+
+# A background of one image per zoom level, for levels without a tile set.
+# Only the image of the current level is loaded. The images are too big to
+# keep in the shared image cache: the last level's image is let go, and
+# freed by Tk, when the level changes.
+class ImageBackground():
+    def __init__(self,canvas,paths):
+        self.canvas = canvas
+        self.paths = paths
+        self.level = len(paths) - 1
+        self.item = None
+        self.image = None
+
+    def SetLevel(self,level):
+        if self.item:
+            self.canvas.delete(self.item)
+        self.image = None
+        self.level = level
+        self.image = PhotoImage(file=self.paths[level])
+        self.item = self.canvas.create_image(0,0,
+                image=self.image,
+                anchor='nw',tags=('background',))
+        self.canvas.tag_lower(self.item)
+
+    def Update(self):
+        if self.item == None:
+            self.SetLevel(self.level)
+
+# Cut each zoom level's background image into tiles. scales are the zoom
+# of each image. Needs Tk, so it must be run with a display.
+def make_tiles(paths,scales,directory,tile=TILE_SIZE):
+    root = Tk()
+    root.withdraw()
+    os.makedirs(directory,exist_ok=True)
+    with open(os.path.join(directory,'tiles.txt'),'w') as manifest:
+        manifest.write('tile,%d\n# level,scale,width,height\n' % tile)
+        for (level,(path,scale)) in enumerate(zip(paths,scales)):
+            image = PhotoImage(file=path)
+            (width,height) = (image.width(),image.height())
+            manifest.write('%d,%s,%d,%d\n' % (level,scale,width,height))
+            os.makedirs(os.path.join(directory,str(level)),exist_ok=True)
+            for y in range(0,height,tile):
+                for x in range(0,width,tile):
+                    piece = PhotoImage()
+                    piece.tk.call(piece,'copy',image,'-from',x,y,min(x + tile,width),min(y + tile,height))
+                    piece.write(os.path.join(directory,str(level),'%d_%d.gif' % (x // tile,y // tile)),format='gif')
+    root.destroy()
+
+def main():
+    from level import load_level
+    from agentsim import ZOOM_SCALES
+
+    parser = argparse.ArgumentParser(description="Cut a level's background images into tiles.")
+    parser.add_argument('level',help='level file')
+    parser.add_argument('directory',help='directory for the tile set')
+    parser.add_argument('--tile',type=int,default=TILE_SIZE,help='tile size in pixels')
+    args = parser.parse_args()
+
+    level = load_level(args.level)
+    make_tiles(level.backgrounds,ZOOM_SCALES,args.directory,args.tile)
+
+# Run the doctests with: python -m doctest tiles.py
+if __name__ == "__main__":
+    main()
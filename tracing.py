@@ -0,0 +1,126 @@
+# tracing.py
+# Records a timeline of nested spans and counters.
+#
+# Spans and counters belong to a debug category and are only recorded
+# while that category's bit is set in the debug flag, so a disabled span
+# costs one bit test. The trace is saved in the Chrome trace event format,
+# which chrome://tracing and ui.perfetto.dev can open.
+#
+#     with tracer.Span('CapAtCoord',CAPACITY,{'city': name}):
+#         ...
+#     tracer.Count('paths computed',CAPACITY)
+
+import json
+import os
+import threading
+from time import perf_counter
+
+from debugflags import *
+
+# Stands in for a span whose category is disabled
+class NullSpan():
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span():
+    def __init__(self,tracer,name,category,args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self,*exc):
+        end = perf_counter()
+        self.tracer.Complete(self.name,self.category,self.start,end,self.args)
+        return False
+
+class Tracer():
+    """
+    Tests:
+    >>> flag = BitFlag()
+    >>> t = Tracer(flag)
+    >>> with t.Span('turn',TURN):
+    ...     t.Count('paths computed',CAPACITY)
+    >>> t.events
+    []
+
+    >>> old = flag.set(TURN | CAPACITY)
+    >>> with t.Span('turn',TURN):
+    ...     with t.Span('CapAtCoord',CAPACITY,{'city': 'Calgary'}):
+    ...         t.Count('paths computed',CAPACITY,3)
+    ...     t.Sample()
+    >>> [(e['name'],e['ph']) for e in t.events]
+    [('CapAtCoord', 'X'), ('paths computed', 'C'), ('turn', 'X')]
+    >>> t.events[0]['args'], t.events[1]['args']
+    ({'city': 'Calgary'}, {'paths computed': 3})
+    """
+
+    def __init__(self,flag=debug):
+        self.flag = flag
+        self.events = []
+        # Counter totals since the last sample
+        self.counters = {}
+        self.pid = os.getpid()
+        self._t0 = perf_counter()
+
+    # Is the category being traced?
+    def Enabled(self,category):
+        return self.flag._flag & category
+
+    # A context manager timing a block of code
+    def Span(self,name,category,args=None):
+        if not self.flag._flag & category:
+            return NULL_SPAN
+        return Span(self,name,category,args)
+
+    # Record a span which ran from start to end (perf_counter seconds)
+    def Complete(self,name,category,start,end,args=None):
+        event = {'name': name,
+                 'cat': CATEGORIES.get(category,str(category)),
+                 'ph': 'X',
+                 'ts': (start - self._t0) * 1000000,
+                 'dur': (end - start) * 1000000,
+                 'pid': self.pid,
+                 'tid': threading.get_ident()}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    # Add to a counter
+    def Count(self,name,category,value=1):
+        if not self.flag._flag & category:
+            return
+        self.counters[name] = self.counters.get(name,0) + value
+
+    # Record the counters as counter events, and start counting again
+    def Sample(self):
+        ts = (perf_counter() - self._t0) * 1000000
+        for (name,value) in self.counters.items():
+            self.events.append({'name': name,'ph': 'C','ts': ts,'pid': self.pid,
+                                'args': {name: value}})
+        self.counters = {}
+
+    def Clear(self):
+        self.events = []
+        self.counters = {}
+
+    # Write the trace as Chrome trace event JSON
+    def Save(self,filename):
+        with open(filename,'w') as outFile:
+            json.dump({'traceEvents': self.events,'displayTimeUnit': 'ms'},outFile)
+
+# The tracer used by the game, gated by the global debug flag
+tracer = Tracer()
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()